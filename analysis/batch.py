@@ -0,0 +1,217 @@
+# analysis/batch.py
+"""
+Fit a whole folder of run CSVs and collect the results in one table:
+
+    python -m analysis.batch *.csv --out summary.csv
+    python -m analysis.batch data/ --jobs 4
+
+Older CSVs carry their parameters only in the file name
+(PODMR_2820-2920_points-31_power-20_Tref-5ms_pulse-25us_loop-1_current-100mA.csv);
+parse_filename() turns those names into a metadata dict. Files are fitted in a process
+pool. Results are cached by file content hash and modification time (analysis_cache.json),
+so a re-run only fits new or changed files.
+"""
+import argparse
+import csv
+import glob
+import hashlib
+import json
+import os
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from analysis.fit import fit_result, X_KEYS
+
+CACHE_FILE = "analysis_cache.json"
+CACHE_VERSION = 2      # bump when the models or the fit change, to refit everything
+
+# file name prefix -> registry name
+PREFIXES = {"podmr": "podmr", "odmr": "podmr", "rabi": "rabi", "ramsey": "ramsey", "hahn": "hahn", "t1": "t1"}
+
+# the parameter each summary line leads with
+KEY_PARAMS = {"podmr": "f0", "rabi": "f", "ramsey": "T2star", "t1": "T1", "hahn": "T2"}
+
+# name aliases in file names
+ALIASES = {"pts": "points", "loop": "loops", "taumax": "tau"}
+
+_NAMED = re.compile(r"^([A-Za-z]+?)-?(\d+(?:\.\d+)?)([A-Za-z]*)$")    # points-31, Tref5ms, tau-4ms
+_VALUE = re.compile(r"^(\d+(?:\.\d+)?)([A-Za-z]+)$")                  # 0dBm, 20pts, 100us
+_RANGE = re.compile(r"^(\d+(?:\.\d+)?)-(\d+(?:\.\d+)?)$")             # 2820-2920
+_UNITS = ("ms", "us", "ns", "s", "mA", "A", "MHz", "GHz", "Hz", "dBm", "V")
+
+
+def parse_filename(path):
+    """Metadata from a run CSV name, e.g. {'experiment': 'podmr', 'f_start_MHz': 2820.0, ...}."""
+    stem = os.path.splitext(os.path.basename(path))[0]
+    meta = {}
+    tokens = stem.replace("-", "_", 1).split("_") if stem.lower().startswith("t1-") else stem.split("_")
+    if tokens and tokens[0].lower() in PREFIXES:
+        meta["experiment"] = PREFIXES[tokens[0].lower()]
+        tokens = tokens[1:]
+    for tok in tokens:
+        if not tok:
+            continue
+        m = _RANGE.match(tok)
+        if m:
+            lo, hi = float(m.group(1)), float(m.group(2))
+            if lo > 100 and hi < 10:
+                hi *= 1000  # stop typed in GHz ("2850-2.890")
+            meta["f_start_MHz"], meta["f_stop_MHz"] = lo, hi
+            continue
+        m = _NAMED.match(tok)
+        if m:
+            key, value, unit = m.group(1), float(m.group(2)), m.group(3)
+            key = key if len(key) == 1 else ALIASES.get(key.lower(), key.lower())  # keep N
+            meta[f"{key}_{unit}" if unit else key] = value
+            continue
+        m = _VALUE.match(tok)
+        if m:
+            value, word = float(m.group(1)), m.group(2)
+            if word in _UNITS:
+                # a bare number with a unit: a frequency or a power, otherwise unnamed
+                name = {"MHz": "f", "GHz": "f", "Hz": "f", "dBm": "power"}.get(word, "value")
+                meta[f"{name}_{word}"] = value
+            else:
+                meta[ALIASES.get(word.lower(), word.lower())] = value
+            continue
+        try:
+            # a lone number after the prefix: the MW frequency in MHz (rabi_2869_...)
+            meta["f_MHz"] = float(tok)
+        except ValueError:
+            meta[tok.lower()] = True  # flags such as 'backwards'
+    return meta
+
+
+def read_csv(path):
+    """{column: array} of a numeric CSV with a header row."""
+    with open(path, newline="") as f:
+        rows = list(csv.reader(f))
+    header, body = rows[0], [r for r in rows[1:] if r]
+    return {k: np.array([float(r[i]) for r in body]) for i, k in enumerate(header)}
+
+
+def file_key(path):
+    """(sha1 of the content, mtime, size): cache key of a file."""
+    st = os.stat(path)
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest(), st.st_mtime, st.st_size
+
+
+def analyse_file(path):
+    """One summary row: file name, parsed metadata, fit parameters with errors (or the error)."""
+    meta = parse_filename(path)
+    row = {"file": os.path.basename(path), **meta}
+    try:
+        cols = read_csv(path)
+        # no prefix: ODMR and T1 files are told apart by their x column
+        row["experiment"] = meta.get("experiment") or X_KEYS.get(list(cols)[0])
+        if row["experiment"] is None:
+            raise ValueError(f"{list(cols)[0]} data: prefix the file name with rabi_, ramsey_ or hahn_")
+        row.update(fit_result(cols, row["experiment"]).as_dict())
+    except Exception as e:
+        row["error"] = f"{type(e).__name__}: {e}"
+    return row
+
+
+def load_cache(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        cache = json.load(f)
+    return cache["files"] if cache.get("version") == CACHE_VERSION else {}
+
+
+def save_cache(path, files):
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump({"version": CACHE_VERSION, "files": files}, f, indent=1)
+    os.replace(tmp, path)
+
+
+def analyse(paths, cache_path=CACHE_FILE, jobs=None, emit=print):
+    """Fit every file (cached ones are reused); returns the summary rows in `paths` order."""
+    cache = load_cache(cache_path) if cache_path else {}
+    rows, todo = {}, []
+    for path in paths:
+        entry = cache.get(os.path.abspath(path))
+        st = os.stat(path)
+        if entry and entry["mtime"] == st.st_mtime and entry["size"] == st.st_size:
+            rows[path] = entry["row"]
+            continue
+        sha, mtime, size = file_key(path)
+        if entry and entry["sha1"] == sha:
+            # touched but unchanged
+            entry.update(mtime=mtime, size=size)
+            rows[path] = entry["row"]
+            continue
+        todo.append((path, sha, mtime, size))
+    emit(f"{len(paths)} files, {len(paths) - len(todo)} cached, fitting {len(todo)}")
+    files = [t[0] for t in todo]
+    if jobs == 1 or len(files) < 2:
+        fitted = [analyse_file(p) for p in files]
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            fitted = list(pool.map(analyse_file, files))
+    for (path, sha, mtime, size), row in zip(todo, fitted):
+        rows[path] = row
+        cache[os.path.abspath(path)] = dict(sha1=sha, mtime=mtime, size=size, row=row)
+    if cache_path:
+        save_cache(cache_path, cache)
+    return [rows[p] for p in paths]
+
+
+def write_summary(path, rows):
+    """All rows in one CSV; columns are the union over the rows, file and experiment first."""
+    keys = ["file", "experiment"]
+    for row in rows:
+        keys += [k for k in row if k not in keys]
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=keys)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def _expand(args):
+    paths = []
+    for a in args:
+        if os.path.isdir(a):
+            paths += sorted(glob.glob(os.path.join(a, "*.csv")))
+        else:
+            paths += sorted(glob.glob(a)) or [a]
+    return list(dict.fromkeys(p for p in paths if os.path.isfile(p)))
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(prog="python -m analysis.batch", description="Fit a folder of run CSVs into one summary table.")
+    ap.add_argument("paths", nargs="+", help="CSV files, globs or folders")
+    ap.add_argument("--out", default="summary.csv", help="summary table (CSV)")
+    ap.add_argument("--cache", default=CACHE_FILE, help="result cache (JSON); '' to disable")
+    ap.add_argument("--jobs", type=int, default=None, help="worker processes (default: one per CPU)")
+    args = ap.parse_args(argv)
+
+    # the summary itself may sit among the inputs
+    paths = [p for p in _expand(args.paths) if os.path.abspath(p) != os.path.abspath(args.out)]
+    rows = analyse(paths, cache_path=args.cache, jobs=args.jobs)
+    write_summary(args.out, rows)
+    for row in rows:
+        exp = row.get("experiment") or "?"
+        key = KEY_PARAMS.get(exp)
+        if "error" in row:
+            result = row["error"]
+        elif key in row:
+            result = f"{key} = {row[key]:.6g} ± {row[key + '_err']:.2g}"
+        else:
+            result = ""
+        print(f"{exp:<7} {row['file'][:60]:<60} {result}")
+    print(f"Summary written to {args.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
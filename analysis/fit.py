@@ -0,0 +1,170 @@
+# analysis/fit.py
+"""
+Least-squares fits of the models in analysis.models, straight from run() results:
+
+    from analysis.fit import fit_result
+    fr = fit_result(rabi_experiment.run(...), "rabi")
+    print(fr)                 # f = 0.6541 ± 0.0036, T_decay = ...
+    fr["f"], fr.err("f")
+
+scipy.optimize.least_squares does the work when scipy is installed; otherwise a small
+Levenberg-Marquardt loop in NumPy. Both use the models' analytic Jacobians. With error
+bars (R_err_V) the fit is weighted and the parameter errors are absolute; without them
+the covariance is scaled by the residual variance.
+"""
+import numpy as np
+
+from analysis.models import MODELS
+
+try:
+    from scipy.optimize import least_squares
+except ImportError:  # fall back to the NumPy fitter
+    least_squares = None
+
+# result x key -> registry name, where the key alone decides it
+X_KEYS = {"freq_Hz": "podmr", "tau_s": "t1"}
+
+
+class Fit:
+    """Best-fit parameters of `model` with their covariance."""
+
+    def __init__(self, model, q, cov, x, y, sigma):
+        self.model = model
+        self.q = np.asarray(q, dtype=float)
+        self.cov = cov
+        self.x, self.y, self.sigma = x, y, sigma
+        r = (y - model(x, self.q)) / (sigma if sigma is not None else 1.0)
+        self.dof = max(1, len(x) - len(self.q))
+        self.chi2_red = float(r @ r / self.dof)
+
+    @property
+    def params(self):
+        return dict(zip(self.model.params, self.q.tolist()))
+
+    @property
+    def errors(self):
+        return dict(zip(self.model.params, np.sqrt(np.diag(self.cov)).tolist()))
+
+    def __getitem__(self, name):
+        return self.params[name]
+
+    def err(self, name):
+        return self.errors[name]
+
+    def curve(self, x):
+        return self.model(np.asarray(x, dtype=float), self.q)
+
+    def as_dict(self):
+        """Flat {name: value, name_err: error, ...} row, e.g. for a summary table."""
+        row = {}
+        for k, v in self.params.items():
+            row[k] = v
+            row[k + "_err"] = self.errors[k]
+        row["chi2_red"] = self.chi2_red
+        row["n_points"] = len(self.x)
+        return row
+
+    def __str__(self):
+        return ", ".join(f"{k} = {v:.4g} ± {self.errors[k]:.2g}" for k, v in self.params.items())
+
+
+def fit(model, x, y, sigma=None, p0=None):
+    """Fit model to (x, y); sigma are 1-sd errors of y (None: unweighted). Raises RuntimeError."""
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    ok = np.isfinite(x) & np.isfinite(y)
+    if sigma is not None:
+        sigma = np.asarray(sigma, dtype=float)
+        ok &= np.isfinite(sigma) & (sigma > 0)
+        sigma = sigma[ok]
+    x, y = x[ok], y[ok]
+    q0 = np.asarray(model.guess(x, y) if p0 is None else p0, dtype=float)
+    lo, hi = model.bounds()
+    # start strictly inside the bounds
+    q0 = np.clip(q0, np.where(np.isfinite(lo), lo + 1e-12 * np.maximum(1.0, np.abs(q0)), lo), hi)
+    if len(x) <= len(q0):
+        raise RuntimeError(f"{len(x)} points cannot fix {len(q0)} parameters")
+    w = 1.0 / sigma if sigma is not None else np.ones_like(x)
+
+    def residuals(q):
+        return (model(x, q) - y) * w
+
+    def jac(q):
+        return model.jac(x, q) * w[:, None]
+
+    with np.errstate(all="ignore"):  # trial steps may overflow; they are rejected
+        if least_squares is not None:
+            sol = least_squares(residuals, q0, jac=jac, bounds=(lo, hi), method="trf", x_scale="jac")
+            if not sol.success:
+                raise RuntimeError(f"Fit did not converge: {sol.message}")
+            q = sol.x
+        else:
+            q = _levenberg_marquardt(residuals, jac, q0, lo, hi)
+        J = jac(q)
+        r = residuals(q)
+        try:
+            cov = np.linalg.inv(J.T @ J)
+        except np.linalg.LinAlgError:
+            raise RuntimeError("Fit is degenerate (singular Jacobian)") from None
+    if sigma is None:
+        cov = cov * (r @ r) / (len(x) - len(q))
+    if not np.all(np.isfinite(q)) or not np.all(np.isfinite(cov)) or np.any(np.diag(cov) <= 0):
+        raise RuntimeError("Fit did not converge")
+    return Fit(model, q, cov, x, y, sigma)
+
+
+def _levenberg_marquardt(residuals, jac, q0, lo, hi, iterations=200):
+    q = q0.copy()
+    lam = 1e-3
+    r = residuals(q)
+    cost = r @ r
+    for _ in range(iterations):
+        J = jac(q)
+        A = J.T @ J
+        g = J.T @ r
+        try:
+            # Marquardt scaling makes the step independent of the parameter units
+            step = np.linalg.solve(A + lam * np.diag(np.diag(A) + 1e-300), -g)
+        except np.linalg.LinAlgError:
+            raise RuntimeError("Fit is degenerate (singular Jacobian)") from None
+        # steps out of bounds are cut back to halfway to the bound
+        q_new = np.where(q + step < lo, (q + lo) / 2, np.where(q + step > hi, (q + hi) / 2, q + step))
+        r_new = residuals(q_new)
+        cost_new = r_new @ r_new
+        if np.isfinite(cost_new) and cost_new < cost:
+            converged = cost - cost_new < 1e-12 * cost
+            q, r, cost, lam = q_new, r_new, cost_new, lam / 3
+            if converged:
+                break
+        else:
+            lam *= 4
+            if lam > 1e12:
+                break
+    return q
+
+
+def fit_result(result, experiment=None, model=None, weighted=True):
+    """Fit a run() result dict (or a CSV read back into one).
+
+    The model follows from `experiment` (registry name: podmr, rabi, ramsey, t1, hahn) or,
+    for ODMR and T1 results, from the x key alone. x is the first key, y is R_V (or the
+    second column of older CSVs), and R_err_V weights the fit when present.
+    """
+    keys = list(result.keys())
+    xkey = keys[0]
+    experiment = experiment or X_KEYS.get(xkey)
+    if model is None:
+        if experiment not in MODELS:
+            raise ValueError(f"Cannot tell the model from {xkey!r}; pass experiment= one of {list(MODELS)}")
+        model = MODELS[experiment]()
+    # (T1 results keep the historical 'tau_s' key, but the values are µs)
+    x = np.asarray(result[xkey], dtype=float)
+    y = np.asarray(result["R_V"] if "R_V" in result else result[keys[1]], dtype=float)
+    sigma = None
+    if weighted and "R_err_V" in result:
+        sigma = np.asarray(result["R_err_V"], dtype=float)
+        if not np.any(np.isfinite(sigma) & (sigma > 0)):
+            sigma = None
+        elif not np.all(np.isfinite(sigma) & (sigma > 0)):
+            sigma = None  # mixed: weighting would drop the points without an error bar
+    return fit(model, x, y, sigma)
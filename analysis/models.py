@@ -0,0 +1,228 @@
+# analysis/models.py
+"""
+Fit models for NV data: value, analytic Jacobian and a starting guess from the data.
+
+Every model is called as model(x, q) with x an array and q the parameter vector in the
+order of model.params; jac(x, q) returns the (len(x), len(q)) derivative matrix. Both
+are plain NumPy expressions over the whole x array. bounds() keeps times, widths and
+frequencies positive. guess(x, y) works from the raw
+curve (unsorted, repeated x from multi-loop CSVs is fine).
+
+x is in the sweep's own unit: Hz for ODMR, µs for every tau sweep.
+"""
+import numpy as np
+
+
+def _positive(params, names):
+    """(lower, upper) bounds: the named parameters (widths, rates, times) stay above zero."""
+    # numbered names (f0, fwhm1) match their stem; T1 matches as a whole
+    lo = np.array([0.0 if p in names or p.rstrip("0123456789") in names else -np.inf for p in params])
+    return lo, np.full(len(params), np.inf)
+
+
+def _unique_mean(x, y):
+    """Sorted unique x with y averaged over repeats."""
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    xu, inv = np.unique(x, return_inverse=True)
+    yu = np.bincount(inv, weights=y) / np.bincount(inv)
+    return xu, yu
+
+
+def _envelope(t, T, p):
+    """exp(-(t/T)^p) and its derivatives in T and p."""
+    u = np.abs(t / T) ** p
+    e = np.exp(-u)
+    dT = e * p * u / T
+    with np.errstate(divide="ignore", invalid="ignore"):
+        dp = np.where(u > 0, -e * u * np.log(np.where(u > 0, u, 1.0)) / p, 0.0)
+    return e, dT, dp
+
+
+def _decay_time(x, y, c):
+    # first point past 1/e of the way from the start to the baseline
+    past = np.flatnonzero(np.abs(y - c) < abs(y[0] - c) / np.e)
+    if len(past) and x[past[0]] > x[0]:
+        return x[past[0]]
+    return np.ptp(x) / 3
+
+
+def find_resonances(x, y, frac=0.5):
+    """(centre, FWHM) of each feature more than `frac` of the way from baseline to extremum.
+
+    Resonances are peaks in R when the reference half of the cycle is balanced and dips
+    when R carries a laser background; the side that strays further from the median wins.
+    The baseline is the median of the other half of the points.
+    """
+    x, y = _unique_mean(x, y)
+    if len(x) < 3:
+        return []
+    med = np.median(y)
+    if med - y.min() > y.max() - med:
+        y = -y  # dips: work on the mirrored curve
+    base = np.median(np.sort(y)[: max(1, len(y) // 2)])
+    level = base + frac * (y.max() - base)
+    above = y > level
+    found = []
+    # contiguous runs of points above the level
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], above.astype(int), [0]))))
+    for lo, hi in zip(edges[::2], edges[1::2]):
+        w = y[lo:hi] - base
+        centre = float(np.sum(x[lo:hi] * w) / np.sum(w))
+        left = _crossing(x, y, lo - 1, lo, level) if lo > 0 else x[lo]
+        right = _crossing(x, y, hi - 1, hi, level) if hi < len(x) else x[hi - 1]
+        found.append((centre, float(right - left)))
+    return found
+
+
+def _crossing(x, y, i, j, level):
+    # linear interpolation of where the curve crosses `level` between points i and j
+    if y[j] == y[i]:
+        return float(x[i])
+    return float(x[i] + (level - y[i]) * (x[j] - x[i]) / (y[j] - y[i]))
+
+
+class Lorentzians:
+    """c + sum_i a_i (w_i/2)^2 / ((x - x0_i)^2 + (w_i/2)^2): ODMR lines as peaks (a > 0) or dips (a < 0)."""
+
+    def __init__(self, n=None):
+        self.fixed_n = n  # number of lines; None: as many as guess() finds
+        self._set_params(n or 1)
+
+    def _set_params(self, n):
+        self.n = n
+        self.params = tuple(f"{k}{i}" for i in range(n) for k in ("a", "f", "fwhm")) + ("c",)
+
+    def bounds(self):
+        return _positive(self.params, ("f", "fwhm"))
+
+    def __call__(self, x, q):
+        a, x0, w = (np.asarray(q[:-1]).reshape(-1, 3).T[:, :, None])
+        h2 = (w / 2) ** 2
+        return q[-1] + np.sum(a * h2 / ((x[None, :] - x0) ** 2 + h2), axis=0)
+
+    def jac(self, x, q):
+        a, x0, w = (np.asarray(q[:-1]).reshape(-1, 3).T[:, :, None])
+        h2 = (w / 2) ** 2
+        d = x[None, :] - x0
+        den = d ** 2 + h2
+        L = h2 / den
+        da = L
+        dx0 = a * h2 * 2 * d / den ** 2
+        dw = a * (w / 2) * d ** 2 / den ** 2
+        cols = np.stack([da, dx0, dw], axis=1).reshape(-1, len(x))
+        return np.vstack([cols, np.ones((1, len(x)))]).T
+
+    def guess(self, x, y):
+        xu, yu = _unique_mean(x, y)
+        lines = find_resonances(xu, yu)
+        if self.fixed_n is not None:
+            lines = sorted(lines, key=lambda cw: -cw[1])[: self.fixed_n]
+            while len(lines) < self.fixed_n:
+                lines.append((xu[np.argmax(np.abs(yu - np.median(yu)))], np.ptp(xu) / 10))
+        if not lines:
+            lines = [(xu[np.argmax(np.abs(yu - np.median(yu)))], np.ptp(xu) / 10)]
+        self._set_params(len(lines))
+        med = np.median(yu)
+        dips = med - yu.min() > yu.max() - med
+        c = np.percentile(yu, 75 if dips else 25)
+        q = []
+        for centre, fwhm in sorted(lines):
+            fwhm = max(fwhm, 2 * np.min(np.diff(xu)) if len(xu) > 1 else fwhm)
+            q += [np.interp(centre, xu, yu) - c, centre, fwhm]
+        return np.array(q + [c])
+
+
+class DampedCosine:
+    """c + a exp(-(t/T)^p) cos(2 pi f t + phi): Rabi (p = 1) and Ramsey (p = 2) fringes.
+
+    With p=None the envelope exponent is fitted as well.
+    """
+
+    def __init__(self, decay="T_decay", p=1.0):
+        self.p = p
+        self.params = ("a", "f", "phi", decay, "c") + (("p",) if p is None else ())
+
+    def bounds(self):
+        return _positive(self.params, ("f", self.params[3], "p"))
+
+    def _unpack(self, q):
+        a, f, phi, T, c = q[:5]
+        return a, f, phi, T, c, (q[5] if self.p is None else self.p)
+
+    def __call__(self, x, q):
+        a, f, phi, T, c, p = self._unpack(q)
+        e = np.exp(-np.abs(x / T) ** p)
+        return c + a * e * np.cos(2 * np.pi * f * x + phi)
+
+    def jac(self, x, q):
+        a, f, phi, T, c, p = self._unpack(q)
+        e, deT, dep = _envelope(x, T, p)
+        arg = 2 * np.pi * f * x + phi
+        cs, sn = np.cos(arg), np.sin(arg)
+        cols = [e * cs, -a * e * sn * 2 * np.pi * x, -a * e * sn, a * deT * cs, np.ones_like(x)]
+        if self.p is None:
+            cols.append(a * dep * cs)
+        return np.stack(cols, axis=1)
+
+    def guess(self, x, y):
+        xu, yu = _unique_mean(x, y)
+        c = np.mean(yu)
+        # strongest component of the evenly resampled, detrended curve (slow drifts of
+        # the PL would otherwise win), zero-padded for a finer frequency grid
+        tu = np.linspace(xu.min(), xu.max(), max(8, len(xu)))
+        yi = np.interp(tu, xu, yu)
+        yi = yi - np.polyval(np.polyfit(tu, yi, 1), tu)
+        spec = np.abs(np.fft.rfft(yi, 8 * len(tu)))
+        freqs = np.fft.rfftfreq(8 * len(tu), tu[1] - tu[0])
+        k = 1 + int(np.argmax(spec[1:]))
+        f = freqs[k]
+        phi = np.angle(np.sum(yi * np.exp(-2j * np.pi * f * tu)))
+        q = [np.ptp(yi) / 2, f, phi, np.ptp(xu), c]
+        return np.array(q + ([1.0] if self.p is None else []))
+
+
+class StretchedExp:
+    """c + a exp(-(t/T)^beta): T1 (beta ~ 1, or 0.5 for a dense ensemble) and Hahn T2 (beta 1-3).
+
+    beta=None fits the exponent; a number keeps it fixed.
+    """
+
+    def __init__(self, time="T", beta=None):
+        self.beta = beta
+        self.params = ("a", time, "c") + (("beta",) if beta is None else ())
+
+    def bounds(self):
+        return _positive(self.params, (self.params[1], "beta"))
+
+    def _unpack(self, q):
+        return q[0], q[1], q[2], (q[3] if self.beta is None else self.beta)
+
+    def __call__(self, x, q):
+        a, T, c, b = self._unpack(q)
+        return c + a * np.exp(-np.abs(x / T) ** b)
+
+    def jac(self, x, q):
+        a, T, c, b = self._unpack(q)
+        e, deT, deb = _envelope(x, T, b)
+        cols = [e, a * deT, np.ones_like(x)]
+        if self.beta is None:
+            cols.append(a * deb)
+        return np.stack(cols, axis=1)
+
+    def guess(self, x, y):
+        xu, yu = _unique_mean(x, y)
+        # baseline from the last quarter of the sweep
+        c = np.mean(yu[-max(1, len(yu) // 4):])
+        q = [yu[0] - c, _decay_time(xu, yu, c), c]
+        return np.array(q + ([1.0] if self.beta is None else []))
+
+
+# registry short name (see experiments.registry) -> model factory
+MODELS = {
+    "podmr": lambda: Lorentzians(),
+    "rabi": lambda: DampedCosine("T_decay", p=1.0),
+    "ramsey": lambda: DampedCosine("T2star", p=2.0),
+    "t1": lambda: StretchedExp("T1"),
+    "hahn": lambda: StretchedExp("T2"),
+}
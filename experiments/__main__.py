@@ -0,0 +1,100 @@
+# experiments/__main__.py
+"""
+Run any experiment without the GUI:
+
+    python -m experiments rabi --points 51 --loops 3 --mw_freq_MHz 2869
+    python -m experiments podmr --sim --plot podmr.png --csv podmr.csv
+    python -m experiments hahn --list
+
+Every run() parameter is available as --name; points stream to a run file as in the GUI,
+and --resume RUN continues an interrupted one.
+Ctrl+C stops after the current point (twice to abort at once). --profile cprofile wraps
+the run in a profiler; the per-phase timing table is printed at the end of every run.
+"""
+import argparse
+import signal
+import sys
+
+from hardware import backend
+from experiments import registry
+from experiments.cancel import CancelToken
+from experiments.plot_sink import NullSink, FileSink
+from experiments.run_store import RunStore, load_run, write_result_csv
+from experiments.timing import profiled, PROFILERS
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(prog="python -m experiments", description="Run an NV experiment headless.")
+    ap.add_argument("experiment", choices=registry.names())
+    ap.add_argument("--sim", action="store_true", help="use the simulated instruments")
+    ap.add_argument("--plot", metavar="PNG", help="render the live plot to this file")
+    ap.add_argument("--csv", metavar="CSV", help="write the averaged result here when done")
+    ap.add_argument("--no-store", action="store_true", help="do not stream points to a run file")
+    ap.add_argument("--resume", metavar="RUN", help="continue an interrupted run file with its saved parameters")
+    ap.add_argument("--quiet", action="store_true", help="only print the final summary")
+    ap.add_argument("--list", action="store_true", help="show the experiment's parameters and exit")
+    ap.add_argument("--profile", choices=PROFILERS, help="profile the run (pyinstrument must be installed for that one)")
+    ap.add_argument("--profile-out", metavar="FILE", help="where the profile goes (default profile-<time>.prof/.html)")
+    args, rest = ap.parse_known_args(argv)
+
+    pp = registry.param_parser(args.experiment)
+    if args.list:
+        for key, default in registry.default_params(args.experiment).items():
+            print(f"--{key} (default {default!r})")
+        return 0
+    params = vars(pp.parse_args(rest))
+    if args.resume:
+        meta, _ = load_run(args.resume)
+        if meta["experiment"] != registry.display_name(args.experiment):
+            ap.error(f"{args.resume} is a {meta['experiment']} run")
+        params = dict(meta["params"])  # exactly what the run was started with
+
+    if args.sim:
+        backend.use_backend("sim")
+
+    cancel = CancelToken()
+
+    def on_sigint(signum, frame):
+        if cancel.cancelled():
+            raise KeyboardInterrupt
+        print("Stopping after the current point (Ctrl+C again to abort)…", file=sys.stderr)
+        cancel.cancel()
+    signal.signal(signal.SIGINT, on_sigint)
+
+    def emit(**kwargs):
+        if args.quiet:
+            return
+        if "line" in kwargs:
+            print(kwargs["line"])
+        elif "status" in kwargs:
+            print(kwargs["status"])
+
+    plot = FileSink(args.plot) if args.plot else NullSink()
+    if args.resume:
+        store = RunStore.resume(args.resume, params)
+        print(f"Resuming {store.path} ({store.n_points} points already taken)")
+    else:
+        store = None if args.no_store else RunStore(registry.display_name(args.experiment), params)
+        if store is not None:
+            print(f"Streaming points to {store.path}")
+    run = registry.get_runner(args.experiment)
+    try:
+        with profiled(args.profile, args.profile_out):
+            result = run(plot, emit, store=store, cancel=cancel, **params)
+    except BaseException:
+        if store is not None:
+            store.close("error")
+        raise
+    if store is not None:
+        store.close(cancel.end_status())
+    if args.plot:
+        plot.save()
+    if args.csv:
+        write_result_csv(args.csv, result)
+        print(f"Saved CSV to {args.csv}")
+    print(f"{len(next(iter(result.values())))} points{' (interrupted)' if cancel.end_status() == 'interrupted' else ''}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,182 @@
+# experiments/adaptive.py
+"""
+Point placement for swept experiments: fixed (uniform / log) grids and adaptive samplers.
+
+A uniform sweep spends most of its points on flat baseline. The adaptive sampler instead
+measures a coarse uniform pass over the window and then keeps splitting the interval
+between neighbouring measured points whose (normalised) curve length is largest: flat
+baseline is a short, straight segment and is left alone, while the flanks and tops of
+resonances are long and get subdivided until the point budget is spent.
+
+For tau sweeps the ModelSampler goes further: it refits a decay / damped-oscillation
+model after every point and measures next where a reading shrinks the variance of the
+parameter of interest (T1, Rabi frequency, T2*, T2) the most.
+
+All candidate points sit on a fixed fine grid (the coarse step divided by REFINE_DIV),
+so the run is stored in an ordinary SweepData / run file over that grid and only the
+measured points end up in the result.
+"""
+import numpy as np
+
+from analysis.fit import fit
+from analysis.models import StretchedExp, DampedCosine
+
+REFINE_DIV = 16      # fine grid points per coarse step
+MAX_GRID = 4001      # keeps SweepData small for large budgets
+
+
+class AdaptiveSampler:
+
+    def __init__(self, x_start, x_stop, points: int, coarse_points: int = 0):
+        self.budget = int(points)
+        coarse = int(coarse_points) or max(3, self.budget // 3)
+        coarse = max(2, min(coarse, self.budget))
+        div = max(1, min(REFINE_DIV, (MAX_GRID - 1) // max(1, coarse - 1)))
+        self.x = np.linspace(x_start, x_stop, (coarse - 1) * div + 1)
+        self.coarse = np.arange(0, len(self.x), div)
+        self.budget = min(self.budget, len(self.x))
+
+    def first_pass(self, data):
+        """Grid indices for the first loop; reads `data` between points to pick the next one."""
+        for i in self.coarse:
+            yield int(i)
+        while np.count_nonzero(self.taken(data)) < self.budget:
+            i = self.next_index(data)
+            if i is None:
+                return
+            yield i
+
+    def taken(self, data):
+        # loop 0 decides the point set, later loops repeat it
+        return np.isfinite(data.raw["R"][0])
+
+    def repeat(self, data):
+        """Grid indices for the later loops: everything the first loop measured."""
+        return [int(i) for i in np.flatnonzero(self.taken(data))]
+
+    def summary(self, data):
+        """One line on the result so far, or None (nothing to fit here)."""
+        return None
+
+    def next_index(self, data):
+        idx = np.flatnonzero(self.taken(data))
+        if len(idx) < 2:
+            return None
+        gaps = np.diff(idx) > 1
+        if not gaps.any():
+            return None
+        x = self.x[idx]
+        y = data.mean("R")[idx]
+        dx = np.diff(x) / abs(self.x[-1] - self.x[0])
+        span = np.ptp(y)
+        dy = np.diff(y) / span if span > 0 else np.zeros_like(dx)
+        loss = np.where(gaps, np.hypot(dx, dy), -1.0)
+        k = int(np.argmax(loss))
+        return int((idx[k] + idx[k + 1]) // 2)
+
+
+SAMPLINGS = ("uniform", "log", "adaptive")
+
+
+def sweep_points(sampling, x_start, x_stop, points, model=None):
+    """(x grid, sampler) for a sweep; the sampler is None for the fixed grids.
+
+    "adaptive" uses a ModelSampler when `model` is given, an AdaptiveSampler otherwise.
+    """
+    if sampling == "uniform":
+        return np.linspace(x_start, x_stop, int(points)), None
+    if sampling == "log":
+        if x_start <= 0 or x_stop <= 0:
+            raise ValueError("Log spacing needs a sweep range above zero")
+        return np.geomspace(x_start, x_stop, int(points)), None
+    if sampling == "adaptive":
+        sampler = ModelSampler(x_start, x_stop, points, model) if model is not None else AdaptiveSampler(x_start, x_stop, points)
+        return sampler.x, sampler
+    raise ValueError(f"Unknown sampling {sampling!r}, expected one of {SAMPLINGS}")
+
+
+def loop_order(sampler, data, loop):
+    """Indices into data.x to measure in `loop` (every point for a fixed grid)."""
+    if sampler is None:
+        return range(len(data.x))
+    return sampler.first_pass(data) if loop == 0 else sampler.repeat(data)
+
+
+# the ModelSampler refits one analysis model per sweep, with the envelope exponent fixed
+# so a handful of points is enough; x is µs for every tau sweep
+
+def _sampled(model, target, seed, unit):
+    model.target = model.params.index(target)
+    model.seed, model.unit = seed, unit
+    return model
+
+
+MODELS = {
+    "t1": lambda: _sampled(StretchedExp("T1", beta=1.0), "T1", "log", "µs"),
+    "rabi": lambda: _sampled(DampedCosine("T_decay", p=1.0), "f", "linear", "MHz"),
+    "ramsey": lambda: _sampled(DampedCosine("T2star", p=2.0), "T2star", "linear", "µs"),
+    "hahn": lambda: _sampled(StretchedExp("T2", beta=1.0), "T2", "log", "µs"),
+}
+
+
+class ModelSampler(AdaptiveSampler):
+    """Seeds the sweep, then measures where one more point best pins down model.target.
+
+    After every point the model is refitted (warm-started from the last fit). A reading at
+    t with model gradient g reduces the target's variance by (C g)_k^2 / (s^2 + g'C g);
+    the unmeasured grid point with the largest reduction is taken next. Until a fit
+    succeeds, points go where the curve changes most (AdaptiveSampler).
+    """
+
+    def __init__(self, x_start, x_stop, points: int, model, seed_points: int = 0):
+        seed = int(seed_points) or max(len(model.params) + 2, int(points) // 5)
+        super().__init__(x_start, x_stop, points, seed)
+        self.model = model
+        if model.seed == "log" and min(x_start, x_stop) > 0:
+            # decays: seed densely at short tau, where the curve moves fastest
+            ideal = np.geomspace(self.x[0], self.x[-1], len(self.coarse))
+            self.coarse = np.unique(np.abs(self.x[:, None] - ideal[None, :]).argmin(axis=0))
+        self.last_fit = None
+
+    def _refit(self, t, y):
+        # warm start from the previous fit, then from the data if that fails
+        starts = ([self.last_fit.q] if self.last_fit is not None else []) + [None]
+        for q0 in starts:
+            try:
+                return fit(self.model, t, y, p0=q0)
+            except RuntimeError:
+                pass
+        return None
+
+    def next_index(self, data):
+        taken = self.taken(data)
+        idx = np.flatnonzero(taken)
+        if len(idx) <= len(self.model.params):
+            return super().next_index(data)
+        t, y = self.x[idx], data.mean("R")[idx]
+        self.last_fit = self._refit(t, y)
+        if self.last_fit is None:
+            return super().next_index(data)
+        q, C = self.last_fit.q, self.last_fit.cov
+        free = np.flatnonzero(~taken)
+        if len(free) == 0:
+            return None
+        with np.errstate(all="ignore"):
+            G = self.model.jac(self.x[free], q)
+            s2 = np.sum((y - self.model(t, q)) ** 2) / max(1, len(t) - len(q))
+            CG = G @ C
+            gain = CG[:, self.model.target] ** 2 / (s2 + np.einsum("ij,ij->i", CG, G))
+        if not np.all(np.isfinite(gain)):
+            return super().next_index(data)
+        return int(free[int(np.argmax(gain))])
+
+    def summary(self, data):
+        """'name = value ± error' of the target from a fit to everything measured, or None."""
+        m = data.measured()
+        if np.count_nonzero(m) <= len(self.model.params):
+            return None
+        fr = self._refit(self.x[m], data.mean("R")[m])
+        if fr is None:
+            return None
+        name = self.model.params[self.model.target]
+        return f"{name} = {fr[name]:.4g} ± {fr.err(name):.2g} {self.model.unit}"
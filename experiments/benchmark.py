@@ -0,0 +1,265 @@
+# experiments/benchmark.py
+"""
+Throughput benchmark of every experiment on the simulated bench:
+
+    python -m experiments.benchmark                 # run all, compare with the baseline
+    python -m experiments.benchmark rabi t1         # only these
+    python -m experiments.benchmark --save          # record a new baseline
+    python -m experiments.benchmark --latency gpib=5ms,synth=10ms --no-compare
+    python -m experiments.benchmark podmr --set dark_reset=true --set pipelined=false --no-compare
+
+Each run() goes through the simulated PulseBlaster, SR830 and SynthHD
+(hardware.simulator) with the bus latencies in LATENCY, and its SpanTimer summary gives
+
+  points/h   3600 / mean point time (steady state: setup and compile excluded)
+  idle       share of the point time the lock-in is not settling on or reading a signal
+             (PB programming, MW stepping, run file, plot, loop overhead)
+  io         share of the run's wall time spent in each instrument's calls
+  compile    time to build, check and compile the sweep's programs, for a range of N and
+             points (runs cancelled before their first point, program cache cleared)
+
+The results are compared with benchmark_baseline.json: fewer points per hour, more idle
+time or slower compilation (summed over the N x points grid) than the baseline allows
+(TOLERANCE, COMPILE_RTOL) fails the benchmark with exit code 1. A baseline only holds for the machine and settings it was taken on; take a
+new one with --save after a deliberate change.
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import sys
+import time
+
+import numpy as np
+
+from hardware import backend
+from hardware.pb_sequence import PROGRAM_CACHE
+from hardware.session import HardwareSession
+from experiments import registry
+from experiments.cancel import CancelToken
+from experiments.plot_sink import NullSink
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_baseline.json")
+
+# rough delays of the real buses: spinapi programming, GPIB round trip, SynthHD serial command
+LATENCY = dict(pb_program=2e-3, pb_inst=20e-6, pb_start=0.5e-3, gpib=2e-3, synth=5e-3)
+
+POINTS = 11           # points per throughput run (one loop, every other parameter default)
+COMPILE_POINTS = (31, 301, 3001)
+COMPILE_N = (50, 250, 1000)   # only for experiments with an N parameter
+COMPILE_REPEAT = 5    # compile timings are the best of this many runs
+
+TOLERANCE = 0.25      # points/h may drop by this fraction
+IDLE_ATOL = 0.10      # idle share may grow by this much
+COMPILE_RTOL = 0.5    # compile time may grow by this fraction (pure CPU time, noisier than the sleeps)
+COMPILE_ATOL_S = 0.005
+
+# spans in which the lock-in is doing the measuring
+ACQUIRE_SPANS = ("settle", "buffer")
+
+
+def _run(name, session, cancel=None, **params):
+    """One run on the simulated bench; returns (SpanTimer summary, wall time, io seconds)."""
+    from hardware.simulator import LAB
+    captured = {}
+
+    def emit(**kwargs):
+        if "timing" in kwargs:
+            captured["timing"] = kwargs["timing"]
+
+    LAB.reset_io()
+    t0 = time.perf_counter()
+    registry.get_runner(name)(NullSink(), emit, session=session, cancel=cancel, **params)
+    return captured["timing"], time.perf_counter() - t0, dict(LAB.io_s)
+
+
+def run_params(name, overrides):
+    """{'dark_reset': 'true', ...} -> typed run() parameters, only those `name` has."""
+    pp = registry.param_parser(name)
+    defaults = registry.default_params(name)
+    args = [a for k, v in overrides.items() if k in defaults for a in (f"--{k}", v)]
+    return {k: v for k, v in vars(pp.parse_args(args)).items() if k in overrides}
+
+
+def throughput(name, session, points=POINTS, **params):
+    """points/h, idle share and per-instrument io share of one short run."""
+    timing, wall, io = _run(name, session, points=points, loops=1, **params)
+    spans = timing["spans"]
+    point = spans["point"]
+    acquire = sum(spans[s]["total_s"] for s in ACQUIRE_SPANS if s in spans)
+    return dict(points=point["n"], point_ms=point["mean_s"] * 1e3, point_p90_ms=point["p90_s"] * 1e3,
+                points_per_hour=3600.0 / point["mean_s"], idle=1.0 - acquire / point["total_s"],
+                io={k: v / wall for k, v in io.items()},
+                phases={k: v["total_s"] / point["total_s"] for k, v in spans.items()
+                        if k not in ("point", "setup", "compile")})
+
+
+def compile_times(name, session, points=COMPILE_POINTS, N=COMPILE_N, repeat=COMPILE_REPEAT):
+    """{'N=250,points=301': seconds}: compile span of runs cancelled before the first point."""
+    out = {}
+    Ns = N if "N" in registry.default_params(name) else (None,)
+    for n in Ns:
+        for p in points:
+            params = dict(points=p, loops=1) if n is None else dict(points=p, loops=1, N=n)
+            best = np.inf
+            for _ in range(repeat):
+                PROGRAM_CACHE.clear()
+                cancel = CancelToken()
+                cancel.cancel("benchmark: compile only")
+                # as timeit does: no garbage collection pauses from earlier runs
+                gc.collect()
+                gc.disable()
+                try:
+                    timing, _, _ = _run(name, session, cancel=cancel, **params)
+                finally:
+                    gc.enable()
+                best = min(best, timing["spans"]["compile"]["total_s"])
+            out[f"points={p}" if n is None else f"N={n},points={p}"] = best
+    return out
+
+
+def run_benchmark(names, latency=None, points=POINTS, compile_points=COMPILE_POINTS, overrides=None, emit=print):
+    """Throughput and compile results of `names` as a JSON-ready dict.
+
+    overrides: {name: text value} of run() parameters for the throughput runs.
+    """
+    overrides = dict(overrides or {})
+    from hardware.simulator import LAB
+    backend.use_backend("sim")
+    latency = dict(LATENCY if latency is None else latency)
+    LAB.set_latency(**latency)
+    LAB._rng = np.random.default_rng(0)  # same noise, so the settling takes the same polls
+    results = dict(settings=dict(latency=latency, points=points, params=overrides, compile_points=list(compile_points),
+                                 compile_N=list(COMPILE_N), lockin_tc_s=LAB.tau_s()),
+                   machine=dict(node=platform.node(), python=platform.python_version()),
+                   date=time.strftime("%Y-%m-%d %H:%M:%S"),
+                   throughput={}, compile={})
+    with HardwareSession() as session:
+        for name in names:
+            emit(f"{name}: {points} points…")
+            results["throughput"][name] = throughput(name, session, points, **run_params(name, overrides))
+            results["compile"][name] = compile_times(name, session, compile_points)
+    return results
+
+
+def report(results):
+    lines = [f"{'':<7} {'points/h':>9} {'point':>9} {'p90':>9} {'idle':>6}   io (pb / lock-in / synth)"]
+    for name, r in results["throughput"].items():
+        io = r["io"]
+        lines.append(f"{name:<7} {r['points_per_hour']:9.0f} {r['point_ms']:7.1f}ms {r['point_p90_ms']:7.1f}ms "
+                     f"{r['idle']:6.1%}   {io['pb']:5.1%} / {io['lockin']:5.1%} / {io['synth']:5.1%}")
+    lines.append("Compile time:")
+    for name, c in results["compile"].items():
+        lines.append(f"  {name:<7} " + ", ".join(f"{k} {v * 1e3:.1f} ms" for k, v in c.items()))
+    return lines
+
+
+def compile_regressions(results, baseline, compile_rtol=COMPILE_RTOL):
+    """Experiments whose compile time, summed over the grid, grew beyond compile_rtol.
+
+    Single grid points are too noisy to judge on a busy machine; the total is not.
+    """
+    out = []
+    for name, c in results["compile"].items():
+        b = baseline["compile"].get(name, {})
+        keys = [k for k in c if k in b]
+        if keys and sum(c[k] for k in keys) > sum(b[k] for k in keys) * (1 + compile_rtol) + COMPILE_ATOL_S:
+            out.append(name)
+    return out
+
+
+def compare(results, baseline, rtol=TOLERANCE, compile_rtol=COMPILE_RTOL):
+    """Regressions against `baseline`, one line each (empty: none)."""
+    problems = []
+    for name, r in results["throughput"].items():
+        b = baseline["throughput"].get(name)
+        if b is None:
+            continue
+        if r["points_per_hour"] < b["points_per_hour"] * (1 - rtol):
+            problems.append(f"{name}: {r['points_per_hour']:.0f} points/h, baseline {b['points_per_hour']:.0f}")
+        if r["idle"] > b["idle"] + IDLE_ATOL:
+            problems.append(f"{name}: idle {r['idle']:.1%}, baseline {b['idle']:.1%}")
+    for name in compile_regressions(results, baseline, compile_rtol):
+        c, b = results["compile"][name], baseline["compile"][name]
+        keys = [k for k in c if k in b]
+        problems.append(f"{name} compile: {sum(c[k] for k in keys) * 1e3:.1f} ms over {len(keys)} sweeps, "
+                        f"baseline {sum(b[k] for k in keys) * 1e3:.1f} ms")
+    return problems
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(prog="python -m experiments.benchmark", description="Throughput benchmark on the simulated bench.")
+    ap.add_argument("experiments", nargs="*", metavar="EXPERIMENT", help=f"any of {registry.names()} (default: all)")
+    ap.add_argument("--points", type=int, default=POINTS, help="points per throughput run")
+    ap.add_argument("--latency", help="bus latencies, e.g. gpib=2ms,synth=5ms,pb_inst=20us (default: LATENCY)")
+    ap.add_argument("--set", action="append", default=[], metavar="NAME=VALUE",
+                    help="run() parameter for the throughput runs, e.g. dark_reset=true or pipelined=false")
+    ap.add_argument("--baseline", default=BASELINE_FILE, help="baseline results (JSON)")
+    ap.add_argument("--save", action="store_true", help="write the results as the new baseline")
+    ap.add_argument("--no-compare", action="store_true", help="only report, do not check the baseline")
+    ap.add_argument("--tolerance", type=float, default=TOLERANCE, help="allowed relative drop in points/h")
+    ap.add_argument("--compile-tolerance", type=float, default=COMPILE_RTOL, help="allowed relative growth of the compile time")
+    ap.add_argument("--out", metavar="JSON", help="also write the results here")
+    args = ap.parse_args(argv)
+    unknown = [n for n in args.experiments if n not in registry.names()]
+    if unknown:
+        ap.error(f"unknown experiment(s) {unknown}, expected any of {registry.names()}")
+
+    from hardware.simulator import parse_latency
+    latency = dict(LATENCY, **parse_latency(args.latency)) if args.latency else None
+    if any("=" not in item for item in args.set):
+        ap.error("--set takes NAME=VALUE")
+    overrides = dict(item.split("=", 1) for item in args.set)
+    results = run_benchmark(args.experiments or registry.names(), latency, args.points, overrides=overrides)
+    for line in report(results):
+        print(line)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=1)
+
+    if args.save:
+        if args.experiments and os.path.exists(args.baseline):
+            # a partial run updates its experiments in a baseline taken with the same settings
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+            if baseline["settings"] == results["settings"]:
+                for key in ("throughput", "compile"):
+                    results[key] = dict(baseline[key], **results[key])
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=1)
+        print(f"Baseline written to {args.baseline}")
+        return 0
+    if args.no_compare:
+        return 0
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}; record one with --save")
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if baseline["settings"] != results["settings"]:
+        print(f"REGRESSION CHECK SKIPPED: {args.baseline} was taken with other settings "
+              f"({baseline['settings']}); record a new baseline with --save", file=sys.stderr)
+        return 1
+    if baseline["machine"] != results["machine"]:
+        print(f"Note: baseline taken on {baseline['machine']['node']}, timings may not compare")
+    slow = compile_regressions(results, baseline, args.compile_tolerance)
+    if slow:
+        # CPU timings catch the odd busy spell: measure once more and keep the best
+        print(f"Compile time of {', '.join(slow)} over the baseline, measuring again…")
+        with HardwareSession() as session:
+            for name in slow:
+                again = compile_times(name, session, tuple(results["settings"]["compile_points"]))
+                results["compile"][name] = {k: min(v, again[k]) for k, v in results["compile"][name].items()}
+    problems = compare(results, baseline, args.tolerance, args.compile_tolerance)
+    if problems:
+        print(f"REGRESSION against {args.baseline} (taken {baseline['date']}):", file=sys.stderr)
+        for p in problems:
+            print(f"  {p}", file=sys.stderr)
+        return 1
+    print(f"No regression against {args.baseline} (taken {baseline['date']}, tolerance {args.tolerance:.0%} / compile {args.compile_tolerance:.0%})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
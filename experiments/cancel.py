@@ -0,0 +1,54 @@
+# experiments/cancel.py
+"""Cancellation token checked by run() between points (GUI Stop button, Ctrl+C, scheduler).
+
+cancel() interrupts a run; finish() ends it early because it already has what it needs
+(e.g. the live fit reached its target precision), and the run file is then closed as
+complete rather than interrupted. reason is what run() logs when it stops.
+"""
+import threading
+
+
+class CancelToken:
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._children = []
+        self.reason = None
+        self.early_stop = False
+
+    def cancel(self, reason="Interrupted by user."):
+        self._set(reason, False)
+
+    def finish(self, reason):
+        """Stop after the current point; the run counts as complete."""
+        self._set(reason, True)
+
+    def _set(self, reason, early):
+        with self._lock:
+            if not self._event.is_set():
+                self.reason, self.early_stop = reason, early
+            self._event.set()
+            children = list(self._children)
+        for child in children:
+            child._set(reason, early)
+
+    def child(self):
+        """Token for one job of a queue: cancelled with this one, but finish() stops only the job."""
+        token = CancelToken()
+        with self._lock:
+            self._children.append(token)
+            if self._event.is_set():
+                token._set(self.reason, self.early_stop)
+        return token
+
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def end_status(self) -> str:
+        """Run file status for a run() that returned: 'interrupted' after cancel(), else 'complete'."""
+        return "interrupted" if self.cancelled() and not self.early_stop else "complete"
+
+    def wait(self, timeout_s: float) -> bool:
+        """Sleep up to timeout_s; returns True early if cancelled."""
+        return self._event.wait(timeout_s)
@@ -9,18 +9,11 @@ Reference half-cycle:
     same timing envelope, but no MW pulses
 """
 
-import time
-import numpy as np
-from spinapi import *
-from hardware.sr830_control import init_sr830, sr830_read_R
-from hardware.pulseblaster_control import pb_init_simple
-from hardware.windfreak_control import WindfreakSynth
-from PyQt6.QtCore import QThread
-
-# Channels
-CH_REF   = (1 << 0)
-CH_LASER = (1 << 1)
-CH_MW_I  = (1 << 2)
+from hardware.sr830_control import SETTLE_RTOL
+from hardware.pulseblaster_control import pb_load
+from experiments.sweep import run_sweep, FixedTone
+from experiments.adaptive import MODELS, sweep_points
+from hardware.pb_sequence import PulseSequence, SweepPrograms, CH_REF, CH_LASER, CH_MW_I
 
 
 def _ns(x_us: float) -> float:
@@ -28,12 +21,10 @@ def _ns(x_us: float) -> float:
 
 
 def stop_pulse():
-    pb_start_programming(PULSE_PROGRAM)
-    pb_inst_pbonly(0, BRANCH, 0, 100.0)
-    pb_stop_programming()
+    pb_load(PulseSequence().block([(0, 100.0)]))
 
 
-def pulse_creation(
+def pulse_sequence(
     laser_pulse_us: float,
     pad_ns: float,
     pi_ns: float,
@@ -47,28 +38,25 @@ def pulse_creation(
     tau2_ns=tau_ns/2.0
     pi2_ns=pi_ns/2.0
     
-    pb_start_programming(PULSE_PROGRAM)
+    dark_ns=pad_ns+pi2_ns+tau2_ns+pi_ns+tau2_ns+pi2_ns+pad_ns
+    seq=PulseSequence()
     # ----- signal half: CH_REF high -----
-    i=0
-    while i<N:
-        pb_inst_pbonly(CH_REF | CH_LASER, CONTINUE, 0, laser_pulse_ns)
-        pb_inst_pbonly(CH_REF, CONTINUE, 0, pad_ns)
-        pb_inst_pbonly(CH_REF | CH_MW_I, CONTINUE, 0, pi2_ns)
-        pb_inst_pbonly(CH_REF, CONTINUE, 0, tau2_ns)
-        pb_inst_pbonly(CH_REF|CH_MW_I, CONTINUE, 0, pi_ns)
-        pb_inst_pbonly(CH_REF, CONTINUE, 0, tau2_ns)
-        pb_inst_pbonly(CH_REF | CH_MW_I, CONTINUE, 0, pi2_ns)
-        pb_inst_pbonly(CH_REF, CONTINUE, 0, pad_ns)
-        i=i+1
+    seq.block([(CH_REF | CH_LASER, laser_pulse_ns),
+               (CH_REF, pad_ns),
+               (CH_REF | CH_MW_I, pi2_ns),
+               (CH_REF, tau2_ns),
+               (CH_REF|CH_MW_I, pi_ns),
+               (CH_REF, tau2_ns),
+               (CH_REF | CH_MW_I, pi2_ns),
+               (CH_REF, pad_ns)], N)
     # ----- reference half: CH_REF low -----
-    i=0
-    while i<N-1:
-        pb_inst_pbonly(CH_LASER, CONTINUE, 0, laser_pulse_ns)
-        pb_inst_pbonly(0, CONTINUE, 0, (pad_ns+pi2_ns+tau2_ns+pi_ns+tau2_ns+pi2_ns+pad_ns))
-        i=i+1
-    pb_inst_pbonly(CH_LASER,CONTINUE,0,laser_pulse_ns)
-    pb_inst_pbonly(0, BRANCH, 0, (pad_ns+pi2_ns+tau2_ns+pi_ns+tau2_ns+pi2_ns+pad_ns))
-    pb_stop_programming()
+    seq.block([(CH_LASER, laser_pulse_ns),
+               (0, dark_ns)], N)
+    return seq
+
+
+def pulse_creation(laser_pulse_us, pad_ns, pi_ns, tau_us, N):
+    pb_load(pulse_sequence(laser_pulse_us, pad_ns, pi_ns, tau_us, N))
 
 
 def run(ax,
@@ -77,77 +65,27 @@ def run(ax,
         dbm=-35.0,
         N=250,
         laser_pulse_us=10.0,
-        pad_ns=5.0,
+        pad_ns=50.0,
         pi_ns=800.0,
         max_tau_us=50.0,
         points=51,
-        loops=3
+        loops=3,
+        settle_rtol=SETTLE_RTOL,
+        dark_reset=False,
+        buffer_samples=0,
+        sampling="uniform",
+        live_fit=False,
+        stop_rtol=0.0,
+        pipelined=True,
+        session=None,
+        store=None,
+        cancel=None
         ):
-    
-    #init hardware
-    pb_init_simple()
-    rm, li, tau_LI_s = init_sr830()
-    mw = WindfreakSynth()
-    wait_s = max(1, 15 * float(tau_LI_s))
-
-    #set up variables
-    tau_space_us = np.linspace(0.1, float(max_tau_us), int(points))
-
-    #set up plot
-    ax.set_title("Hahn")
-    ax.set_xlabel("Tau (us)")
-    ax.set_ylabel("R (V)")
-    ax.grid(True)
-    (line,) = ax.plot([], [], "o")
-
-    #Do the experiment
-    try:
-        pb_stop()
-        pb_reset()
-
-        loop_count=0
-        tau_vals = []
-        R_vals = []
-
-        mw.set_power(1, dbm)
-        mw.set_freq(1, f_MHz * 1e6)
-        mw.rf_on(1)
-
-        while loop_count<loops:
-            for i,ti in enumerate(tau_space_us):
-                if QThread.currentThread().isInterruptionRequested():
-                    emit(line="Interrupted by user.")
-                    break
-                
-                tau_us=ti
-                pulse_creation(laser_pulse_us,pad_ns,pi_ns,tau_us,N)
-                pb_start()
-                time.sleep(wait_s)
-
-                R=sr830_read_R(li)
-                R_vals.append(R)
-                tau_vals.append(ti)
-
-                line.set_data(tau_vals,R_vals)
-                ax.relim(); ax.autoscale()
-                emit(line=f"{ti:.6f} us → R = {R:.4f} V", status=f"Point {(loop_count*len(tau_space_us)+i+1)} / {(len(tau_space_us)*loops)}", progress=((loop_count*len(tau_space_us))+i+1)/(loops*len(tau_space_us)))
-
-                pb_stop()
-                pb_reset()
-                stop_pulse()
-                pb_start()
-                time.sleep(wait_s)
-                pb_stop()
-                pb_reset
-
-            loop_count=loop_count+1
-
-    finally:
-        try:pb_stop();pb_reset(); pb_close()
-        except:pass
-        try: li.close();rm.close()
-        except:pass
-        try: mw.close()
-        except:pass
 
-    return {"tau_us": tau_vals, "R_V": R_vals}
\ No newline at end of file
+    # uniform, log or adaptive (refits the T2 after every point to choose the next τ)
+    tau_space_us, sampler = sweep_points(sampling, 0.1, float(max_tau_us), int(points), MODELS["hahn"]())
+    programs = lambda: SweepPrograms(lambda t: pulse_sequence(laser_pulse_us, pad_ns, pi_ns, t, N), tau_space_us, "τ", " µs")
+    return run_sweep(ax, emit, "hahn", tau_space_us, sampler, programs, ("Hahn", "Tau (us)", "R (V)"), "tau_us",
+                     lambda ti, R: f"{ti:.6f} us → R = {R:.4f} V", loops, drive=FixedTone(f_MHz * 1e6, dbm),
+                     settle_rtol=settle_rtol, dark_reset=dark_reset, buffer_samples=buffer_samples, live_fit=live_fit,
+                     stop_rtol=stop_rtol, pipelined=pipelined, session=session, store=store, cancel=cancel)
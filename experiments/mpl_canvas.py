@@ -1,9 +1,98 @@
 # experiments/mpl_canvas.py
+import numpy as np
 from matplotlib.backends.backend_qtagg import FigureCanvasQTAgg as FigureCanvas
 from matplotlib.figure import Figure
+from PyQt6.QtCore import QTimer
+
+from experiments.plot_sink import PlotSink, errorbar_artists, set_errorbars
 
 class MplCanvas(FigureCanvas):
     def __init__(self, parent=None, width=5, height=4, dpi=100):
         fig = Figure(figsize=(width, height), dpi=dpi, layout="constrained")
         self.ax = fig.add_subplot(111)
-        super().__init__(fig)
\ No newline at end of file
+        super().__init__(fig)
+
+
+class LivePlot:
+    """Redraws a canvas from a PlotSink on a GUI-thread timer, at most `max_fps` times a second.
+
+    The curve and error bars are animated artists blitted over a cached background; the
+    full figure is only redrawn when the labels change or the data leaves the axis limits.
+    """
+
+    def __init__(self, canvas: MplCanvas, max_fps: float = 10.0):
+        self.canvas = canvas
+        self.ax = canvas.ax
+        self.sink = PlotSink()
+        self._seen = -1
+        self._labels = None
+        self._background = None
+        self.line = self.bars = None
+        self.timer = QTimer()
+        self.timer.setInterval(int(1000 / max_fps))
+        self.timer.timeout.connect(self.refresh)
+        canvas.mpl_connect("draw_event", self._on_draw)
+
+    def reset(self):
+        """New run: fresh axes and an empty sink."""
+        self.sink = PlotSink()
+        self._seen = -1
+        self._labels = None
+        self.ax.clear()
+        self.line, self.bars = errorbar_artists(self.ax, animated=True)
+        self.canvas.draw()
+        return self.sink
+
+    def start(self):
+        self.timer.start()
+
+    def stop(self):
+        self.timer.stop()
+        self.refresh(full=True)
+
+    def _on_draw(self, event):
+        # full redraw happened: cache the static background, then put the curve back on top
+        self._background = self.canvas.copy_from_bbox(self.ax.bbox)
+        self._draw_artists()
+
+    def _draw_artists(self):
+        if self.line is not None:
+            self.ax.draw_artist(self.bars)
+            self.ax.draw_artist(self.line)
+
+    def _outside_limits(self, x, y, e):
+        if len(x) == 0:
+            return False
+        err = np.where(np.isfinite(e), e, 0.0)
+        x0, x1 = self.ax.get_xlim()
+        y0, y1 = self.ax.get_ylim()
+        return (x.min() < min(x0, x1) or x.max() > max(x0, x1)
+                or np.nanmin(y - err) < min(y0, y1) or np.nanmax(y + err) > max(y0, y1))
+
+    def refresh(self, full=False):
+        version, labels, xye = self.sink.take()
+        if version == self._seen and not full:
+            return
+        self._seen = version
+        if labels != self._labels:
+            self._labels = labels
+            if labels is not None:
+                title, xlabel, ylabel = labels
+                self.ax.set_title(title); self.ax.set_xlabel(xlabel); self.ax.set_ylabel(ylabel)
+                self.ax.grid(True)
+            full = True
+        if xye is not None:
+            set_errorbars(self.line, self.bars, *xye)
+            if full or self._outside_limits(*xye):
+                x, y, e = xye
+                e = np.where(np.isfinite(e), e, 0.0)
+                self.ax.relim()
+                self.ax.update_datalim(np.column_stack([np.r_[x, x], np.r_[y - e, y + e]]))
+                self.ax.autoscale()
+                full = True
+        if full or self._background is None:
+            self.canvas.draw()  # _on_draw blits the artists
+        else:
+            self.canvas.restore_region(self._background)
+            self._draw_artists()
+            self.canvas.blit(self.ax.bbox)
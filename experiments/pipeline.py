@@ -0,0 +1,155 @@
+# experiments/pipeline.py
+"""
+Overlapping the steps of consecutive points.
+
+A point is: (retune MW), program and start the PB, settle and read the lock-in, then the
+bookkeeping (run file, live plot, live fit snapshot) and an optional dark phase. Only the
+instrument steps depend on each other; the bookkeeping only needs the reading. With a
+PointPipeline the point loop (experiments.sweep) hands the bookkeeping of point i to a
+worker thread and goes straight on to point i+1, so it runs while the lock-in settles:
+
+    pipe = PointPipeline(timer)
+    ...
+    data.add(loop, i, pt)
+    pipe.after(store.append, loop, i, x, pt, span="store")  # worker thread, in order
+    pipe.show(plot, data, fitter)   # live plot and live fit snapshot, likewise
+    ...
+    pipe.drain()                    # end of the run: wait, raise worker errors
+
+Instrument steps that do not need the current reading go ahead() on a second thread: in
+pulsed ODMR the SynthHD retunes to the next frequency while the lock-in relaxes in the
+dark phase, and the next point collects it with wait_ahead() before the PB starts. The
+PB programs themselves are compiled before the run (hardware.pb_sequence.SweepPrograms)
+and cannot be transferred while the board plays the current one.
+
+The plot and the fit snapshot get a copy of the averaged curve (SweepData.averages(),
+taken on the acquisition thread), so the worker never reads the arrays the next point
+writes to. With enabled=False everything runs inline, in the old order.
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+# spans the worker thread records (overlapped with the acquisition, see SpanTimer.lines)
+WORKER_SPANS = ("store", "plot")
+
+
+class PointPipeline:
+
+    def __init__(self, timer=None, enabled=True):
+        self.timer = timer
+        self.enabled = bool(enabled)
+        self._after = ThreadPoolExecutor(1, thread_name_prefix="point-after") if enabled else None
+        self._ahead_pool = ThreadPoolExecutor(1, thread_name_prefix="point-ahead") if enabled else None
+        self._pending = []
+        self._ahead = None  # (key, Future)
+        if timer is not None and enabled:
+            timer.overlapped.update(WORKER_SPANS)
+
+    def after(self, fn, *args, span=None):
+        """Bookkeeping of the point just read; runs in order, off the acquisition thread."""
+        self._raise_done()
+        task = self._task(fn, args, span)
+        if not self.enabled:
+            task()
+            return
+        self._pending.append(self._after.submit(task))
+
+    def show(self, plot, data, fitter=None):
+        """Live plot update (and live fit snapshot) of the point just read."""
+        view = data.averages() if self.enabled else data
+
+        def update():
+            plot.update(view)
+            if fitter is not None:
+                fitter.update(view)
+        self.after(update, span="plot")
+
+    def _task(self, fn, args, span):
+        def task():
+            if span is not None and self.timer is not None:
+                with self.timer.span(span):
+                    fn(*args)
+            else:
+                fn(*args)
+        return task
+
+    def _raise_done(self):
+        # errors of finished bookkeeping surface on the acquisition thread at the next point
+        still = []
+        for fut in self._pending:
+            if fut.done():
+                fut.result()
+            else:
+                still.append(fut)
+        self._pending = still
+
+    def ahead(self, key, fn, *args):
+        """Start an instrument step for a later point (e.g. key = its index) in the background."""
+        self.wait_ahead()
+        if not self.enabled:
+            self._ahead = (key, _Done(fn(*args)))
+            return
+        self._ahead = (key, self._ahead_pool.submit(fn, *args))
+
+    def has_ahead(self, key):
+        return self._ahead is not None and self._ahead[0] == key
+
+    def wait_ahead(self):
+        """Result of the step started by ahead() (None if there is none); raises its error."""
+        if self._ahead is None:
+            return None
+        _, fut = self._ahead
+        self._ahead = None
+        return fut.result()
+
+    def drain(self):
+        """Wait for everything in flight; raises the first error of a background step."""
+        self.wait_ahead()
+        pending, self._pending = self._pending, []
+        for fut in pending:
+            fut.result()
+
+    def close(self):
+        """Stop the threads (after drain(), or quietly after an error)."""
+        if self._after is not None:
+            self._after.shutdown(wait=True)
+            self._ahead_pool.shutdown(wait=True)
+        self._pending, self._ahead = [], None
+
+
+class _Done:
+    """Stand-in Future for steps run inline."""
+
+    def __init__(self, value):
+        self.value = value
+
+    def result(self):
+        return self.value
+
+
+class Lookahead:
+    """Iterator over loop_order() that can peek at the next index (for ahead())."""
+
+    _END = object()
+
+    def __init__(self, it):
+        self._it = iter(it)
+        self._next = self._END
+        self._peeked = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._peeked:
+            self._peeked = False
+            if self._next is self._END:
+                raise StopIteration
+            return self._next
+        return next(self._it)
+
+    def peek(self):
+        """Next index, or None at the end; an adaptive sampler picks it from the data so far."""
+        if not self._peeked:
+            self._next = next(self._it, self._END)
+            self._peeked = True
+        return None if self._next is self._END else self._next
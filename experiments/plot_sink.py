@@ -0,0 +1,121 @@
+# experiments/plot_sink.py
+"""
+Where experiments send their live plot data.
+
+run() functions never touch Qt-owned axes directly: they call plot.setup(...) once and
+plot.update(data) per point. In the GUI the plot is a PlotSink, a thread-safe buffer that
+keeps only the latest snapshot; the GUI thread picks it up on a timer (see
+experiments.mpl_canvas.LivePlot), so acquisition never waits for matplotlib. Passing a
+plain matplotlib Axes (scripts, notebooks) draws into it directly via AxesSink.
+"""
+import threading
+import time
+
+import numpy as np
+
+
+def errorbar_artists(ax, fmt="o", animated=False):
+    """Line for the averaged curve plus a LineCollection of error bars, both updatable."""
+    from matplotlib.collections import LineCollection
+    (line,) = ax.plot([], [], fmt, animated=animated)
+    bars = LineCollection([], colors=line.get_color(), animated=animated)
+    ax.add_collection(bars)
+    return line, bars
+
+
+def set_errorbars(line, bars, x, y, e):
+    line.set_data(x, y)
+    ok = np.isfinite(e) & np.isfinite(y)
+    bars.set_segments([((xi, yi - ei), (xi, yi + ei)) for xi, yi, ei in zip(x[ok], y[ok], e[ok])])
+
+
+def snapshot(data):
+    """(x, mean R, error) of the points measured so far in a SweepData."""
+    m = data.measured()
+    return data.x[m].copy(), data.mean("R")[m], data.sem("R")[m]
+
+
+class PlotSink:
+    """Latest-value buffer between a worker thread and the GUI."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.labels = None
+        self._xye = None
+        self.version = 0
+
+    def setup(self, title, xlabel, ylabel):
+        with self._lock:
+            self.labels = (title, xlabel, ylabel)
+            self._xye = None
+            self.version += 1
+
+    def update(self, data):
+        xye = snapshot(data)
+        with self._lock:
+            self._xye = xye
+            self.version += 1
+
+    def take(self):
+        """(version, labels, (x, y, err) or None) for the GUI thread."""
+        with self._lock:
+            return self.version, self.labels, self._xye
+
+
+class AxesSink:
+    """Draws straight into a matplotlib Axes (no GUI thread involved)."""
+
+    def __init__(self, ax):
+        self.ax = ax
+        self.line = self.bars = None
+
+    def setup(self, title, xlabel, ylabel):
+        self.ax.set_title(title)
+        self.ax.set_xlabel(xlabel)
+        self.ax.set_ylabel(ylabel)
+        self.ax.grid(True)
+        self.line, self.bars = errorbar_artists(self.ax)
+
+    def update(self, data):
+        set_errorbars(self.line, self.bars, *snapshot(data))
+        self.ax.relim(); self.ax.autoscale()
+
+
+def as_sink(plot):
+    """run() accepts a sink or a bare Axes."""
+    return plot if hasattr(plot, "setup") else AxesSink(plot)
+
+
+class NullSink:
+    """Discards plot data (headless runs)."""
+
+    def setup(self, title, xlabel, ylabel):
+        pass
+
+    def update(self, data):
+        pass
+
+
+class FileSink:
+    """Renders the live plot to an image file, at most once every `every_s` seconds."""
+
+    def __init__(self, path, every_s=10.0):
+        from matplotlib.figure import Figure
+        self.path = path
+        self.every_s = float(every_s)
+        self.fig = Figure(figsize=(6, 4), dpi=100, layout="constrained")
+        self.axes = AxesSink(self.fig.add_subplot(111))
+        self._last = None
+
+    def setup(self, title, xlabel, ylabel):
+        self.axes.setup(title, xlabel, ylabel)
+
+    def update(self, data):
+        self.axes.update(data)
+        now = time.monotonic()
+        if self._last is None or now - self._last >= self.every_s:
+            self.save()
+
+    def save(self):
+        self._last = time.monotonic()
+        self.fig.savefig(self.path)
@@ -1,119 +1,134 @@
 # experiments/pulsed_odmr.py
 """Pulsed ODMR: program PB for init/read + short MW pulse, read signal.
 """
-import time
 import numpy as np
-from spinapi import *
-from hardware.sr830_control import init_sr830, sr830_read_R
-from hardware.pulseblaster_control import pb_init_simple
-from hardware.windfreak_control import WindfreakSynth
-from PyQt6.QtCore import Qt, QObject, pyqtSignal, QThread
+from hardware.sr830_control import SETTLE_RTOL
+from hardware.pulseblaster_control import pb_load
+from experiments.sweep import run_sweep, MWDrive
+from experiments.adaptive import AdaptiveSampler
+from analysis.models import find_resonances
+from hardware.pb_sequence import PulseSequence, precompile, CH_REF, CH_LASER, CH_MW_I, CH_MW_TRIG
 
-# Channels
-CH_REF = (1 << 0)  # TTL to LIA
-CH_LASER   = (1 << 1)  # TTL to laser
-CH_MW_I = (1<<2) #TTL to I channel MW
+# External MW stepping: trigger pulse, then dark while the SynthHD relocks
+TRIG_PULSE_NS = 1000.0
+TRIG_SETTLE_NS = 1e6
 
-def pulse_creation(tref_us:float, pulse_us:float):
+def pulse_sequence(tref_us:float, pulse_us:float):
     #need values in ns, not us
     pulse_ns=pulse_us*1000
-    on_selector_dict = {1:CH_LASER,-1:CH_MW_I}
-    i=0
-    a=1
-    ref_us=tref_us/2
-    N_pulse=ref_us/pulse_us
-    if ref_us%pulse_us!=0:
-        raise ValueError("Tref/2 is not cleanly divisible by pulse length, fix it")
-    N_pulse=int(N_pulse)
-    
-    pb_start_programming(PULSE_PROGRAM)
-    while i<N_pulse:
-        pb_inst_pbonly(CH_REF|on_selector_dict[a],CONTINUE,0,pulse_ns)
-        a=a*-1
-        i=i+1
-    i=0
-    while i<N_pulse-1:
-        if a==-1:
-            pb_inst_pbonly(0, CONTINUE, 0, pulse_ns)
-        else:
-            pb_inst_pbonly(CH_LASER,CONTINUE,0, pulse_ns)
-        a=a*-1
-        i=i+1
-    if a==-1:
-        pb_inst_pbonly(0, BRANCH,0, pulse_ns)
+    # divisibility in whole clock ticks (float % misses e.g. 2.5 µs / 0.1 µs)
+    seq=PulseSequence()
+    half_ticks, pulse_ticks = seq.ticks(tref_us*500), seq.ticks(pulse_ns)
+    if pulse_ticks<=0 or half_ticks%pulse_ticks!=0:
+        raise ValueError(f"Tref/2 ({tref_us/2:g} µs) is not a whole number of {pulse_us:g} µs pulses, fix it")
+    N_pulse=half_ticks//pulse_ticks
+
+    # signal half alternates laser/MW, reference half alternates laser/dark so the laser
+    # pulses line up with the ones in the signal half
+    pairs, odd = divmod(N_pulse, 2)
+    seq.block([(CH_REF|CH_LASER,pulse_ns),(CH_REF|CH_MW_I,pulse_ns)], pairs)
+    if odd:
+        seq.block([(CH_REF|CH_LASER,pulse_ns)], 1)
+        seq.block([(0,pulse_ns),(CH_LASER,pulse_ns)], pairs)
+        seq.block([(0,pulse_ns)], 1)
     else:
-        pb_inst_pbonly(CH_LASER,CONTINUE,0,pulse_ns)
-        pb_inst_pbonly(0,BRANCH,0,pulse_ns)
-    pb_stop_programming()
+        seq.block([(CH_LASER,pulse_ns),(0,pulse_ns)], pairs)
+    return seq
+
+def step_sequence(tref_us:float, pulse_us:float):
+    # same sequence, but each start first steps the SynthHD sweep via its trigger input
+    return pulse_sequence(tref_us, pulse_us).once([(CH_MW_TRIG,TRIG_PULSE_NS),(0,TRIG_SETTLE_NS)])
+
+def pulse_creation(tref_us:float, pulse_us:float):
+    pb_load(pulse_sequence(tref_us, pulse_us))
 
 def stop_pulse():
-    pb_start_programming(PULSE_PROGRAM)
-    pb_inst_pbonly(0,BRANCH,0,100.0)
-    pb_stop_programming()
-
-def run(ax, emit, f_start_MHz=2.86, f_stop_MHz=2.90,dbm=-35.0, points=61,tref_us=250., pulse_us=5, loops=1):
-    # Init hardware
-    pb_init_simple()
-    rm, li, tau_LI_s = init_sr830()
-    mw=WindfreakSynth()
-    wait_s = max(1, 15 * float(tau_LI_s))
-    
-    f = np.linspace(f_start_MHz*1e6, f_stop_MHz*1e6, int(points))
-    C = []
-    ax.set_title("Pulsed ODMR")
-    ax.set_xlabel("MW frequency (Hz)")
-    ax.set_ylabel("R (V)")
-    ax.grid(True)
-    (line,) = ax.plot([], [], "o")
-    mw_on_flag=False
-    mw.set_power(1,dbm)
-    try:
-        pb_stop()
-        pb_reset()
-
-        loop_count=0
-        fvals=[]
-        Rvals=[]
-        while loop_count<loops:
-
-            for i, fi in enumerate(f):
-                if QThread.currentThread().isInterruptionRequested():
-                    emit(line="Interrupted by user.")
-                    break
-                pulse_creation(float(tref_us),float(pulse_us))
-                
-                mw.set_freq(1,fi)
-                time.sleep(1)
-                if mw_on_flag==False:
-                    mw.rf_on(1)
-                pb_start()    
-                time.sleep(wait_s)
-
-                R=sr830_read_R(li)
-                Rvals.append(R)
-                fvals.append(fi)
-
-                line.set_data(fvals,Rvals)
-                ax.relim(); ax.autoscale()
-                emit(line=f"f = {fi/1e9:.6f} GHz → R = {R:.4f} V", status=f"Point {(loop_count*len(f)+i+1)} / {(len(f)*loops)}", progress=((loop_count*len(f))+i+1)/(loops*len(f)))
-
-                pb_stop()
-                pb_reset()
-                stop_pulse()
-                pb_start()
-                time.sleep(wait_s)
-                pb_stop()
-                pb_reset
-            loop_count=loop_count+1
+    pb_load(PulseSequence().block([(0,100.0)]))
+
+
+class SteppedMW(MWDrive):
+    """The SynthHD steps through `f`, one frequency per point.
+
+    With trigger="software" each step is a serial write, and with pipelining it happens
+    ahead, in the previous point's dark phase. With "external" the frequency table steps
+    on a trigger pulse from the PB: from the second point on the step program plays,
+    whose prologue sends that pulse (restarted at every point).
+    """
+
+    def __init__(self, f, dbm, trigger, sampler, tref_us, pulse_us):
+        self.f, self.dbm, self.trigger, self.sampler = f, dbm, trigger, sampler
+        self.tref_us, self.pulse_us = float(tref_us), float(pulse_us)
+        self.settles = []
+
+    @property
+    def retunes(self):
+        return self.trigger == "software"
+
+    def programs(self):
+        # checked against the board limits and compiled before any hardware is touched
+        self.seq = precompile(pulse_sequence(self.tref_us, self.pulse_us))
+        self.seq_step = precompile(step_sequence(self.tref_us, self.pulse_us)) if self.trigger == "external" else None
+        return self.program
+
+    def program(self, i):
+        # same program at every frequency, so it only reprograms after a dark phase
+        return self.seq_step if self.seq_step is not None and i > 0 else self.seq
+
+    def start(self, mw, timer, emit, resumed):
+        super().start(mw, timer, emit, resumed)
+        mw.set_power(1, self.dbm)
+        if resumed and self.seq_step is not None:
+            # the hardware sweep can only step forward one point at a time
+            emit(line="Resumed run: stepping the MW frequency in software")
+            self.trigger, self.seq_step = "software", None
+
+    def loop(self):
+        # frequency table goes to the synth once per loop, back at the first point
+        with self.timer.span("mw"):
+            self.settles.append(self.mw.sweep_load(1, self.f, trigger=self.trigger))
+
+    def point(self, i, pipe):
+        with self.timer.span("mw"):
+            if pipe.has_ahead(i):
+                # retuned during the last dark phase
+                self.settles.append(pipe.wait_ahead())
+            elif i > 0 or self.sampler is not None:
+                # adaptive runs jump around the grid, also back to its first point
+                self.settles.append(self.mw.sweep_step(1, i))
+            self.mw.rf_on(1)  # no serial write once it is on
+
+    def ahead(self, i, pipe):
+        pipe.ahead(i, self.mw.sweep_step, 1, i)
+
+    def finish(self, data):
+        mw, emit = self.mw, self.emit
+        mw.sweep_stop()
         mw.rf_off(1)
-        mw_on_flag=False
+        if self.trigger == "software" and self.settles:
+            emit(line=f"MW settle: mean {np.mean(self.settles)*1e3:.2f} ms, max {np.max(self.settles)*1e3:.2f} ms")
+        if self.sampler is not None:
+            m = data.measured()
+            for centre, fwhm in find_resonances(self.f[m], data.mean("R")[m]):
+                emit(line=f"Resonance near {centre/1e9:.6f} GHz, FWHM ~ {fwhm/1e6:.3f} MHz")
+        emit(line=f"MW serial writes: {mw.writes} sent, {mw.writes_avoided} skipped (unchanged)")
 
-    finally:
-        try: pb_stop(); pb_reset(); pb_close()
-        except: pass
-        try: li.close(); rm.close()
-        except: pass
-        try: mw.close()
-        except: pass
 
-    return {"freq_Hz": fvals, "R_V": Rvals}
+def run(ax, emit, f_start_MHz=2.86, f_stop_MHz=2.90,dbm=-35.0, points=61,tref_us=250., pulse_us=5, loops=1, settle_rtol=SETTLE_RTOL, dark_reset=False, buffer_samples=0, mw_trigger="software", sampling="uniform", coarse_points=0, live_fit=False, stop_rtol=0.0, pipelined=True, session=None, store=None, cancel=None):
+    if sampling not in ("uniform", "adaptive"):
+        raise ValueError(f"Unknown sampling {sampling!r}, expected 'uniform' or 'adaptive'")
+    if sampling=="adaptive":
+        # coarse pass, then the budget goes where the curve changes (see experiments.adaptive)
+        sampler = AdaptiveSampler(f_start_MHz*1e6, f_stop_MHz*1e6, int(points), int(coarse_points))
+        f = sampler.x
+        if mw_trigger=="external":
+            # the hardware sweep only steps forward through an even grid
+            emit(line="Adaptive sampling: stepping the MW frequency in software")
+            mw_trigger = "software"
+    else:
+        sampler = None
+        f = np.linspace(f_start_MHz*1e6, f_stop_MHz*1e6, int(points))
+    drive = SteppedMW(f, dbm, mw_trigger, sampler, tref_us, pulse_us)
+    return run_sweep(ax, emit, "podmr", f, sampler, drive.programs, ("Pulsed ODMR", "MW frequency (Hz)", "R (V)"), "freq_Hz",
+                     lambda fi, R: f"f = {fi/1e9:.6f} GHz → R = {R:.4f} V", loops, drive=drive, fit_window=(f[0], f[-1]),
+                     settle_rtol=settle_rtol, dark_reset=dark_reset, buffer_samples=buffer_samples, live_fit=live_fit,
+                     stop_rtol=stop_rtol, pipelined=pipelined, session=session, store=store, cancel=cancel)
@@ -1,137 +1,52 @@
 # experiments/rabi_experiment.py
 """Rabi experiment: program PB for varying length MW pulse (MW tau) with laser init/readout
 """
-import time
-import numpy as np
-from spinapi import *
-from hardware.sr830_control import init_sr830, sr830_read_R
-from hardware.pulseblaster_control import pb_init_simple
-from hardware.windfreak_control import WindfreakSynth
-from PyQt6.QtCore import Qt, QObject, pyqtSignal, QThread
+from hardware.sr830_control import SETTLE_RTOL
+from hardware.pulseblaster_control import pb_load
+from experiments.sweep import run_sweep, FixedTone
+from experiments.adaptive import MODELS, sweep_points
+from hardware.pb_sequence import PulseSequence, SweepPrograms, CH_REF, CH_LASER, CH_MW_I
 
-# Channels
-CH_REF = (1 << 0)  # TTL to LIA
-CH_LASER   = (1 << 1)  # TTL to laser
-CH_MW_I = (1<<2) #TTL to I channel MW
-
-def pulse_creation(las_pulse_us:float, tau_us:float, padding_us:float, N:int, tiny_pad:float):
+def pulse_sequence(las_pulse_us:float, tau_us:float, padding_us:float, N:int, tiny_pad:float):
     #PB needs times in ns, not us
     las_pulse_ns=las_pulse_us*1000
     tau_ns=tau_us*1000
     padding_ns=padding_us*1000
-    pb_start_programming(PULSE_PROGRAM)
-    i=0
-    while i<N:
-        pb_inst_pbonly(CH_REF|CH_LASER,CONTINUE,0,las_pulse_ns)
-        pb_inst_pbonly(CH_REF,CONTINUE,0,tiny_pad)
-        pb_inst_pbonly(CH_REF|CH_MW_I,CONTINUE,0,tau_ns)
-        pb_inst_pbonly(CH_REF,CONTINUE,0,padding_ns)
-        i=i+1
-    i=0
-    while i<N-1:
-        pb_inst_pbonly(CH_LASER,CONTINUE,0,las_pulse_ns)
-        pb_inst_pbonly(0,CONTINUE,0,tiny_pad+tau_ns+padding_ns)
-        i=i+1
-    pb_inst_pbonly(CH_LASER,CONTINUE,0,las_pulse_ns)
-    pb_inst_pbonly(0,BRANCH,0,padding_ns+tau_ns)
-    pb_stop_programming()
+    seq=PulseSequence()
+    seq.block([(CH_REF|CH_LASER,las_pulse_ns),(CH_REF,tiny_pad),(CH_REF|CH_MW_I,tau_ns),(CH_REF,padding_ns)], N)
+    seq.block([(CH_LASER,las_pulse_ns),(0,tiny_pad+tau_ns+padding_ns)], N-1)
+    seq.block([(CH_LASER,las_pulse_ns),(0,tiny_pad+padding_ns+tau_ns)], 1)
+    return seq
 
 
-def inverse_pulse_creation(las_pulse_us:float, tau_us:float, padding_us:float, N:int, tiny_pad:float):
+def inverse_pulse_sequence(las_pulse_us:float, tau_us:float, padding_us:float, N:int, tiny_pad:float):
     #PB needs times in ns, not us
     las_pulse_ns=las_pulse_us*1000
     tau_ns=tau_us*1000
     padding_ns=padding_us*1000
-    pb_start_programming(PULSE_PROGRAM)
-    i=0
-    while i<N:
-        pb_inst_pbonly(CH_LASER,CONTINUE,0,las_pulse_ns)
-        pb_inst_pbonly(0,CONTINUE,0,tiny_pad+tau_ns+padding_ns)
-        i=i+1
-    i=0
-    while i<N-1:
-        pb_inst_pbonly(CH_REF|CH_LASER,CONTINUE,0,las_pulse_ns)
-        pb_inst_pbonly(CH_REF,CONTINUE,0,tiny_pad)
-        pb_inst_pbonly(CH_REF|CH_MW_I,CONTINUE,0,tau_ns)
-        pb_inst_pbonly(CH_REF,CONTINUE,0,padding_ns)
-        i=i+1
-    i=0
-    pb_inst_pbonly(CH_REF|CH_LASER,CONTINUE,0,las_pulse_ns)
-    pb_inst_pbonly(CH_REF,CONTINUE,0,tiny_pad)
-    pb_inst_pbonly(CH_REF|CH_MW_I,CONTINUE,0,tau_ns)
-    pb_inst_pbonly(0,BRANCH,0,padding_ns)
-    pb_stop_programming()
-
-def stop_pulse():
-    pb_start_programming(PULSE_PROGRAM)
-    pb_inst_pbonly(0,BRANCH,0,100.0)
-    pb_stop_programming()
-
-def run(ax, emit, mw_freq_MHz=2870, dBm=-20.0, N=250, max_mw_tau_us=5.0, min_padding_us=5.0, las_pulse_us=10.0, points=31, loops=3):
-    #init hardware
-    pb_init_simple()
-    rm, li, tau_LI_s = init_sr830()
-    mw=WindfreakSynth()
-    wait_s=max(1,15*float(tau_LI_s))
-    tiny_pad=50
-    tau_space_us = np.linspace(0.05,max_mw_tau_us, int(points))
-    tref_us = N*(max_mw_tau_us+min_padding_us+las_pulse_us+tiny_pad)
-
-    ax.set_title("Rabi")
-    ax.set_xlabel(r"τ ($\mu$s)")
-    ax.set_ylabel("R (V)")
-    ax.grid(True)
-    (line,)=ax.plot([],[],"o")
-
-    try:
-        pb_stop()
-        pb_reset()
+    seq=PulseSequence()
+    seq.block([(CH_LASER,las_pulse_ns),(0,tiny_pad+tau_ns+padding_ns)], N)
+    seq.block([(CH_REF|CH_LASER,las_pulse_ns),(CH_REF,tiny_pad),(CH_REF|CH_MW_I,tau_ns),(CH_REF,padding_ns)], N-1)
+    seq.block([(CH_REF|CH_LASER,las_pulse_ns),(CH_REF,tiny_pad),(CH_REF|CH_MW_I,tau_ns),(0,padding_ns)], 1)
+    return seq
 
-        loop_count=0
-        tau_vals=[]
-        Rvals=[]
-        mw.set_freq(1,mw_freq_MHz*1e6)
-        mw.set_power(1,dBm)
-        mw.rf_on(1)
-        while loop_count<loops:
-            for i, ti in enumerate(tau_space_us):
-                if QThread.currentThread().isInterruptionRequested():
-                    emit(line="Interrupted by user.")
-                    break
 
-                tau_us=ti
-
-                padding_us=las_pulse_us-tau_us
-                # inverse_pulse_creation(las_pulse_us,tau_us,padding_us,N,tiny_pad)
-                pulse_creation(las_pulse_us,tau_us,padding_us,N,tiny_pad)
-                pb_start()
-
-                time.sleep(wait_s)
-
-                R=sr830_read_R(li)
-
-                Rvals.append(R)
-                tau_vals.append(ti)
+def pulse_creation(las_pulse_us:float, tau_us:float, padding_us:float, N:int, tiny_pad:float):
+    pb_load(pulse_sequence(las_pulse_us, tau_us, padding_us, N, tiny_pad))
 
-                line.set_data(tau_vals,Rvals)
-                ax.relim(); ax.autoscale()
-                emit(line=f"{ti:.6f} us → R = {R:.4f} V", status=f"Point {(loop_count*len(tau_space_us)+i+1)} / {(len(tau_space_us)*loops)}", progress=((loop_count*len(tau_space_us))+i+1)/(loops*len(tau_space_us)))
 
-                pb_stop()
-                pb_reset()
-                stop_pulse()
-                pb_start()
-                time.sleep(wait_s)
-                pb_stop()
-                pb_reset
-            loop_count=loop_count+1
+def inverse_pulse_creation(las_pulse_us:float, tau_us:float, padding_us:float, N:int, tiny_pad:float):
+    pb_load(inverse_pulse_sequence(las_pulse_us, tau_us, padding_us, N, tiny_pad))
 
-    finally:
-        try:pb_stop(); pb_reset(); pb_close()
-        except:pass
-        try: li.close();rm.close()
-        except:pass
-        try: mw.close()
-        except:pass
+def stop_pulse():
+    pb_load(PulseSequence().block([(0,100.0)]))
 
-    return {"tau_us":tau_vals, "R_V":Rvals}
\ No newline at end of file
+def run(ax, emit, mw_freq_MHz=2870, dBm=-20.0, N=250, max_mw_tau_us=5.0, min_padding_us=5.0, las_pulse_us=10.0, points=31, loops=3, settle_rtol=SETTLE_RTOL, dark_reset=False, buffer_samples=0, sampling="uniform", live_fit=False, stop_rtol=0.0, pipelined=True, session=None, store=None, cancel=None):
+    tiny_pad=50
+    # uniform, log or adaptive (refits the Rabi frequency after every point to choose the next τ)
+    tau_space_us, sampler = sweep_points(sampling, 0.05, float(max_mw_tau_us), int(points), MODELS["rabi"]())
+    programs = lambda: SweepPrograms(lambda t: pulse_sequence(las_pulse_us, t, las_pulse_us-t, N, tiny_pad), tau_space_us, "τ", " µs")
+    return run_sweep(ax, emit, "rabi", tau_space_us, sampler, programs, ("Rabi", r"τ ($\mu$s)", "R (V)"), "tau_us",
+                     lambda ti, R: f"{ti:.6f} us → R = {R:.4f} V", loops, drive=FixedTone(mw_freq_MHz*1e6, dBm),
+                     settle_rtol=settle_rtol, dark_reset=dark_reset, buffer_samples=buffer_samples, live_fit=live_fit,
+                     stop_rtol=stop_rtol, pipelined=pipelined, session=session, store=store, cancel=cancel)
@@ -0,0 +1,68 @@
+# experiments/registry.py
+"""Name -> experiment module, so the GUI, the CLI and the scheduler find runners the same way."""
+import argparse
+import importlib
+import inspect
+
+# short name: (module, display name)
+EXPERIMENTS = {
+    "t1":     ("experiments.t1_experiment", "T1"),
+    "podmr":  ("experiments.pulsed_odmr", "Pulsed ODMR"),
+    "rabi":   ("experiments.rabi_experiment", "Rabi"),
+    "ramsey": ("experiments.ramsey_experiment", "Ramsey"),
+    "hahn":   ("experiments.hahn_experiment", "Hahn"),
+}
+
+# run() arguments supplied by whoever drives the run, not experiment parameters
+RUNTIME_ARGS = ("ax", "emit", "session", "store", "cancel")
+
+
+def names():
+    return list(EXPERIMENTS)
+
+
+def display_name(name):
+    return EXPERIMENTS[name][1]
+
+
+def get_runner(name):
+    if name not in EXPERIMENTS:
+        raise KeyError(f"Unknown experiment {name!r}, expected one of {names()}")
+    return importlib.import_module(EXPERIMENTS[name][0]).run
+
+
+def default_params(name):
+    """Experiment parameters of run() with their defaults."""
+    sig = inspect.signature(get_runner(name))
+    return {k: p.default for k, p in sig.parameters.items()
+            if k not in RUNTIME_ARGS and p.default is not inspect.Parameter.empty}
+
+
+def _bool(text):
+    if text.lower() in ("1", "true", "yes", "on"):
+        return True
+    if text.lower() in ("0", "false", "no", "off"):
+        return False
+    raise argparse.ArgumentTypeError(f"expected true/false, got {text!r}")
+
+
+def _number(text):
+    # int defaults (points, loops, but also e.g. mw_freq_MHz=2870) accept floats too
+    try:
+        return int(text)
+    except ValueError:
+        return float(text)
+
+
+def param_parser(name):
+    """argparse parser with one --option per experiment parameter."""
+    p = argparse.ArgumentParser(prog=f"python -m experiments {name}", add_help=False)
+    for key, default in default_params(name).items():
+        if isinstance(default, bool):
+            kind = _bool
+        elif isinstance(default, int):
+            kind = _number
+        else:
+            kind = type(default) if default is not None else str
+        p.add_argument(f"--{key}", type=kind, default=default)
+    return p
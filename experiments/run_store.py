@@ -0,0 +1,226 @@
+# experiments/run_store.py
+"""
+Crash-safe run store: every acquired point is appended to disk as it comes in.
+
+With h5py installed a run is one HDF5 file with resizable, chunked datasets opened in
+SWMR mode, so it can be read (e.g. h5py.File(path, "r", swmr=True)) while it is still
+being written. Without h5py a run is a directory holding params.json and append-only
+chunk_#####.npz files. Either way the full parameter dict, a timestamp per point and
+all lock-in channels are stored, and at most the last unflushed chunk is lost in a crash.
+The run's per-phase timing (experiments.timing) is saved in the end record.
+
+Runs go to ./runs (or $NV_RUN_DIR); load_run() reads both formats back. The stored points
+double as the run's checkpoint: RunStore.resume() reopens an interrupted run and
+restore_into() tells run() which (loop, point) pairs are already done.
+"""
+import csv
+import glob
+import json
+import os
+import time
+
+import numpy as np
+
+try:
+    import h5py
+except ImportError:  # fall back to .npz chunks
+    h5py = None
+
+RUN_DIR = os.environ.get("NV_RUN_DIR", "runs")
+
+# one row per point
+COLUMNS = ("t_unix", "loop", "index", "x", "X", "Y", "R", "THETA", "R_err")
+
+FLUSH_POINTS = 16      # flush after this many points ...
+FLUSH_S = 5.0          # ... or this many seconds, whichever comes first
+
+
+def _jsonable(params):
+    return {k: v for k, v in params.items() if isinstance(v, (str, int, float, bool, type(None), list, tuple))}
+
+
+class RunStore:
+
+    def __init__(self, experiment: str, params: dict, run_dir=None, fmt=None):
+        self.experiment = experiment
+        self.params = _jsonable(params)
+        self.started = time.time()
+        stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(self.started))
+        base = os.path.join(run_dir or RUN_DIR, f"{stamp}_{experiment.replace(' ', '_')}")
+        os.makedirs(run_dir or RUN_DIR, exist_ok=True)
+        self.fmt = fmt or ("h5" if h5py is not None else "npz")
+        # queued runs can start within the same second
+        n, unique = 1, base
+        while os.path.exists(unique) or os.path.exists(unique + ".h5"):
+            n += 1
+            unique = f"{base}-{n}"
+        base = unique
+        self._pending = []
+        self._last_flush = time.monotonic()
+        self._chunk = 0
+        self.n_points = 0
+        self.closed = False
+        self.timing = None  # set by run() (experiments.timing), saved with the end record
+        meta = dict(experiment=experiment, params=self.params, started=self.started, columns=COLUMNS)
+
+        if self.fmt == "h5":
+            self.path = base + ".h5"
+            self._h5 = h5py.File(self.path, "w", libver="latest")
+            self._h5.attrs["meta"] = json.dumps(meta)
+            for name in COLUMNS:
+                self._h5.create_dataset(name, shape=(0,), maxshape=(None,), chunks=(max(FLUSH_POINTS, 64),), dtype="f8")
+            self._h5.swmr_mode = True
+        elif self.fmt == "npz":
+            self.path = base
+            os.makedirs(self.path)
+            self._write_json("params.json", meta)
+        else:
+            raise ValueError(f"Unknown run store format {self.fmt!r}, expected 'h5' or 'npz'")
+
+    @classmethod
+    def resume(cls, path, params=None):
+        """Reopen an unfinished run to append to it. `rows` holds what is already stored.
+
+        With `params` given they must match the run's saved parameters.
+        """
+        meta, rows = load_run(path)
+        if params is not None:
+            saved, given = meta["params"], json.loads(json.dumps(_jsonable(params)))
+            diff = sorted(k for k in set(saved) | set(given) if saved.get(k) != given.get(k))
+            if diff:
+                raise ValueError(f"Parameters differ from the saved run: {diff}")
+        self = cls.__new__(cls)
+        self.experiment = meta["experiment"]
+        self.params = meta["params"]
+        self.started = meta["started"]
+        self.path = path
+        self.fmt = "npz" if os.path.isdir(path) else "h5"
+        self._pending = []
+        self._last_flush = time.monotonic()
+        self.n_points = len(rows["x"])
+        self.closed = False
+        self.timing = None
+        self.rows = rows
+        if self.fmt == "h5":
+            # drop the end stamp before SWMR mode makes attributes read-only again
+            with h5py.File(path, "r+") as f:
+                if "end" in f.attrs:
+                    del f.attrs["end"]
+            self._h5 = h5py.File(path, "a", libver="latest")
+            self._h5.swmr_mode = True
+        else:
+            self._chunk = len(glob.glob(os.path.join(path, "chunk_*.npz")))
+            end = os.path.join(path, "end.json")
+            if os.path.exists(end):
+                os.remove(end)
+        return self
+
+    def restore_into(self, data):
+        """Feed the points already on disk into a SweepData; returns the (loop, index) done."""
+        rows = getattr(self, "rows", None)
+        done = set()
+        if rows is None:
+            return done
+        for j in range(len(rows["x"])):
+            key = (int(rows["loop"][j]), int(rows["index"][j]))
+            if key in done or key[0] >= data.loops or key[1] >= len(data.x):
+                continue
+            data.add(*key, {c: rows[c][j] for c in ("X", "Y", "R", "THETA", "R_err")})
+            done.add(key)
+        return done
+
+    def _write_json(self, name, data):
+        tmp = os.path.join(self.path, name + ".tmp")
+        with open(tmp, "w") as f:
+            json.dump(data, f, indent=1)
+        os.replace(tmp, os.path.join(self.path, name))
+
+    def append(self, loop: int, index: int, x: float, pt: dict):
+        """Add one point (pt is the dict from sr830_point)."""
+        self._pending.append((time.time(), loop, index, x, pt["X"], pt["Y"], pt["R"], pt["THETA"], pt["R_err"]))
+        self.n_points += 1
+        if len(self._pending) >= FLUSH_POINTS or time.monotonic() - self._last_flush > FLUSH_S:
+            self.flush()
+
+    def flush(self):
+        self._last_flush = time.monotonic()
+        if not self._pending:
+            return
+        rows = np.array(self._pending, dtype=float)
+        self._pending = []
+        if self.fmt == "h5":
+            for j, name in enumerate(COLUMNS):
+                ds = self._h5[name]
+                n = ds.shape[0]
+                ds.resize((n + len(rows),))
+                ds[n:] = rows[:, j]
+                ds.flush()
+        else:
+            name = f"chunk_{self._chunk:05d}.npz"
+            tmp = os.path.join(self.path, name + ".tmp")
+            with open(tmp, "wb") as f:
+                np.savez(f, **{c: rows[:, j] for j, c in enumerate(COLUMNS)})
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, os.path.join(self.path, name))
+            self._chunk += 1
+
+    def close(self, status="complete"):
+        """Flush the tail and record how the run ended (complete / interrupted / error)."""
+        if self.closed:
+            return
+        self.flush()
+        self.closed = True
+        end = dict(status=status, finished=time.time(), n_points=self.n_points)
+        if self.timing is not None:
+            end["timing"] = self.timing  # of this session only, for a resumed run
+        if self.fmt == "h5":
+            self._h5.close()
+            # attributes cannot be added in SWMR mode, reopen to stamp the end state
+            with h5py.File(self.path, "r+") as f:
+                f.attrs["end"] = json.dumps(end)
+        else:
+            self._write_json("end.json", end)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close("complete" if exc_type is None else "error")
+
+
+def write_result_csv(path, result):
+    """Write a run() result dict as CSV: every column as long as the first one."""
+    keys = list(result.keys())
+    n = len(result[keys[0]])
+    keys = [k for k in keys if np.ndim(result[k]) == 1 and len(result[k]) == n]
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(keys)
+        for row in zip(*(result[k] for k in keys)):
+            writer.writerow(row)
+
+
+def load_run(path):
+    """Read a run back: (meta dict, {column: array}). Works on runs still being written."""
+    if os.path.isdir(path):
+        with open(os.path.join(path, "params.json")) as f:
+            meta = json.load(f)
+        end = os.path.join(path, "end.json")
+        if os.path.exists(end):
+            with open(end) as f:
+                meta["end"] = json.load(f)
+        chunks = sorted(glob.glob(os.path.join(path, "chunk_*.npz")))
+        data = {c: [] for c in COLUMNS}
+        for chunk in chunks:
+            with np.load(chunk) as z:
+                for c in COLUMNS:
+                    data[c].append(z[c])
+        return meta, {c: (np.concatenate(v) if v else np.empty(0)) for c, v in data.items()}
+    if h5py is None:
+        raise ImportError("h5py is needed to read .h5 runs")
+    with h5py.File(path, "r", swmr=True) as f:
+        meta = json.loads(f.attrs["meta"])
+        if "end" in f.attrs:
+            meta["end"] = json.loads(f.attrs["end"])
+        return meta, {c: f[c][()] for c in COLUMNS}
@@ -0,0 +1,195 @@
+# experiments/scheduler.py
+"""
+Queue of (experiment, params) jobs run back to back on one hardware session.
+
+The queue lives in a JSON file that is rewritten after every state change, so an
+overnight campaign can be built up front, survives a crash or a closed terminal, and
+picks up at the first unfinished job when started again:
+
+    python -m experiments.scheduler campaign.json add podmr --dbm -20 --loops 3 --note "coil 75 mA"
+    python -m experiments.scheduler campaign.json add t1 --init_us 100
+    python -m experiments.scheduler campaign.json list
+    python -m experiments.scheduler campaign.json run [--sim]
+
+A failed job is recorded and the queue moves on to the next one. A job that is run again
+(after a crash or with --retry) resumes its run file rather than starting over.
+"""
+import argparse
+import json
+import os
+import signal
+import sys
+import threading
+import time
+import traceback
+
+from hardware import backend
+from experiments import registry
+from experiments.cancel import CancelToken
+from experiments.plot_sink import NullSink
+from experiments.run_store import RunStore
+
+PENDING, RUNNING, DONE, FAILED, CANCELLED = "pending", "running", "done", "failed", "cancelled"
+
+
+class JobQueue:
+    """Jobs persisted to `path` as JSON."""
+
+    def __init__(self, path):
+        self.path = path
+        self.jobs = []
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            self.load()
+
+    def load(self):
+        with open(self.path) as f:
+            self.jobs = json.load(f)["jobs"]
+        # a job left 'running' was cut off by a crash: run it again
+        for job in self.jobs:
+            if job["status"] == RUNNING:
+                job["status"] = PENDING
+
+    def save(self):
+        with self._lock:
+            tmp = self.path + ".tmp"
+            with open(tmp, "w") as f:
+                json.dump({"jobs": self.jobs}, f, indent=1)
+            os.replace(tmp, self.path)
+
+    def add(self, experiment, params=None, note=""):
+        """Queue a job; parameters not given take run()'s defaults, so the record is complete."""
+        defaults = registry.default_params(experiment)
+        unknown = set(params or {}) - set(defaults)
+        if unknown:
+            raise ValueError(f"Unknown parameters for {experiment}: {sorted(unknown)}")
+        job = dict(id=max((j["id"] for j in self.jobs), default=0) + 1,
+                   experiment=experiment, params={**defaults, **(params or {})}, note=note,
+                   status=PENDING, run_path=None, started=None, finished=None, error=None)
+        self.jobs.append(job)
+        self.save()
+        return job
+
+    def next_pending(self):
+        return next((j for j in self.jobs if j["status"] == PENDING), None)
+
+    def update(self, job, **fields):
+        job.update(fields)
+        self.save()
+
+    def reset(self, statuses=(FAILED, CANCELLED)):
+        """Put failed / cancelled jobs back in the queue."""
+        for job in self.jobs:
+            if job["status"] in statuses:
+                job.update(status=PENDING, error=None)
+        self.save()
+
+
+class Scheduler:
+    """Works through a JobQueue on one HardwareSession (opened once for all jobs)."""
+
+    def __init__(self, queue: JobQueue, session=None, emit=None, plot_factory=NullSink):
+        self.queue = queue
+        self.session = session
+        self.emit = emit or (lambda **kwargs: None)
+        self.plot_factory = plot_factory
+        self.cancel = CancelToken()
+
+    def run(self):
+        from hardware.session import HardwareSession
+        own = self.session is None
+        session = self.session or HardwareSession()
+        try:
+            while not self.cancel.cancelled():
+                job = self.queue.next_pending()
+                if job is None:
+                    break
+                self.run_job(job, session)
+        finally:
+            if own:
+                session.close()
+
+    def run_job(self, job, session):
+        name = registry.display_name(job["experiment"])
+        self.emit(line=f"Job {job['id']}: {name} {job['note']}".rstrip())
+        store = None
+        try:
+            if job["run_path"] and os.path.exists(job["run_path"]):
+                # cut short earlier (crash, Ctrl+C, error): only take the missing points
+                store = RunStore.resume(job["run_path"], job["params"])
+            else:
+                store = RunStore(name, job["params"])
+            self.queue.update(job, status=RUNNING, started=time.time(), run_path=store.path)
+            run = registry.get_runner(job["experiment"])
+            # a job's own token: an early stop (live fit at target) ends this job, not the queue
+            cancel = self.cancel.child()
+            run(self.plot_factory(), self.emit, session=session, store=store, cancel=cancel, **job["params"])
+            status = cancel.end_status()
+            store.close(status)
+        except InterruptedError as e:
+            # stopped before the hardware was free
+            self.emit(line=f"Job {job['id']}: {e}")
+            status = "interrupted"
+        except Exception as e:
+            # also an unreadable run file or one with other parameters: fail this job only
+            if store is not None:
+                store.close("error")
+            self.queue.update(job, status=FAILED, finished=time.time(), error=f"{e}\n{traceback.format_exc()}")
+            self.emit(line=f"Job {job['id']} failed: {e}")
+            return
+        finally:
+            # a second Ctrl+C (KeyboardInterrupt) still leaves a resumable run file
+            if store is not None:
+                store.close("interrupted")
+        if status == "interrupted":
+            self.queue.update(job, status=CANCELLED, finished=time.time())
+        else:
+            self.queue.update(job, status=DONE, finished=time.time())
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(prog="python -m experiments.scheduler", description="Queue of experiment runs.")
+    ap.add_argument("queue", help="queue file (JSON)")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    add = sub.add_parser("add", help="append a job; experiment parameters as --name value")
+    add.add_argument("experiment", choices=registry.names())
+    add.add_argument("--note", default="")
+    sub.add_parser("list", help="show the queue")
+    run = sub.add_parser("run", help="run every pending job")
+    run.add_argument("--sim", action="store_true", help="use the simulated instruments")
+    run.add_argument("--retry", action="store_true", help="re-queue failed and cancelled jobs first")
+    args, rest = ap.parse_known_args(argv)
+
+    queue = JobQueue(args.queue)
+    if args.cmd == "add":
+        defaults = registry.default_params(args.experiment)
+        given = vars(registry.param_parser(args.experiment).parse_args(rest))
+        job = queue.add(args.experiment, {k: v for k, v in given.items() if v != defaults[k]}, note=args.note)
+        print(f"Queued job {job['id']}: {args.experiment}")
+    elif args.cmd == "list":
+        for job in queue.jobs:
+            print(f"{job['id']:>3}  {job['status']:<9}  {job['experiment']:<7} {job['note']}")
+    else:
+        if rest:
+            ap.error(f"unrecognized arguments: {' '.join(rest)}")
+        if args.sim:
+            backend.use_backend("sim")
+        if args.retry:
+            queue.reset()
+        sched = Scheduler(queue, emit=lambda **kw: "line" in kw and print(kw["line"]))
+
+        def on_sigint(signum, frame):
+            if sched.cancel.cancelled():
+                raise KeyboardInterrupt
+            print("Stopping after the current point (Ctrl+C again to abort)…", file=sys.stderr)
+            sched.cancel.cancel()
+        signal.signal(signal.SIGINT, on_sigint)
+        sched.run()
+        counts = {}
+        for job in queue.jobs:
+            counts[job["status"]] = counts.get(job["status"], 0) + 1
+        print(", ".join(f"{n} {s}" for s, n in counts.items()))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
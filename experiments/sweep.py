@@ -0,0 +1,170 @@
+# experiments/sweep.py
+"""
+The point loop shared by the pulsed experiments.
+
+Rabi, Ramsey, Hahn, T1 and pulsed ODMR measure the same way: for every point of every
+loop, play that point's PB program, settle and read the lock-in, hand the bookkeeping to
+a PointPipeline and optionally go dark so the lock-in relaxes. run_sweep() owns that loop
+and everything around it (session, cancel, SpanTimer, live fit, resumed runs). An
+experiment's run() only picks its sweep values and builds its sequences:
+
+    tau_us, sampler = sweep_points(sampling, 0.05, max_tau_us, points, MODELS["rabi"]())
+    return run_sweep(ax, emit, "rabi", tau_us, sampler,
+                     lambda: SweepPrograms(lambda t: pulse_sequence(..., t, ...), tau_us, "τ", " µs"),
+                     ("Rabi", "τ (µs)", "R (V)"), "tau_us", line, loops, drive=FixedTone(f_Hz, dbm), ...)
+
+programs() runs in the "compile" span before the hardware is touched and returns
+program(i), the PulseSequence of point i (a SweepPrograms is one); a program with a
+prologue is restarted at its point so the prologue plays again. `drive` is the MW side:
+None for all-optical runs (no synth), FixedTone for a fixed frequency, or an MWDrive
+subclass that retunes per point (pulsed ODMR).
+"""
+from hardware.sr830_control import sr830_filter_slope, sr830_settle, sr830_point, SETTLE_RTOL
+from hardware.pulseblaster_control import pb_run_sequence, pb_dark, pb_stop, pb_reset
+from hardware.session import HardwareSession
+from experiments.sweep_data import SweepData
+from experiments.plot_sink import as_sink
+from experiments.cancel import CancelToken
+from experiments.online_fit import OnlineFitter
+from experiments.timing import SpanTimer
+from experiments.pipeline import PointPipeline, Lookahead
+from experiments.adaptive import loop_order
+
+
+class MWDrive:
+    """MW side of a sweep; every step does nothing by default.
+
+    run_sweep calls start() once the synth is open, loop() at the start of every loop,
+    point(i) before the PB starts, ahead(i) in the dark phase when `retunes` is set and
+    finish(data) after the last point. Steps that talk to the synth go in timer.span("mw").
+    """
+
+    retunes = False
+
+    def start(self, mw, timer, emit, resumed):
+        self.mw, self.timer, self.emit = mw, timer, emit
+
+    def loop(self):
+        pass
+
+    def point(self, i, pipe):
+        pass
+
+    def ahead(self, i, pipe):
+        pass
+
+    def finish(self, data):
+        pass
+
+
+class FixedTone(MWDrive):
+    """Channel 1 on at one frequency for the whole run."""
+
+    def __init__(self, freq_Hz, dbm):
+        self.freq_Hz, self.dbm = freq_Hz, dbm
+
+    def start(self, mw, timer, emit, resumed):
+        super().start(mw, timer, emit, resumed)
+        mw.set_freq(1, self.freq_Hz)
+        mw.set_power(1, self.dbm)
+        mw.rf_on(1)
+
+
+def run_sweep(ax, emit, experiment, x, sampler, programs, labels, x_key, line, loops, drive=None, fit_window=None,
+              settle_rtol=SETTLE_RTOL, dark_reset=False, buffer_samples=0, live_fit=False, stop_rtol=0.0,
+              pipelined=True, session=None, store=None, cancel=None):
+    """Measure R at every x (in loop_order) `loops` times; returns data.result(x_key).
+
+    `experiment` names the live-fit model, `labels` is (title, x label, y label) and
+    line(x, R) the log line of one point.
+    """
+    hw = session or HardwareSession()
+    cancel = cancel or CancelToken()
+    timer = SpanTimer()  # where each point's time goes, reported at the end
+    n_loop = sampler.budget if sampler is not None else len(x)
+    # every point's program is built, checked against the board limits and compiled up front
+    with timer.span("compile"):
+        program = programs()
+    for note in getattr(program, "notes", ()):
+        emit(line=note)
+
+    plot = as_sink(ax)
+    plot.setup(*labels)
+
+    with timer.span("setup"):
+        li, tau_LI_s, mw = hw.begin(synth=drive is not None, cancel=cancel)
+    fitter = pipe = None
+    try:
+        # optional live fit in its own thread (stop_rtol > 0 also ends the run at that precision)
+        fitter = OnlineFitter(experiment, emit, cancel, stop_rtol, window=fit_window) if live_fit or stop_rtol > 0 else None
+        # bookkeeping of each point overlaps the next one (see experiments.pipeline)
+        pipe = PointPipeline(timer, pipelined)
+        slope = sr830_filter_slope(li)
+        pb_stop()
+        pb_reset()
+
+        data = SweepData(x, loops)
+        # points already in the run file (resumed run) are skipped
+        done = store.restore_into(data) if store is not None else set()
+        if done:
+            plot.update(data)
+        if drive is not None:
+            drive.start(mw, timer, emit, resumed=bool(done))
+
+        loop_count = 0
+        timer.start()
+        while loop_count < loops and not cancel.cancelled():
+            if drive is not None:
+                drive.loop()
+            order = Lookahead(loop_order(sampler, data, loop_count))
+            for k, i in enumerate(order):
+                if cancel.cancelled():
+                    emit(line=cancel.reason)
+                    break
+                if (loop_count, i) in done:
+                    continue
+                if drive is not None:
+                    drive.point(i, pipe)
+                with timer.span("pb"):
+                    seq = program(i)
+                    # only reprograms when the program changes (or after a dark phase)
+                    pb_run_sequence(seq, restart=bool(seq.prologue))
+
+                pt = sr830_point(li, tau_LI_s, slope, rtol=settle_rtol, buffer_samples=buffer_samples, timer=timer)
+                data.add(loop_count, i, pt)
+                if store is not None:
+                    pipe.after(store.append, loop_count, i, x[i], pt, span="store")
+
+                pipe.show(plot, data, fitter)
+                emit(line=line(x[i], pt["R"]), status=f"Point {(loop_count*n_loop+k+1)} / {(n_loop*loops)}", progress=min(1.0, ((loop_count*n_loop)+k+1)/(loops*n_loop)))
+
+                if dark_reset:
+                    # optional dark phase so the lock-in relaxes before the next point
+                    with timer.span("dark"):
+                        pb_dark()
+                        nxt = order.peek() if pipe.enabled and drive is not None and drive.retunes else None
+                        if nxt is not None and (loop_count, nxt) not in done:
+                            # no light, no signal: retune for the next point while the lock-in relaxes
+                            drive.ahead(nxt, pipe)
+                        sr830_settle(li, tau_LI_s, slope, rtol=settle_rtol)
+                timer.lap()
+            loop_count += 1
+        pipe.drain()  # bookkeeping of the last points; raises its errors
+        if drive is not None:
+            drive.finish(data)
+        summary = sampler.summary(data) if sampler is not None else None
+        if summary:
+            emit(line=f"Fit: {summary}")
+
+    except Exception:
+        hw.invalidate()  # reconnect on the next run
+        raise
+    finally:
+        if pipe is not None:
+            pipe.close()
+        if fitter is not None:
+            fitter.close()
+        timer.finish(emit, store)
+        hw.end(close=session is None)
+
+    return data.result(x_key)
@@ -0,0 +1,84 @@
+# experiments/sweep_data.py
+"""
+Results of a swept experiment held as (loop, point) arrays instead of flat lists.
+
+Every channel gets a preallocated NaN-filled array indexed by (loop, point), so the
+memory use is fixed when the run starts. Per-point mean and variance over loops are
+updated incrementally (Welford), so the live plot and the saved data show the averaged
+curve with error bars at any point during the run.
+"""
+import numpy as np
+
+CHANNELS = ("X", "Y", "R", "R_err")
+AVERAGED = ("X", "Y", "R")
+
+
+class SweepData:
+
+    def __init__(self, x, loops: int, dtype=np.float32):
+        # float32 keeps the GUI maximum (2001 points x 1000 loops x 4 channels) at 32 MB
+        self.x = np.asarray(x, dtype=float)
+        self.loops = int(loops)
+        shape = (self.loops, len(self.x))
+        self.raw = {c: np.full(shape, np.nan, dtype=dtype) for c in CHANNELS}
+        self.n = np.zeros(len(self.x), dtype=np.int64)
+        self._mean = {c: np.zeros(len(self.x)) for c in AVERAGED}
+        self._m2 = {c: np.zeros(len(self.x)) for c in AVERAGED}
+
+    def add(self, loop: int, index: int, pt: dict):
+        """Store one sr830_point() reading and fold it into the running statistics."""
+        for c in CHANNELS:
+            self.raw[c][loop, index] = pt[c]
+        self.n[index] += 1
+        n = self.n[index]
+        for c in AVERAGED:
+            v = float(pt[c])
+            d = v - self._mean[c][index]
+            self._mean[c][index] += d / n
+            self._m2[c][index] += d * (v - self._mean[c][index])
+
+    def averages(self):
+        """Copy of the running statistics (raw readings of loop 0 only), e.g. for another thread."""
+        c = SweepData.__new__(SweepData)
+        c.x, c.loops, c.n = self.x, self.loops, self.n.copy()
+        c.raw = {k: v[:1].copy() for k, v in self.raw.items()}
+        c._mean = {k: v.copy() for k, v in self._mean.items()}
+        c._m2 = {k: v.copy() for k, v in self._m2.items()}
+        return c
+
+    def mean(self, channel="R"):
+        return np.where(self.n > 0, self._mean[channel], np.nan)
+
+    def std(self, channel="R"):
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(self.n > 1, np.sqrt(self._m2[channel] / (self.n - 1)), np.nan)
+
+    def sem(self, channel="R"):
+        """Standard error over loops; with a single loop, the read's own R_err (buffered reads)."""
+        with np.errstate(invalid="ignore", divide="ignore"):
+            sem = self.std(channel) / np.sqrt(self.n)
+        if channel == "R":
+            # loops run in order, so a point seen once was seen in loop 0
+            sem = np.where(self.n == 1, self.raw["R_err"][0], sem)
+        return sem
+
+    def theta(self):
+        # phase of the averaged vector, not the average of the phases
+        return np.degrees(np.arctan2(self.mean("Y"), self.mean("X")))
+
+    def measured(self):
+        return self.n > 0
+
+    def result(self, x_key: str):
+        """Averaged curve as the dict run() returns (x first, then R, as save_csv expects)."""
+        m = self.measured()
+        return {
+            x_key: self.x[m].tolist(),
+            "R_V": self.mean("R")[m].tolist(),
+            "R_err_V": self.sem("R")[m].tolist(),
+            "X_V": self.mean("X")[m].tolist(),
+            "Y_V": self.mean("Y")[m].tolist(),
+            "theta_deg": self.theta()[m].tolist(),
+            "n_loops": self.n[m].tolist(),
+        }
+
@@ -5,19 +5,14 @@ First half (Ref HIGH): one laser pulse (INIT)
 Second half (Ref LOW): second laser pulse, then dark τ, then read pulse
 Reads SR830 R per τ and plots live.
 """
-import time
-import numpy as np
-from spinapi import *
-from hardware.sr830_control import init_sr830, sr830_read_R, sr830_read_X
-from hardware.pulseblaster_control import pb_init_simple
-from PyQt6.QtCore import Qt, QObject, pyqtSignal, QThread
-
-# Channels (edit to match wiring)
-CH_REF = (1 << 0)  # TTL to LIA
-CH_LASER   = (1 << 1)  # TTL to laser
+from hardware.sr830_control import SETTLE_RTOL
+from hardware.pulseblaster_control import pb_load
+from experiments.sweep import run_sweep
+from experiments.adaptive import MODELS, sweep_points
+from hardware.pb_sequence import PulseSequence, SweepPrograms, CH_REF, CH_LASER
 
 # Internal helpers
-def _program_three_pulse_sequence(tau_us: float, tref_ms: float, init_us: float, second_us: float, read_us: float):
+def _three_pulse_sequence(tau_us: float, tref_ms: float, init_us: float, second_us: float, read_us: float):
     half_ns = (tref_ms * 1000000.0) / 2.0
     init_ns=init_us*1000
     second_ns=second_us*1000
@@ -31,88 +26,24 @@ def _program_three_pulse_sequence(tau_us: float, tref_ms: float, init_us: float,
     high_base_ns = half_ns - init_ns
     low_after_read_ns = half_ns - (second_ns + tau_ns + read_ns)
 
-    pb_start_programming(PULSE_PROGRAM)
-    pb_inst_pbonly(CH_LASER|CH_REF, CONTINUE, 0, init_ns)
-    pb_inst_pbonly(CH_REF,CONTINUE,0,high_base_ns)
-    pb_inst_pbonly(CH_LASER, CONTINUE, 0, second_ns)
+    body=[(CH_LASER|CH_REF, init_ns), (CH_REF, high_base_ns), (CH_LASER, second_ns)]
     if tau_ns > 0:
-        pb_inst_pbonly(0, CONTINUE, 0, tau_ns)
-    pb_inst_pbonly(CH_LASER, CONTINUE, 0, read_ns)
-    pb_inst_pbonly(0, BRANCH, 0, max(1.0, low_after_read_ns))
-    pb_stop_programming()
-
-def stop_pulse():
-    pb_start_programming(PULSE_PROGRAM)
-    pb_inst_pbonly(0,BRANCH,0,100.0)
-    pb_stop_programming()
-
-def run(ax, emit, tref_ms=20, init_us=20.0, second_us=20.0, read_us=20.0, max_tau_us=4000.0, points=15,loops=1):
-    # Init hardware
-    pb_init_simple()
-    rm, li, tau_LI_s = init_sr830()
-    wait_s = max(1, 15* float(tau_LI_s))
-
-    taus_us = np.linspace(float(init_us), float(max_tau_us), int(points))
-    taus_s = taus_us * 1e-6
-    Rvals = []
-    tauvals=[]
-    Rerrs=[]
-
-    # Plot setup
-    ax.set_title("All-optical T₁ (3-pulse)")
-    ax.set_xlabel(r"τ ($\mu$s)"); ax.set_ylabel("R (V)"); ax.grid(True)
-    (line,) = ax.plot([], [], "o")
-    # (errbars,) = ax.errorbars([],[],[],"+")
-    loop_counter=0
-    try:
-        # Prime sequence
-        # _program_three_pulse_sequence(taus_us[0], tref_ms, init_us, second_us, read_us)
-        # time.sleep(max(wait_s, 2 * (tref_ms / 1000.0)))
-        while loop_counter<loops:
-            for i, tau in enumerate(taus_us):
-                if QThread.currentThread().isInterruptionRequested():
-                    emit(line="Interrupted by user.")
-                    break
+        body.append((0, tau_ns))
+    body += [(CH_LASER, read_ns), (0, low_after_read_ns)]
+    return PulseSequence().block(body)
 
-                pb_stop()
-                pb_reset()
-                _program_three_pulse_sequence(float(tau), tref_ms, init_us, second_us, read_us)
-                pb_start()
-                # loop_counter=0
-                # r_av=[]
-                # while loop_counter<loops:
-                    # time.sleep(wait_s)
-                    # R = sr830_read_R(li)
-                    # r_av.append(R)
-
-                    # loop_counter=loop_counter+1
-
-                time.sleep(wait_s)
-                R=sr830_read_R(li)
-                Rvals.append(R)
-                # Rvals.append(np.average(r_av))
-                # Rerrs.append(np.std(r_av))
-                tauvals.append(tau)
-                pb_stop()
-                pb_reset()
-                stop_pulse()
-                pb_start()
-                time.sleep(wait_s)
-                pb_stop()
-                pb_reset
-                # Live plot
-                line.set_data(tauvals, Rvals)
-                # errbars.set_data(tauvals, Rvals,Rerrs)
-                ax.relim(); ax.autoscale()
-                emit(line=f"τ = {tau:.1f} µs → R = {R:.6e} V", status=f"Point {i+1}/{(len(taus_us)*loops)}", progress=((loop_counter*len(taus_us))+i+1)/(loops*len(taus_us)))
-            loop_counter=loop_counter+1
-
-    finally:
-        try: pb_stop(); pb_reset(); pb_close()
-        except: pass
-        try: li.close(); rm.close()
-        except: pass
-
-    # return {"tau_s": taus_s.tolist(), "R_V": Rvals}
-    return {"tau_s": tauvals, "R_V": Rvals}
+def _program_three_pulse_sequence(tau_us: float, tref_ms: float, init_us: float, second_us: float, read_us: float):
+    pb_load(_three_pulse_sequence(tau_us, tref_ms, init_us, second_us, read_us))
 
+def stop_pulse():
+    pb_load(PulseSequence().block([(0,100.0)]))
+
+def run(ax, emit, tref_ms=20, init_us=20.0, second_us=20.0, read_us=20.0, max_tau_us=4000.0, points=15,loops=1, settle_rtol=SETTLE_RTOL, dark_reset=False, buffer_samples=0, sampling="uniform", live_fit=False, stop_rtol=0.0, pipelined=True, session=None, store=None, cancel=None):
+    # uniform, log or adaptive (refits T1 after every point to choose the next τ)
+    taus_us, sampler = sweep_points(sampling, float(init_us), float(max_tau_us), int(points), MODELS["t1"]())
+    programs = lambda: SweepPrograms(lambda t: _three_pulse_sequence(float(t), tref_ms, init_us, second_us, read_us), taus_us, "τ", " µs")
+    # all-optical: no MW drive, the synth is not opened
+    return run_sweep(ax, emit, "t1", taus_us, sampler, programs, ("All-optical T₁ (3-pulse)", r"τ ($\mu$s)", "R (V)"), "tau_s",
+                     lambda tau, R: f"τ = {tau:.1f} µs → R = {R:.6e} V", loops,
+                     settle_rtol=settle_rtol, dark_reset=dark_reset, buffer_samples=buffer_samples, live_fit=live_fit,
+                     stop_rtol=stop_rtol, pipelined=pipelined, session=session, store=store, cancel=cancel)
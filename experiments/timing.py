@@ -0,0 +1,153 @@
+# experiments/timing.py
+"""
+Where a point's wall time goes.
+
+run_sweep() wraps each phase of a point in a span (PB programming, MW stepping, lock-in
+settling and readout, run file, plot) and calls lap() after each point, so "point" is
+the full time from one point to the next, including whatever no span covers:
+
+    timer = SpanTimer()
+    timer.start()
+    for ...:
+        with timer.span("pb"):
+            pb_run_sequence(...)
+        ...
+        timer.lap()
+
+At the end finish() logs a table of the phases through emit(line=...), sends the full
+summary as emit(timing=...), and hands it to the RunStore, which saves it with the
+run's end record. Durations are kept per phase; summary() bins them into fixed log-spaced
+histograms so runs can be compared.
+
+profiled() wraps a whole run in cProfile or pyinstrument (python -m experiments
+--profile, or NV_PROFILE=cprofile|pyinstrument for the GUI).
+"""
+import contextlib
+import os
+import time
+from collections import defaultdict
+
+import numpy as np
+
+# histogram bin edges shared by every phase: 1 µs to 100 s, four bins per decade
+HIST_EDGES_S = np.logspace(-6, 2, 33)
+
+# spans taken once per run, outside the points
+RUN_SPANS = ("setup", "compile")
+
+PROFILERS = ("cprofile", "pyinstrument")
+
+
+class SpanTimer:
+    """Collects durations of named phases, and of whole points, for one run."""
+
+    def __init__(self):
+        self.durations = defaultdict(list)
+        self.overlapped = set()  # spans run off the acquisition thread (experiments.pipeline)
+        self._lap_t0 = None
+
+    @contextlib.contextmanager
+    def span(self, name):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.durations[name].append(time.perf_counter() - t0)
+
+    def add(self, name, seconds):
+        self.durations[name].append(float(seconds))
+
+    def start(self):
+        self._lap_t0 = time.perf_counter()
+
+    def lap(self):
+        """End of a point: its wall time since the previous lap() (or start())."""
+        now = time.perf_counter()
+        if self._lap_t0 is not None:
+            self.durations["point"].append(now - self._lap_t0)
+        self._lap_t0 = now
+
+    def summary(self):
+        """{'edges_s': [...], 'spans': {name: {n, total_s, mean_s, p50_s, p90_s, max_s, hist}}}."""
+        spans = {}
+        for name, d in self.durations.items():
+            d = np.asarray(d)
+            spans[name] = dict(n=len(d), total_s=float(d.sum()), mean_s=float(d.mean()),
+                               p50_s=float(np.percentile(d, 50)), p90_s=float(np.percentile(d, 90)),
+                               max_s=float(d.max()), hist=np.histogram(d, HIST_EDGES_S)[0].tolist())
+        return dict(edges_s=HIST_EDGES_S.tolist(), spans=spans)
+
+    def lines(self):
+        """Readable table: one line per phase, with its share of the total point time."""
+        s = self.summary()["spans"]
+        if not s:
+            return []
+        point_total = s["point"]["total_s"] if "point" in s else None
+        out = ["Timing per phase (n, mean, p90, max, share of point time):"]
+        for name, st in sorted(s.items(), key=lambda kv: -kv[1]["total_s"]):
+            share = f"{st['total_s'] / point_total:6.1%}" if point_total and name not in ("point",) + RUN_SPANS else ""
+            if share and name in self.overlapped:
+                share += " (overlapped)"
+            out.append(f"  {name:<8} {st['n']:5d}  {_ms(st['mean_s'])}  {_ms(st['p90_s'])}  {_ms(st['max_s'])}  {share}")
+        if point_total:
+            inside = sum(st["total_s"] for name, st in s.items()
+                         if name not in ("point",) + RUN_SPANS and name not in self.overlapped)
+            out.append(f"  other    {'':5}  {'':>9}  {'':>9}  {'':>9}  {1 - inside / point_total:6.1%} (emit, sampler, loop overhead)")
+        return out
+
+    def finish(self, emit, store=None):
+        """Report the run's timing and attach it to the run file."""
+        summary = self.summary()
+        for line in self.lines():
+            emit(line=line)
+        emit(timing=summary)
+        if store is not None:
+            store.timing = summary
+        return summary
+
+
+def _ms(seconds):
+    return f"{seconds * 1e3:7.2f} ms"
+
+
+@contextlib.contextmanager
+def profiled(kind=None, path=None, emit=print):
+    """Profile the block with cProfile or pyinstrument (kind None: $NV_PROFILE, or nothing).
+
+    cProfile stats go to `path` (.prof, for snakeviz / pstats), pyinstrument writes an
+    HTML report; either way the top of the profile is printed through emit.
+    """
+    kind = kind or os.environ.get("NV_PROFILE") or None
+    if kind is None:
+        yield
+        return
+    if kind not in PROFILERS:
+        raise ValueError(f"Unknown profiler {kind!r}, expected one of {PROFILERS}")
+    path = path or time.strftime(f"profile-%Y%m%d-%H%M%S.{'prof' if kind == 'cprofile' else 'html'}")
+    if kind == "cprofile":
+        import cProfile
+        import io
+        import pstats
+        prof = cProfile.Profile()
+        prof.enable()
+        try:
+            yield
+        finally:
+            prof.disable()
+            prof.dump_stats(path)
+            text = io.StringIO()
+            pstats.Stats(prof, stream=text).sort_stats("cumulative").print_stats(15)
+            emit(text.getvalue())
+            emit(f"Profile written to {path}")
+    else:
+        from pyinstrument import Profiler  # optional dependency
+        prof = Profiler()
+        prof.start()
+        try:
+            yield
+        finally:
+            prof.stop()
+            with open(path, "w") as f:
+                f.write(prof.output_html())
+            emit(prof.output_text(unicode=True))
+            emit(f"Profile written to {path}")
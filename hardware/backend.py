@@ -0,0 +1,54 @@
+# hardware/backend.py
+"""
+Picks the instrument backend the hardware modules talk to.
+
+"hardware" (default) uses spinapi, pyvisa and windfreak as before. "sim" swaps in the
+offline models from hardware.simulator so every experiment runs without a bench.
+Select with the NV_BACKEND environment variable or use_backend("sim") before a run.
+"""
+import os
+
+BACKENDS = ("hardware", "sim")
+
+_backend = os.environ.get("NV_BACKEND", "hardware").lower()
+
+
+def use_backend(name: str):
+    global _backend
+    name = name.lower()
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown backend {name!r}, expected one of {BACKENDS}")
+    _backend = name
+
+
+def backend_name() -> str:
+    return _backend
+
+
+def simulated() -> bool:
+    return _backend == "sim"
+
+
+def spinapi():
+    """spinapi module (or the simulated stand-in with the same functions)."""
+    if simulated():
+        from hardware.simulator import spinapi as api
+        return api
+    import spinapi as api
+    return api
+
+
+def resource_manager():
+    if simulated():
+        from hardware.simulator import SimResourceManager
+        return SimResourceManager()
+    import pyvisa
+    return pyvisa.ResourceManager()
+
+
+def synth_hd(devpath):
+    if simulated():
+        from hardware.simulator import SimSynthHD
+        return SimSynthHD(devpath)
+    from windfreak import SynthHD
+    return SynthHD(devpath)
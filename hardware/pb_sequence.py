@@ -0,0 +1,377 @@
+# hardware/pb_sequence.py
+"""
+Pulse sequences for the PulseBlaster and a compiler that loops in hardware.
+
+A sequence is a list of (body, repeat) blocks, body being a list of (flags, length).
+Blocks with repeat > 1 become one LOOP ... END_LOOP pair, so the program size does not
+grow with the number of repetitions N. The last instruction branches back to the start of
+the blocks; an optional prologue before them is played once after each pb_start (e.g. a
+trigger pulse that steps the SynthHD to the next frequency).
+
+PulseSequence holds the blocks in whole clock ticks so identical sequences hash the same,
+and compiled programs are kept in an LRU cache (optionally persisted to disk).
+
+SweepPrograms builds the sequence of every point of a sweep before the run, checks them
+all against the board's limits in one pass over the instruction arrays, and compiles
+them, so a sweep that cannot be played fails before any hardware is touched.
+"""
+import atexit
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+CLOCK_MHZ = 100.0
+
+# Board limits checked before a run (PulseBlaster ESR-PRO)
+MIN_INSTR_TICKS = 5            # shortest instruction (50 ns at 100 MHz)
+MAX_INSTR_TICKS = 2**32 - 1    # longest single instruction
+MAX_LOOP = 2**20 - 1           # LOOP repeat count
+MAX_INSTRUCTIONS = 4096        # program memory
+REF_RTOL = 1e-3                # REF duty cycle off 50% by more than this gets a note
+
+# Channels (edit to match wiring)
+CH_REF   = (1 << 0)   # TTL to lock-in reference
+CH_LASER = (1 << 1)   # TTL to laser
+CH_MW_I  = (1 << 2)   # TTL to I channel MW
+CH_MW_TRIG = (1 << 3) # TTL to SynthHD trigger input (frequency step)
+
+# spinapi opcodes (same values as spinapi.Inst)
+CONTINUE = 0
+LOOP = 2
+END_LOOP = 3
+BRANCH = 6
+
+
+def compile_blocks(blocks, prologue=()):
+    """Return the instruction list [(flags, opcode, data, length_ns), ...] for `blocks`.
+
+    `prologue` [(flags, length_ns)] is played once before the loop; BRANCH skips it.
+    """
+    blocks = [(list(body), int(rep)) for body, rep in blocks if body and int(rep) > 0]
+    if not blocks:
+        raise ValueError("Pulse sequence is empty")
+
+    # Peel the last repetition of the final block so the BRANCH can sit on its last instruction
+    body, rep = blocks[-1]
+    if rep > 1:
+        blocks[-1] = (body, rep - 1)
+        blocks.append((body, 1))
+
+    prog = [(flags, CONTINUE, 0, t) for flags, t in prologue]
+    for body, rep in blocks:
+        if rep == 1:
+            prog += [(flags, CONTINUE, 0, t) for flags, t in body]
+        elif len(body) == 1:
+            # a loop needs two instructions, a single one can just be stretched
+            flags, t = body[0]
+            prog.append((flags, CONTINUE, 0, t * rep))
+        else:
+            start = len(prog)
+            prog.append((body[0][0], LOOP, rep, body[0][1]))
+            prog += [(flags, CONTINUE, 0, t) for flags, t in body[1:-1]]
+            prog.append((body[-1][0], END_LOOP, start, body[-1][1]))
+
+    flags, _, _, t = prog[-1]
+    prog[-1] = (flags, BRANCH, len(prologue), t)
+    return prog
+
+
+def unrolled_length(blocks):
+    """Number of instructions the same sequence takes when written out without loops."""
+    return sum(len(body) * int(rep) for body, rep in blocks)
+
+
+class PulseSequence:
+    """Declarative pulse sequence: blocks of (flags, ticks) repeated `repeat` times.
+
+    Durations are given in ns and rounded (half up) to whole ticks of `clock_mhz`; zero-length
+    instructions are dropped, negative ones and ones that would round to zero raise ValueError.
+    """
+
+    def __init__(self, clock_mhz=CLOCK_MHZ):
+        self.clock_mhz = float(clock_mhz)
+        self.blocks = []
+        self.prologue = ()
+        self.rounded_ns = 0.0  # largest change of a duration by the rounding to ticks
+        self.program = None    # set by SweepPrograms: compiled ahead of the run
+
+    def ticks(self, ns):
+        exact = float(ns) * self.clock_mhz / 1000.0
+        if exact < 0:
+            raise ValueError(f"Negative duration ({float(ns):g} ns)")
+        t = int(exact + 0.5)  # half up (round() is half-even: 5 ns -> 0, 25 ns -> 20)
+        if t == 0 and exact > 0:
+            raise ValueError(f"{float(ns):g} ns pulse is shorter than half a {1000.0 / self.clock_mhz:g} ns clock tick")
+        self.rounded_ns = max(self.rounded_ns, abs(t - exact) * 1000.0 / self.clock_mhz)
+        return t
+
+    def block(self, body_ns, repeat=1):
+        body = tuple((int(flags), self.ticks(ns)) for flags, ns in body_ns)
+        body = tuple((flags, t) for flags, t in body if t > 0)
+        if body and int(repeat) > 0:
+            self.blocks.append((body, int(repeat)))
+        return self
+
+    def once(self, body_ns):
+        """Instructions played once after each start, before the repeating blocks."""
+        body = tuple((int(flags), self.ticks(ns)) for flags, ns in body_ns)
+        self.prologue = self.prologue + tuple((flags, t) for flags, t in body if t > 0)
+        return self
+
+    def key(self):
+        """Stable hash of the sequence, used as the program cache key."""
+        text = json.dumps([self.clock_mhz, self.blocks] + ([self.prologue] if self.prologue else []))
+        return hashlib.sha1(text.encode()).hexdigest()
+
+    def __eq__(self, other):
+        return isinstance(other, PulseSequence) and self.key() == other.key()
+
+    def __hash__(self):
+        return hash(self.key())
+
+    def period_ns(self):
+        tick_ns = 1000.0 / self.clock_mhz
+        return sum(t * rep for body, rep in self.blocks for _, t in body) * tick_ns
+
+    def compile(self, cache=None):
+        """Instruction list [(flags, opcode, data, length_ns), ...], served from the cache."""
+        if self.program is not None:
+            return self.program
+        cache = PROGRAM_CACHE if cache is None else cache
+        return cache.get(self)
+
+    def _compile(self):
+        tick_ns = 1000.0 / self.clock_mhz
+        return compile_blocks([([(flags, t * tick_ns) for flags, t in body], rep)
+                               for body, rep in self.blocks],
+                              [(flags, t * tick_ns) for flags, t in self.prologue])
+
+
+def check_sequences(seqs):
+    """(problems, duty) of each sequence, in one pass over all of them.
+
+    problems is [[str, ...], ...] (empty: playable), duty the fraction of the period
+    CH_REF is high. Every instruction of every sequence goes into flat (sequence, REF,
+    ticks, repeat) arrays. Checked: instruction lengths against MIN_INSTR_TICKS, loop
+    counts against MAX_LOOP, and the reference the lock-in locks to: CH_REF must be one
+    square wave per period (a single high stretch). The SR830 locks to its rising edge,
+    so a duty cycle off 50% only scales the signal and is not a problem.
+    The prologue only counts for the instruction lengths.
+    """
+    rows, period = [], []
+    for k, seq in enumerate(seqs):
+        rows += [(k, t, 1) for _, t in seq.prologue]
+        for body, rep in seq.blocks:
+            # (a single instruction is stretched rather than looped)
+            rows += [(k, t, rep if len(body) > 1 else 1) for _, t in body]
+            # the REF edges of a repeated body all show in two copies of it; the first
+            # copy carries the time of all repeats
+            period += [(k, flags & CH_REF, t * rep) for flags, t in body]
+            if rep > 1:
+                period += [(k, flags & CH_REF, 0) for flags, t in body]
+    n = len(seqs)
+    problems = [[] for _ in range(n)]
+    if not rows:
+        return [["Pulse sequence is empty"] for _ in range(n)], np.full(n, np.nan)
+    k, t, rep = np.array(rows, dtype=np.int64).T
+    tick_ns = 1000.0 / seqs[0].clock_mhz
+    shortest = np.full(n, np.iinfo(np.int64).max)
+    np.minimum.at(shortest, k, t)
+    longest_loop = np.zeros(n, dtype=np.int64)
+    np.maximum.at(longest_loop, k, rep)
+
+    pk, ref, dt = np.array(period, dtype=np.int64).reshape(-1, 3).T
+    ref = ref > 0
+    # previous REF state within each sequence, wrapping around at the period end
+    first = np.flatnonzero(np.r_[True, pk[1:] != pk[:-1]]) if len(pk) else pk
+    last = np.r_[first[1:], len(pk)] - 1
+    prev = np.roll(ref, 1)
+    prev[first] = ref[last]
+    rising = np.bincount(pk, weights=ref & ~prev, minlength=n)
+    total = np.bincount(pk, weights=dt, minlength=n)
+    high = np.bincount(pk, weights=dt * ref, minlength=n)
+
+    for j in np.flatnonzero(shortest < MIN_INSTR_TICKS):
+        problems[j].append(f"{shortest[j] * tick_ns:g} ns instruction, the board needs at least {MIN_INSTR_TICKS * tick_ns:g} ns")
+    for j in np.flatnonzero(longest_loop > MAX_LOOP):
+        problems[j].append(f"{longest_loop[j]} repeats, a hardware loop takes at most {MAX_LOOP}")
+    for j in np.flatnonzero(rising != 1):
+        problems[j].append("REF is not a single square wave per period" if rising[j] else "REF never toggles")
+    return problems, high / np.maximum(total, 1)
+
+
+def check_program(prog, clock_mhz=CLOCK_MHZ):
+    """Problems of a compiled program: memory size and instruction lengths."""
+    problems = []
+    if len(prog) > MAX_INSTRUCTIONS:
+        problems.append(f"{len(prog)} instructions, the board holds {MAX_INSTRUCTIONS}")
+    longest = max(length_ns for _, _, _, length_ns in prog) * clock_mhz / 1000.0
+    if longest > MAX_INSTR_TICKS:
+        problems.append(f"{longest / clock_mhz / 1e6:.3g} s instruction, the longest is {MAX_INSTR_TICKS / clock_mhz / 1e6:.3g} s")
+    return problems
+
+
+class SweepPrograms:
+    """The checked, compiled PulseSequence of every point of a sweep.
+
+    build(value) returns the sequence for one sweep value. All points are built and
+    checked (check_sequences, check_program) before the run, and ValueError lists the
+    ones that cannot be played; the rest are compiled once, so acquisition only replays
+    finished programs:
+
+        programs = SweepPrograms(lambda tau: pulse_sequence(..., tau), taus_us, "τ", " µs")
+        pb_run_sequence(programs[i])
+
+    notes holds warnings that do not stop the run. Programs come from `cache`
+    (PROGRAM_CACHE by default), which is written back once at the end.
+    """
+
+    def __init__(self, build, values, name="x", unit="", cache=None):
+        cache = PROGRAM_CACHE if cache is None else cache
+        self.values = list(values)
+        self.seqs = []
+        problems = []
+        for v in self.values:
+            try:
+                self.seqs.append(build(v))
+                problems.append([])
+            except ValueError as e:
+                self.seqs.append(None)
+                problems.append([str(e)])
+        built = [j for j, seq in enumerate(self.seqs) if seq is not None]
+        found, duty = check_sequences([self.seqs[j] for j in built])
+        for j, f in zip(built, found):
+            problems[j] += f
+        # compile every distinct program once
+        programs = {}
+        for j in built:
+            seq = self.seqs[j]
+            key = seq.key()
+            if key not in programs:
+                try:
+                    programs[key] = cache.get(seq)
+                except ValueError as e:
+                    programs[key] = e
+            prog = programs[key]
+            if isinstance(prog, ValueError):
+                problems[j].append(str(prog))
+                continue
+            problems[j] += check_program(prog, seq.clock_mhz)
+            seq.program = prog
+        cache.flush()
+
+        bad = [j for j, found in enumerate(problems) if found]
+        if bad:
+            label = (lambda j: "") if name is None else (lambda j: f"{name} = {self.values[j]:g}{unit}: ")
+            lines = [label(j) + "; ".join(problems[j]) for j in bad[:5]]
+            if len(bad) > 5:
+                lines.append(f"… and {len(bad) - 5} more")
+            what = "The pulse sequence" if name is None else f"{len(bad)} of {len(self.values)} sweep points"
+            raise ValueError(f"{what} cannot be played:\n" + "\n".join(lines))
+
+        self.notes = []
+        rounded = max(seq.rounded_ns for seq in self.seqs)
+        if rounded > 1e-6:
+            tick_ns = 1000.0 / self.seqs[0].clock_mhz
+            self.notes.append(f"Pulse durations rounded to the {tick_ns:g} ns clock (by up to {rounded:.3g} ns)")
+        off = np.abs(duty - 0.5) > REF_RTOL
+        if off.any():
+            self.notes.append(f"REF high for {duty[off].min():.2%}–{duty[off].max():.2%} of the period at {np.count_nonzero(off)} "
+                              f"points (not 50%): the lock-in still locks, the signal scales with the duty cycle")
+        if len(programs) < len(self.seqs) and name is not None:
+            self.notes.append(f"{len(self.seqs) - len(programs)} {name} points give the same program as another point (steps below the clock)")
+
+    def __getitem__(self, i):
+        return self.seqs[i]
+
+    def __call__(self, i):
+        # the program for point i (experiments.sweep.run_sweep)
+        return self.seqs[i]
+
+    def __len__(self):
+        return len(self.seqs)
+
+
+def precompile(seq):
+    """Check and compile a single sequence before the run (ValueError if it cannot be played)."""
+    return SweepPrograms(lambda _: seq, [0.0], name=None)[0]
+
+
+class ProgramCache:
+    """LRU cache of compiled programs keyed by PulseSequence.key().
+
+    With `path` set the cache is loaded from a JSON file and written back by flush(),
+    once per SweepPrograms and at exit rather than per miss, so repeated runs skip
+    compilation too.
+    """
+
+    def __init__(self, maxsize=256, path=None):
+        self.maxsize = int(maxsize)
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._programs = OrderedDict()
+        self._lock = threading.Lock()
+        self._dirty = False
+        if path and os.path.exists(path):
+            self.load()
+
+    def get(self, seq):
+        key = seq.key()
+        with self._lock:
+            prog = self._programs.get(key)
+            if prog is not None:
+                self._programs.move_to_end(key)
+                self.hits += 1
+                return prog
+        prog = seq._compile()
+        with self._lock:
+            self.misses += 1
+            self._programs[key] = prog
+            self._dirty = True
+            while len(self._programs) > self.maxsize:
+                self._programs.popitem(last=False)
+        return prog
+
+    def flush(self):
+        """Write the cache file if programs were added since the last write."""
+        if self.path and self._dirty:
+            self.save()
+
+    def clear(self):
+        with self._lock:
+            self._programs.clear()
+
+    def __len__(self):
+        return len(self._programs)
+
+    def load(self):
+        with open(self.path) as f:
+            data = json.load(f)
+        with self._lock:
+            for key, prog in data.items():
+                self._programs[key] = [tuple(inst) for inst in prog]
+            while len(self._programs) > self.maxsize:
+                self._programs.popitem(last=False)
+
+    def save(self):
+        with self._lock:
+            data = dict(self._programs)
+            self._dirty = False
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp, self.path)
+
+
+# All outputs low; loaded between points when the lock-in should relax in the dark
+DARK_SEQUENCE = PulseSequence().block([(0, 100.0)])
+
+
+# Shared cache; set NV_PB_CACHE to a file path to keep compiled programs between runs
+PROGRAM_CACHE = ProgramCache(path=os.environ.get("NV_PB_CACHE"))
+atexit.register(PROGRAM_CACHE.flush)
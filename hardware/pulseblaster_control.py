@@ -1,11 +1,41 @@
-from spinapi import *
+from hardware import backend
+from hardware.pb_sequence import CLOCK_MHZ, DARK_SEQUENCE
 
-CLOCK_MHZ = 100.0
+# key of the PulseSequence currently in board memory (None = unknown)
+_loaded_key = None
+_running = False
+
+def _pb():
+    # spinapi or the simulator, whichever hardware.backend selects
+    return backend.spinapi()
 
 def pb_init_simple(board=0, clock_mhz=CLOCK_MHZ):
-    pb_select_board(board)
-    pb_init()
-    pb_core_clock(clock_mhz)
+    global _loaded_key, _running
+    api = _pb()
+    api.pb_select_board(board)
+    api.pb_init()
+    api.pb_core_clock(clock_mhz)
+    _loaded_key = None
+    _running = False
+
+def pb_start():
+    global _running
+    _pb().pb_start()
+    _running = True
+
+def pb_stop():
+    global _running
+    _pb().pb_stop()
+    _running = False
+
+def pb_reset():
+    _pb().pb_reset()
+
+def pb_close():
+    global _loaded_key, _running
+    _loaded_key = None
+    _running = False
+    _pb().pb_close()
 
 def pb_start_run():
     pb_start()
@@ -13,6 +43,47 @@ def pb_start_run():
 def pb_stop_run():
     pb_stop()
 
+def pb_program(instructions):
+    """Write a compiled instruction list (see hardware.pb_sequence) to the board."""
+    global _loaded_key
+    _loaded_key = None
+    api = _pb()
+    api.pb_start_programming(api.PULSE_PROGRAM)
+    for flags, opcode, data, length_ns in instructions:
+        api.pb_inst_pbonly(flags, opcode, data, length_ns)
+    api.pb_stop_programming()
+
+def pb_load(seq):
+    """Program a PulseSequence, skipping compile (cache) and transfer (already loaded)."""
+    global _loaded_key
+    key = seq.key()
+    if key == _loaded_key:
+        return False
+    pb_program(seq.compile())
+    _loaded_key = key
+    return True
+
+def pb_run_sequence(seq, restart=False):
+    """Switch the board straight to `seq`; nothing happens if it is already running it.
+
+    restart=True always starts again from address 0 so the sequence prologue replays.
+    """
+    if _running and seq.key() == _loaded_key and not restart:
+        return False
+    pb_stop()
+    if restart:
+        pb_reset()
+    pb_load(seq)
+    pb_start()
+    return True
+
+def pb_dark():
+    """Run the all-off sequence (optional dark phase between points)."""
+    pb_stop()
+    pb_reset()
+    pb_load(DARK_SEQUENCE)
+    pb_start()
+
 def pb_reset_close():
     try:
         pb_reset()
@@ -20,4 +91,4 @@ def pb_reset_close():
         try:
             pb_close()
         except:
-            pass
\ No newline at end of file
+            pass
@@ -0,0 +1,128 @@
+# hardware/session.py
+"""
+Long-lived hardware session: open the PulseBlaster, SR830 and SynthHD once and hand them
+to every run instead of re-initialising (and tearing down) all three per Run press.
+
+Runs take the session lock for their whole duration, so two tabs never drive the
+instruments at the same time. If a run fails the instruments are dropped and reopened
+lazily on the next begin().
+"""
+import threading
+
+from hardware.pulseblaster_control import pb_init_simple, pb_stop, pb_reset, pb_close
+from hardware.sr830_control import init_sr830, VISA_ADDR, TC_TABLE
+from hardware.windfreak_control import WindfreakSynth
+
+LOCK_POLL_S = 0.1  # how often a waiting begin() checks its CancelToken
+
+
+class HardwareSession:
+
+    def __init__(self, visa_addr=VISA_ADDR, synth_serial="COM3"):
+        self.visa_addr = visa_addr
+        self.synth_serial = synth_serial
+        self.lock = threading.RLock()
+        self._pb_ready = False
+        self._rm = None
+        self._li = None
+        self._tau_s = None
+        self._mw = None
+
+    # --- lazy instrument access ---
+    def pulseblaster(self):
+        if not self._pb_ready:
+            pb_init_simple()
+            self._pb_ready = True
+
+    def lockin(self):
+        """(li, time constant in s), opening the SR830 on first use."""
+        if self._li is None:
+            self._rm, self._li, self._tau_s = init_sr830(self.visa_addr)
+        return self._li, self._tau_s
+
+    def synth(self):
+        if self._mw is None:
+            self._mw = WindfreakSynth(self.synth_serial)
+        return self._mw
+
+    def refresh_time_constant(self):
+        """Re-read OFLT? (the time constant may have been changed on the front panel)."""
+        li, _ = self.lockin()
+        self._tau_s = TC_TABLE.get(int(li.query("OFLT?")))
+        return self._tau_s
+
+    # --- run bracketing ---
+    def busy(self):
+        if self.lock.acquire(blocking=False):
+            self.lock.release()
+            return False
+        return True
+
+    def begin(self, synth=True, cancel=None):
+        """Lock the session for one run and make sure the instruments are open.
+
+        Waits for the run holding the lock; with the run's CancelToken the wait gives up
+        (InterruptedError) once it is cancelled. Returns (li, tau_s, mw); mw is None when
+        synth=False.
+        """
+        while not self.lock.acquire(timeout=LOCK_POLL_S):
+            if cancel is not None and cancel.cancelled():
+                raise InterruptedError(f"Stopped while waiting for the hardware: {cancel.reason}")
+        try:
+            self.pulseblaster()
+            li, _ = self.lockin()
+            tau_s = self.refresh_time_constant()
+            mw = self.synth() if synth else None
+            if mw is not None:
+                mw.invalidate()  # the front panel may have been used between runs
+        except Exception:
+            self.invalidate()
+            self.lock.release()
+            raise
+        return li, tau_s, mw
+
+    def end(self, close=False):
+        """Finish a run: stop the PulseBlaster, switch MW off, release the lock."""
+        try:
+            self.idle()
+            if close:
+                self.close()
+        finally:
+            self.lock.release()
+
+    def idle(self):
+        if self._pb_ready:
+            try: pb_stop(); pb_reset()
+            except: pass
+        if self._mw is not None:
+            try:
+                self._mw.sweep_stop()
+                for ch in (1, 2):
+                    self._mw.rf_off(ch)
+            except: pass
+
+    # --- teardown ---
+    def invalidate(self):
+        """Drop every instrument so the next begin() reconnects."""
+        with self.lock:
+            if self._pb_ready:
+                try: pb_stop(); pb_reset(); pb_close()
+                except: pass
+                self._pb_ready = False
+            if self._li is not None:
+                try: self._li.close(); self._rm.close()
+                except: pass
+                self._li = self._rm = None
+            if self._mw is not None:
+                try: self._mw.close()
+                except: pass
+                self._mw = None
+
+    def close(self):
+        self.invalidate()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -0,0 +1,573 @@
+# hardware/simulator.py
+"""
+Offline stand-ins for the PulseBlaster (spinapi), the SR830 (pyvisa) and the SynthHD.
+
+All three share one SimLab so the lock-in output follows whatever sequence is running
+on the simulated PulseBlaster and whatever the simulated SynthHD is putting out.
+The NV model walks the programmed instructions with a small ensemble of Bloch vectors
+(laser pumping, MW rotations, dephasing, T1 relaxation) and turns the PL difference
+between the CH_REF high/low halves into a lock-in reading, so ODMR dips, Rabi
+oscillations, Ramsey/Hahn decays and T1 decays all come out of the same sequences the
+experiments program on the real bench. Enable with NV_BACKEND=sim (see hardware.backend).
+
+Out of the box every instrument call returns at once. SimLab.set_latency() (or
+NV_SIM_LATENCY="gpib=2ms,synth=5ms,...") adds the delays of the real buses, and
+SimLab.io_s counts the time spent in each instrument's calls (see experiments.benchmark).
+"""
+import contextlib
+import math
+import os
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+from hardware.pb_sequence import CH_REF, CH_LASER, CH_MW_I, CH_MW_TRIG, CONTINUE, LOOP, END_LOOP, BRANCH
+
+
+class NVModel:
+    """NV ensemble parameters; change the attributes to get different-looking data."""
+
+    def __init__(self):
+        self.lines_MHz = (2869.0, 2874.0)   # ms=0 -> ms=-1/+1 transitions
+        self.rabi_MHz_0dBm = 0.625          # Rabi frequency at 0 dBm (pi = 800 ns)
+        self.contrast = 0.3
+        self.T1_us = 2000.0
+        self.T2star_us = 0.5
+        self.T2_us = 30.0
+        self.rabi_decay_us = 3.0
+        self.pump_us = 1.0                  # laser repolarisation time
+        self.readout_us = 0.3               # spin-dependent part of each laser pulse
+        self.volts_per_pl = 0.12            # lock-in volts per unit PL duty-cycle difference
+        self.noise_V = 2e-7                 # output noise at a 10 ms time constant
+        self.phase_deg = -12.0
+        self.ensemble = 16
+
+    def _offsets(self):
+        # deterministic quantiles of the inhomogeneous (Gaussian) detuning distribution
+        q = (np.arange(self.ensemble) + 0.5) / self.ensemble
+        z = np.sqrt(2.0) * _erfinv(2.0 * q - 1.0)
+        return z * math.sqrt(2.0) / self.T2star_us   # rad/us
+
+    def signal(self, program, mw_freq_Hz, mw_dbm, mw_on):
+        """Lock-in R (V) for `program` running with the given MW settings."""
+        segments = _segments(program)
+        if not segments:
+            return 0.0
+        offsets = self._offsets()
+        detuning = np.concatenate([offsets + 2 * np.pi * (mw_freq_Hz / 1e6 - f) for f in self.lines_MHz])
+        omega = 2 * np.pi * self.rabi_MHz_0dBm * 10 ** (mw_dbm / 20.0) if mw_on else 0.0
+        state = np.zeros((3, detuning.size))
+        state[2] = 1.0
+
+        # run the program twice and count the second pass so the state is periodic
+        pl = {True: 0.0, False: 0.0}
+        t_half = {True: 0.0, False: 0.0}
+        for counting in (False, True):
+            for body, count in segments:
+                # loop bodies: one warm-up pass to reach the periodic state, then one pass
+                # weighted by the repeat count
+                passes = ((False, 0), (counting, count)) if count > 1 else ((counting, 1),)
+                for counted, weight in passes:
+                    for flags, t_us in body:
+                        dpl = self._step(state, flags, t_us, detuning, omega)
+                        if counted:
+                            ref = bool(flags & CH_REF)
+                            pl[ref] += weight * dpl
+                            t_half[ref] += weight * t_us
+        if t_half[True] == 0 or t_half[False] == 0:
+            return 0.0
+        diff = pl[True] / t_half[True] - pl[False] / t_half[False]
+        return self.volts_per_pl * math.sqrt(2) / math.pi * abs(diff)
+
+    def _step(self, state, flags, t_us, detuning, omega):
+        u, v, w = state
+        if flags & CH_LASER:
+            p1 = 0.5 * (1.0 - w.mean())
+            dpl = t_us - self.contrast * p1 * min(t_us, self.readout_us)
+            k = math.exp(-t_us / self.pump_us)
+            state[0] *= k
+            state[1] *= k
+            state[2] = 1.0 - (1.0 - w) * k
+            return dpl
+        if flags & CH_MW_I and omega > 0:
+            # rotation about (omega, 0, detuning), then damping towards the time average
+            wr = np.sqrt(omega ** 2 + detuning ** 2)
+            nx, nz = omega / wr, detuning / wr
+            a = wr * t_us
+            c, s = np.cos(a), np.sin(a)
+            dot = nx * u + nz * w
+            ru = u * c + (-nz * v) * s + nx * dot * (1 - c)
+            rv = v * c + (nz * u - nx * w) * s
+            rw = w * c + (nx * v) * s + nz * dot * (1 - c)
+            k = math.exp(-t_us / self.rabi_decay_us)
+            state[0] = ru * k + nx * dot * (1 - k)
+            state[1] = rv * k
+            state[2] = rw * k + nz * dot * (1 - k)
+            return 0.0
+        # free evolution
+        c, s = np.cos(detuning * t_us), np.sin(detuning * t_us)
+        k2 = math.exp(-t_us / self.T2_us)
+        state[0], state[1] = (u * c - v * s) * k2, (u * s + v * c) * k2
+        state[2] = w * math.exp(-t_us / self.T1_us)
+        return 0.0
+
+
+def _erfinv(y):
+    # Winitzki's approximation, plenty for choosing ensemble quantiles
+    a = 0.147
+    ln = np.log(1.0 - y * y)
+    t = 2.0 / (np.pi * a) + ln / 2.0
+    return np.sign(y) * np.sqrt(np.sqrt(t * t - ln / a) - t)
+
+
+def _branch_target(program):
+    for flags, opcode, data, length_ns in program:
+        if opcode == BRANCH:
+            return int(data)
+    return 0
+
+
+def _segments(program):
+    """Split an instruction list into [(body [(flags, t_us)], repeat)] following LOOP/END_LOOP.
+
+    The prologue (instructions before the BRANCH target) only runs once, so it is skipped.
+    """
+    segments = []
+    current = []
+    loop_count = 1
+    for flags, opcode, data, length_ns in program[_branch_target(program):]:
+        inst = (int(flags), float(length_ns) / 1000.0)
+        if opcode == LOOP:
+            if current:
+                segments.append((current, 1))
+            current, loop_count = [inst], int(data)
+        elif opcode == END_LOOP:
+            current.append(inst)
+            segments.append((current, loop_count))
+            current, loop_count = [], 1
+        else:
+            current.append(inst)
+            if opcode == BRANCH:
+                break
+    if current:
+        segments.append((current, 1))
+    return segments
+
+
+# per-call delays (s) SimLab.set_latency() accepts: PB programming (once, and per
+# instruction), pb_start/pb_stop, every SR830 write or query, every SynthHD setting
+LATENCY_KEYS = ("pb_program", "pb_inst", "pb_start", "gpib", "synth")
+
+# instrument each latency belongs to, for SimLab.io_s
+_INSTRUMENT = {"pb_program": "pb", "pb_inst": "pb", "pb_start": "pb", "gpib": "lockin", "synth": "synth"}
+
+
+def parse_latency(text):
+    """'gpib=2ms,synth=5ms,pb_inst=20us' -> {key: seconds}; bare numbers are seconds."""
+    scale = {"us": 1e-6, "µs": 1e-6, "ms": 1e-3, "s": 1.0}
+    out = {}
+    for part in filter(None, (p.strip() for p in text.split(","))):
+        key, _, value = part.partition("=")
+        key = key.strip()
+        if key not in LATENCY_KEYS:
+            raise ValueError(f"Unknown latency {key!r}, expected one of {LATENCY_KEYS}")
+        value = value.strip()
+        unit = next((u for u in scale if value.endswith(u)), "")
+        out[key] = float(value[:len(value) - len(unit)]) * scale.get(unit, 1.0)
+    return out
+
+
+class SimLab:
+    """Shared state of the simulated bench."""
+
+    def __init__(self, model=None):
+        self.model = model or NVModel()
+        self.lock = threading.RLock()
+        self.history = deque(maxlen=1000)   # (time, instructions) for every programmed sequence
+        self.program = []
+        self.running = False
+        self.clock_mhz = 100.0
+        self.mw = {1: dict(freq=2.87e9, power=0.0, enable=False), 2: dict(freq=2.87e9, power=0.0, enable=False)}
+        self.mw_regs = {1: {}, 2: {}}       # sweep registers written per channel
+        self.mw_channel = 1                 # channel the last register write selected
+        self.mw_trigger_mode = "disabled"
+        self.oflt = 6                       # 10 ms
+        self.ofsl = 1                       # 12 dB/oct
+        self._target = 0.0
+        self._from = 0.0
+        self._t0 = time.monotonic()
+        self._rng = np.random.default_rng()
+        self.latency = dict.fromkeys(LATENCY_KEYS, 0.0)
+        self.set_latency(**parse_latency(os.environ.get("NV_SIM_LATENCY", "")))
+        self.io_s = {"pb": 0.0, "lockin": 0.0, "synth": 0.0}   # time spent in each instrument's calls
+
+    # --- bus latencies ---
+    def set_latency(self, **seconds):
+        for key, value in seconds.items():
+            if key not in LATENCY_KEYS:
+                raise ValueError(f"Unknown latency {key!r}, expected one of {LATENCY_KEYS}")
+            self.latency[key] = float(value)
+
+    def reset_io(self):
+        for key in self.io_s:
+            self.io_s[key] = 0.0
+
+    @contextlib.contextmanager
+    def io(self, key, count=1):
+        """One instrument call: wait out its latency (`count` times), then do the work."""
+        t0 = time.perf_counter()
+        delay = self.latency[key] * count
+        if delay > 0:
+            time.sleep(delay)
+        try:
+            yield
+        finally:
+            self.io_s[_INSTRUMENT[key]] += time.perf_counter() - t0
+
+    # --- lock-in output model ---
+    def tau_s(self):
+        from hardware.sr830_control import TC_TABLE
+        return TC_TABLE[self.oflt]
+
+    def _filtered(self, now):
+        # step response of an n-pole RC filter: 1 - exp(-x) sum_{k<n} x^k/k!
+        x = (now - self._t0) / self.tau_s()
+        n = self.ofsl + 1
+        tail = math.exp(-x) * sum(x ** k / math.factorial(k) for k in range(n))
+        return self._target + (self._from - self._target) * tail
+
+    def mw_trigger(self, edges=1):
+        """Trigger pulses on the SynthHD input: step the armed sweep in single-step mode."""
+        with self.lock:
+            regs = self.mw_regs[self.mw_channel]
+            if self.mw_trigger_mode != "single frequency step" or not regs.get("sweep_single"):
+                return
+            ch = self.mw[self.mw_channel]
+            lo, hi = regs["sweep_freq_low"] * 1e6, regs["sweep_freq_high"] * 1e6
+            step = regs["sweep_freq_step"] * 1e6 * (1 if regs.get("sweep_direction", 1) else -1)
+            ch["freq"] = min(max(ch["freq"] + edges * step, lo), hi)
+        self.retarget()
+
+    def retarget(self):
+        with self.lock:
+            now = time.monotonic()
+            self._from = self._filtered(now)
+            self._t0 = now
+            if self.running:
+                ch = self.mw[1]
+                self._target = self.model.signal(self.program, ch["freq"], ch["power"], ch["enable"])
+            else:
+                self._target = 0.0
+
+    def output_xy(self):
+        x, y = self.output_xy_at([time.monotonic()])
+        return float(x[0]), float(y[0])
+
+    def output_xy_at(self, times):
+        """X, Y at the given monotonic times; noise is correlated over the time constant."""
+        with self.lock:
+            times = np.asarray(times, dtype=float)
+            r = np.array([self._filtered(t) for t in times])
+            tau = self.tau_s()
+            sigma = self.model.noise_V * math.sqrt(0.01 / tau)
+            noise = self._rng.normal(0, sigma, (2, times.size))
+            if times.size > 1:
+                rho = np.exp(-np.diff(times) / tau)
+                for k in range(1, times.size):
+                    noise[:, k] = rho[k - 1] * noise[:, k - 1] + math.sqrt(1 - rho[k - 1] ** 2) * noise[:, k]
+            phi = math.radians(self.model.phase_deg)
+            return r * math.cos(phi) + noise[0], r * math.sin(phi) + noise[1]
+
+
+LAB = SimLab()
+
+
+class _SimSpinAPI:
+    """Drop-in for the spinapi functions/constants the hardware modules use."""
+
+    PULSE_PROGRAM = 0
+    CONTINUE = CONTINUE
+    STOP = 1
+    LOOP = LOOP
+    END_LOOP = END_LOOP
+    JSR = 4
+    RTS = 5
+    BRANCH = BRANCH
+    LONG_DELAY = 7
+    WAIT = 8
+    ns = 1.0
+    us = 1000.0
+    ms = 1000000.0
+
+    def __init__(self, lab):
+        self.lab = lab
+        self._pending = None
+
+    def pb_select_board(self, board):
+        return 0
+
+    def pb_init(self):
+        return 0
+
+    def pb_core_clock(self, clock_mhz):
+        self.lab.clock_mhz = clock_mhz
+
+    def pb_start_programming(self, target):
+        self._pending = []
+        return 0
+
+    def pb_inst_pbonly(self, flags, inst, inst_data, length):
+        self._pending.append((int(flags), int(inst), int(inst_data), float(length)))
+        return len(self._pending) - 1
+
+    def pb_stop_programming(self):
+        with self.lab.io("pb_program"), self.lab.io("pb_inst", len(self._pending)):
+            with self.lab.lock:
+                self.lab.program = self._pending
+                self.lab.history.append((time.monotonic(), list(self._pending)))
+        self._pending = None
+        return 0
+
+    def pb_start(self):
+        with self.lab.io("pb_start"):
+            # trigger pulses in the prologue reach the SynthHD once per start
+            prologue = self.lab.program[:_branch_target(self.lab.program)]
+            levels = [0] + [flags & CH_MW_TRIG for flags, *_ in prologue]
+            edges = sum(1 for a, b in zip(levels, levels[1:]) if b and not a)
+            if edges:
+                self.lab.mw_trigger(edges)
+            self.lab.running = True
+            self.lab.retarget()
+        return 0
+
+    def pb_stop(self):
+        with self.lab.io("pb_start"):
+            self.lab.running = False
+            self.lab.retarget()
+        return 0
+
+    def pb_reset(self):
+        return 0
+
+    def pb_close(self):
+        self.lab.running = False
+        self.lab.retarget()
+        return 0
+
+    def pb_get_error(self):
+        return ""
+
+
+spinapi = _SimSpinAPI(LAB)
+
+
+class SimSR830:
+    """pyvisa-resource look-alike answering the SR830 commands the drivers send."""
+
+    def __init__(self, lab, addr, timeout=5000):
+        self.lab = lab
+        self.resource_name = addr
+        self.timeout = timeout
+        self.settings = {"SRAT": "13"}
+        self._buf_start = None
+        self._buf_stop = None
+        self._buf_xy = None
+        self._ddef = {1: 0, 2: 0}
+
+    def clear(self):
+        pass
+
+    def close(self):
+        pass
+
+    def write(self, cmd):
+        with self.lab.io("gpib"):
+            self._write(cmd)
+
+    def _write(self, cmd):
+        for part in cmd.split(";"):
+            part = part.strip()
+            if not part:
+                continue
+            name, _, arg = part.partition(" ")
+            name = name.upper()
+            if name == "REST":
+                self._buf_start = self._buf_stop = None
+                self._buf_xy = None
+            elif name == "DDEF":
+                ch, what = arg.split(",")[:2]
+                self._ddef[int(ch)] = int(what)
+            elif name == "STRT":
+                self._buf_start, self._buf_stop = time.monotonic(), None
+                self._buf_xy = None
+            elif name == "PAUS":
+                self._buf_stop = time.monotonic()
+            elif name == "OFLT":
+                self.lab.oflt = int(arg)
+                self.lab.retarget()
+            elif name == "OFSL":
+                self.lab.ofsl = int(arg)
+                self.lab.retarget()
+            else:
+                self.settings[name] = arg
+
+    def query(self, cmd):
+        with self.lab.io("gpib"):
+            return self._query(cmd)
+
+    def _query(self, cmd):
+        name, _, arg = cmd.strip().partition(" ")
+        name = name.upper()
+        if name == "*IDN?":
+            return "Stanford_Research_Systems,SR830,s/n00000,ver1.07 (simulated)\n"
+        if name == "OFLT?":
+            return f"{self.lab.oflt}\n"
+        if name == "OFSL?":
+            return f"{self.lab.ofsl}\n"
+        if name == "OUTP?":
+            return f"{self._output(int(arg)):.6e}\n"
+        if name == "SNAP?":
+            x, y = self.lab.output_xy()
+            return ",".join(f"{self._from_xy(x, y, int(i)):.6e}" for i in arg.split(",")) + "\n"
+        if name == "SPTS?":
+            return f"{self._buffered_points()}\n"
+        if name.endswith("?") and name[:-1] in self.settings:
+            return f"{self.settings[name[:-1]]}\n"
+        raise ValueError(f"Simulated SR830 does not understand {cmd!r}")
+
+    def query_binary_values(self, cmd, datatype="f", is_big_endian=False, header_fmt="empty",
+                            expect_termination=False, data_points=0, container=list):
+        with self.lab.io("gpib"):
+            return self._binary(cmd, container)
+
+    def _binary(self, cmd, container):
+        name, _, arg = cmd.strip().partition(" ")
+        if name.upper() != "TRCB?":
+            raise ValueError(f"Simulated SR830 has no binary reply for {cmd!r}")
+        ch, start, count = (int(a) for a in arg.split(","))
+        if self._buf_xy is None:
+            # the whole buffer is generated once so CH1 and CH2 see the same noise
+            rate = 0.0625 * 2 ** int(self.settings.get("SRAT", 13))
+            n = self._buffered_points()
+            self._buf_xy = self.lab.output_xy_at(self._buf_start + (np.arange(n) + 1) / rate)
+        x, y = (a[start:start + count] for a in self._buf_xy)
+        what = self._ddef[ch]
+        if ch == 1:
+            data = x if what == 0 else np.hypot(x, y)
+        else:
+            data = y if what == 0 else np.degrees(np.arctan2(y, x))
+        return container(data.astype(np.float32).tolist())
+
+    def _buffered_points(self):
+        if self._buf_start is None:
+            return 0
+        end = self._buf_stop if self._buf_stop is not None else time.monotonic()
+        rate = 0.0625 * 2 ** int(self.settings.get("SRAT", 13))
+        return min(int((end - self._buf_start) * rate), 16383)
+
+    def _output(self, i):
+        x, y = self.lab.output_xy()
+        return self._from_xy(x, y, i)
+
+    @staticmethod
+    def _from_xy(x, y, i):
+        return {1: x, 2: y, 3: math.hypot(x, y), 4: math.degrees(math.atan2(y, x))}[i]
+
+
+class SimResourceManager:
+
+    def __init__(self, lab=None):
+        self.lab = lab or LAB
+
+    def open_resource(self, addr, timeout=5000, **kwargs):
+        return SimSR830(self.lab, addr, timeout=timeout)
+
+    def close(self):
+        pass
+
+
+class SimSynthHDChannel:
+
+    def __init__(self, lab, index):
+        self._lab = lab
+        self._index = index
+
+    def _set(self, key, value):
+        with self._lab.io("synth"):
+            self._lab.mw[self._index + 1][key] = value
+            self._lab.retarget()
+
+    @property
+    def frequency(self):
+        return self._lab.mw[self._index + 1]["freq"]
+
+    @frequency.setter
+    def frequency(self, value):
+        self._set("freq", float(value))
+
+    @property
+    def power(self):
+        return self._lab.mw[self._index + 1]["power"]
+
+    @power.setter
+    def power(self, value):
+        self._set("power", float(value))
+
+    @property
+    def enable(self):
+        return self._lab.mw[self._index + 1]["enable"]
+
+    @enable.setter
+    def enable(self, value):
+        self._set("enable", bool(value))
+
+    @property
+    def lock_status(self):
+        return True
+
+    def write(self, attribute, *args):
+        with self._lab.io("synth"):
+            self._lab.mw_channel = self._index + 1
+            self._lab.mw_regs[self._index + 1][attribute] = args[0] if len(args) == 1 else args
+
+    def read(self, attribute, *args):
+        with self._lab.io("synth"):
+            self._lab.mw_channel = self._index + 1
+            if attribute == "pll_lock":
+                return True
+            return self._lab.mw_regs[self._index + 1].get(attribute)
+
+
+class SimSynthHD:
+    """windfreak.SynthHD look-alike (two channels, frequency/power/enable)."""
+
+    model = "SynthHD PRO v2 (simulated)"
+
+    def __init__(self, devpath, lab=None):
+        self._lab = lab or LAB
+        self.devpath = devpath
+        self._channels = [SimSynthHDChannel(self._lab, i) for i in range(2)]
+
+    def __getitem__(self, key):
+        return self._channels[key]
+
+    def __len__(self):
+        return len(self._channels)
+
+    @property
+    def trigger_mode(self):
+        return self._lab.mw_trigger_mode
+
+    @trigger_mode.setter
+    def trigger_mode(self, value):
+        self._lab.mw_trigger_mode = value
+
+    def init(self):
+        self.trigger_mode = "disabled"
+        for ch in self._channels:
+            ch.enable = False
+
+    def close(self):
+        pass
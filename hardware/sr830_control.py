@@ -1,4 +1,8 @@
-import pyvisa
+import contextlib
+import math
+import time
+import numpy as np
+from hardware import backend
 
 # SR830 settings
 
@@ -6,27 +10,43 @@ VISA_ADDR = "GPIB0::1::INSTR"
 TIME_CONST_S = 0.01       # lock-in time constant = 10 ms
 SETTLE_FACTOR = 5         # wait ~5× time constant before reading
 
+# OFSL index -> time constants to settle within 1% of a step (SR830 manual)
+SLOPE_SETTLE_TC = {0: 5, 1: 7, 2: 9, 3: 10}   # 6, 12, 18, 24 dB/oct
+SETTLE_RTOL = 0.01        # after SLOPE_SETTLE_TC, successive readings must agree to 1% of the step ...
+SETTLE_ATOL = 0.0         # ... or to this many volts
+SETTLE_MAX_TC = 15        # give up and read anyway after 15 time constants
+
+# Internal data buffer: SRAT index -> sample rate (Hz), 62.5 mHz * 2^i up to 512 Hz
+SRAT_HZ = {i: 0.0625 * 2 ** i for i in range(14)}
+BUFFER_RATE_INDEX = 13    # 512 Hz
+BUFFER_MAX = 16383        # points the buffer holds
+
+# SNAP?/OUTP? parameter numbers
+SNAP_PARAMS = {"X": 1, "Y": 2, "R": 3, "THETA": 4}
+
 TC_TABLE={0:10e-6, 1:30e-6, 2:100e-6, 3:300e-6, 4:1e-3, 5:3e-3, 6:10e-3, 7:30e-3, 8:100e-3, 9:300e-3, 10:1, 11:3, 12:10, 13:30, 14:100, 15:300}
 
 
 def init_sr830(VISA_ADDR = "GPIB0::1::INSTR"):
-    rm = pyvisa.ResourceManager()
+    rm = backend.resource_manager()
     li = rm.open_resource(VISA_ADDR, timeout=5000)
     li.clear()
     idn = li.query("*IDN?").strip()
     tc= int(li.query("OFLT?"))
     # print(f"Connected to {idn}")
 
-    # Basic setup
-    li.write("OUTX 1")      # GPIB
-    li.write("FMOD 0")      # external reference
-    li.write("RSLP 1")      # rising edge
-    li.write("HARM 1")      # fundamental
-    li.write("ISRC 0")      # input A
-    # li.write("ICPL 0")      # AC coupling
-    # li.write("OFSL 2")      # 24 dB/oct
-    # li.write(f"OFLT {oflt_index}")      # time constant
-    li.write("PHAS 0")      # phase adjust manually if needed
+    # Basic setup, sent as one batch
+    sr830_write_batch(li, [
+        "OUTX 1",       # GPIB
+        "FMOD 0",       # external reference
+        "RSLP 1",       # rising edge
+        "HARM 1",       # fundamental
+        "ISRC 0",       # input A
+        # "ICPL 0",     # AC coupling
+        # "OFSL 2",     # 24 dB/oct
+        # f"OFLT {oflt_index}",     # time constant
+        "PHAS 0",       # phase adjust manually if needed
+    ])
     return rm, li, TC_TABLE.get(tc)
 
 def sr830_read_R(li):
@@ -36,4 +56,117 @@ def sr830_read_R(li):
 
 def sr830_read_X(li):
     val=float(li.query("OUTP? 1"))
-    return val
\ No newline at end of file
+    return val
+
+def sr830_write_batch(li, commands):
+    """Send several setup commands in one GPIB write (SR830 accepts ';'-separated commands)."""
+    li.write(";".join(commands))
+
+def sr830_snap(li, *names):
+    """Read several outputs atomically with one SNAP? query, e.g. sr830_snap(li, "X", "Y").
+
+    Returns {name: value}; defaults to X, Y, R, THETA (volts / degrees).
+    """
+    names = names or ("X", "Y", "R", "THETA")
+    vals = li.query("SNAP? " + ",".join(str(SNAP_PARAMS[n.upper()]) for n in names))
+    return {n.upper(): float(v) for n, v in zip(names, vals.strip().split(","))}
+
+def sr830_filter_slope(li):
+    """Output filter slope index (OFSL?): 0=6, 1=12, 2=18, 3=24 dB/oct."""
+    return int(li.query("OFSL?"))
+
+def sr830_settle(li, tau_s, slope=1, rtol=SETTLE_RTOL, atol=SETTLE_ATOL, max_wait_s=None):
+    """Wait for the output to settle after a step and return the settled R (volts).
+
+    Always waits the 1% settling time of the filter (SLOPE_SETTLE_TC time constants for
+    the slope), then polls the output about ten times per that time. The step is measured
+    from the reading on entry (still the previous point). The point counts as settled once
+    two successive changes in R are within rtol*|step| + atol, or as soon as one goes
+    against the step: the filter output creeps towards its new value monotonically, so
+    what is left is noise. After max_wait_s (15 tau by default) the current reading is
+    returned regardless.
+    """
+    return sr830_settle_snap(li, tau_s, slope, rtol, atol, max_wait_s)["R"]
+
+def sr830_settle_snap(li, tau_s, slope=1, rtol=SETTLE_RTOL, atol=SETTLE_ATOL, max_wait_s=None):
+    """Same as sr830_settle but polls with SNAP? and returns the final X, Y, R, THETA dict."""
+    tau_s = float(tau_s)
+    if max_wait_s is None:
+        max_wait_s = SETTLE_MAX_TC * tau_s
+    settle_s = SLOPE_SETTLE_TC.get(slope, 10) * tau_s
+    poll_s = max(settle_s / 10.0, 1e-3)
+    t0 = time.monotonic()
+    start = sr830_snap(li)
+    # polling only decides when to stop after the filter has had its settling time
+    time.sleep(min(settle_s, max_wait_s))
+
+    prev = sr830_snap(li)
+    calm = 0
+    while time.monotonic() - t0 < max_wait_s:
+        time.sleep(poll_s)
+        snap = sr830_snap(li)
+        change, step = snap["R"] - prev["R"], snap["R"] - start["R"]
+        if change * step < 0:
+            return snap
+        if abs(change) <= rtol * abs(step) + atol:
+            calm += 1
+            if calm >= 2:
+                return snap
+        else:
+            calm = 0
+        prev = snap
+    return prev
+
+def sr830_read_buffered(li, n_samples=256, rate_index=BUFFER_RATE_INDEX, tau_s=None):
+    """Fill the SR830 data buffer with X/Y samples and fetch them as binary (TRCB?).
+
+    Returns dict(mean=, sem=, samples=) for R plus the mean X, Y and THETA. When tau_s is
+    given the standard error accounts for samples taken closer together than the filter
+    correlation time (~2 tau).
+    """
+    n = int(min(max(n_samples, 2), BUFFER_MAX))
+    rate = SRAT_HZ[rate_index]
+    sr830_write_batch(li, [
+        "DDEF 1,0,0",           # CH1 display/buffer = X
+        "DDEF 2,0,0",           # CH2 display/buffer = Y
+        f"SRAT {rate_index}",
+        "SEND 0",               # single shot, stop when full
+        "TSTR 0",               # start on STRT, not on a trigger
+        "REST",
+        "STRT",
+    ])
+    time.sleep(n / rate)
+    deadline = time.monotonic() + 2.0 + n / rate
+    while int(li.query("SPTS?")) < n and time.monotonic() < deadline:
+        time.sleep(1.0 / rate)
+    li.write("PAUS")
+    n = min(n, int(li.query("SPTS?")))
+    x, y = (np.asarray(li.query_binary_values(f"TRCB? {ch},0,{n}", datatype="f", is_big_endian=False,
+                                              header_fmt="empty", expect_termination=False,
+                                              data_points=n, container=np.array), dtype=float)
+            for ch in (1, 2))
+    samples = np.hypot(x, y)
+    n_eff = n
+    if tau_s:
+        n_eff = max(1.0, n * min(1.0, 1.0 / (rate * 2.0 * float(tau_s))))
+    sem = float(np.std(samples, ddof=1) / math.sqrt(n_eff)) if n > 1 else float("nan")
+    X, Y = float(np.mean(x)), float(np.mean(y))
+    return dict(mean=float(np.mean(samples)), sem=sem, samples=samples,
+                X=X, Y=Y, THETA=math.degrees(math.atan2(Y, X)))
+
+def sr830_point(li, tau_s, slope=1, rtol=SETTLE_RTOL, buffer_samples=0, timer=None):
+    """Settle, then take one point: a single SNAP? reading, or buffer means if buffer_samples > 0.
+
+    Returns dict(X=, Y=, R=, THETA=, R_err=, samples=); R_err is NaN and samples None for a
+    single reading. With a timer (experiments.timing.SpanTimer) the settling and the buffer
+    readout are timed as the "settle" and "buffer" spans.
+    """
+    span = timer.span if timer is not None else (lambda name: contextlib.nullcontext())
+    with span("settle"):
+        snap = sr830_settle_snap(li, tau_s, slope, rtol=rtol)
+    if buffer_samples and buffer_samples > 0:
+        with span("buffer"):
+            buf = sr830_read_buffered(li, buffer_samples, tau_s=tau_s)
+        return dict(X=buf["X"], Y=buf["Y"], R=buf["mean"], THETA=buf["THETA"],
+                    R_err=buf["sem"], samples=buf["samples"])
+    return dict(snap, R_err=float("nan"), samples=None)
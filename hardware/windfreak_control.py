@@ -1,31 +1,151 @@
-from windfreak import SynthHD #install this!
+import time
+
+import numpy as np
+
+from hardware import backend  # real device needs windfreak installed
+
+# PLL lock polling after a software frequency step
+LOCK_POLL_S = 0.0005
+LOCK_TIMEOUT_S = 0.05
 
 
 class WindfreakSynth:
+    """SynthHD driver that keeps a shadow copy of each channel's frequency, power and
+    enable state and only writes to the serial port when a value actually changes.
+
+    If something else touches the synth (front panel, another program) call invalidate()
+    or resync(). `writes` / `writes_avoided` count sent and skipped settings.
+    """
 
     def __init__(self, serial="COM3"):
         """Connect to SynthHD Pro. If multiple units, specify serial number."""
-        self.dev= SynthHD(serial)
+        self.dev= backend.synth_hd(serial)
         self.dev.init()
+        self._sweep = None
+        self.writes = 0
+        self.writes_avoided = 0
+        self._shadow = {}
+        self.invalidate()
         # Ensure both channels start off
         for ch in (1, 2):
-            self.dev[ch - 1].enable = False
+            self.rf_off(ch)
+
+    # --- shadow state ---
+    def _set(self, ch: int, key: str, attr: str, value):
+        if self._shadow[ch][key] == value:
+            self.writes_avoided += 1
+            return False
+        try:
+            setattr(self.dev[ch - 1], attr, value)
+        except Exception:
+            self._shadow[ch][key] = None  # state unknown after a failed write
+            raise
+        self._shadow[ch][key] = value
+        self.writes += 1
+        return True
+
+    def invalidate(self, ch: int | None = None):
+        """Forget the cached state so the next set_* call writes unconditionally."""
+        for c in ((1, 2) if ch is None else (ch,)):
+            self._shadow[c] = dict(freq=None, power=None, enable=None)
+
+    def resync(self):
+        """Read the real channel state back into the cache."""
+        for ch in (1, 2):
+            c = self.dev[ch - 1]
+            self._shadow[ch] = dict(freq=c.frequency, power=c.power, enable=c.enable)
+
+    def stats(self):
+        return {"writes": self.writes, "writes_avoided": self.writes_avoided}
 
     def set_freq(self, ch: int, freq_hz: float):
         """Set output frequency for channel `ch` (1 or 2)."""
-        self.dev[ch - 1].frequency = freq_hz
+        return self._set(ch, "freq", "frequency", float(freq_hz))
 
     def set_power(self, ch: int, dbm: float):
         """Set output power in dBm."""
-        self.dev[ch - 1].power = dbm
+        return self._set(ch, "power", "power", float(dbm))
 
     def rf_on(self, ch: int):
         """Turn channel ON."""
-        self.dev[ch - 1].enable = True
+        return self._set(ch, "enable", "enable", True)
 
     def rf_off(self, ch: int):
         """Turn channel OFF."""
-        self.dev[ch - 1].enable = False
+        return self._set(ch, "enable", "enable", False)
+
+    def wait_lock(self, ch: int, timeout_s: float = LOCK_TIMEOUT_S):
+        """Poll the PLL lock flag; returns the time it took (the measured settle time)."""
+        t0 = time.perf_counter()
+        while not self.dev[ch - 1].lock_status:
+            if time.perf_counter() - t0 > timeout_s:
+                raise RuntimeError(f"SynthHD channel {ch} did not lock within {timeout_s*1e3:.0f} ms")
+            time.sleep(LOCK_POLL_S)
+        return time.perf_counter() - t0
+
+    # --- frequency sweeps ---
+    def sweep_load(self, ch: int, freqs_hz, trigger: str = "software"):
+        """Load a frequency table for sweep_step() and tune to its first point.
+
+        trigger="external": the table goes into the SynthHD's linear sweep registers and
+        every pulse on its trigger input steps one point ('single frequency step' trigger
+        mode), so stepping needs no serial traffic. The table must be evenly spaced.
+        trigger="software": sweep_step() retunes over serial and waits for PLL lock.
+        """
+        freqs_hz = np.asarray(freqs_hz, dtype=float)
+        if trigger not in ("software", "external"):
+            raise ValueError(f"Unknown trigger {trigger!r}, expected 'software' or 'external'")
+        if trigger == "external":
+            steps = np.diff(freqs_hz)
+            if len(steps) == 0 or not np.allclose(steps, steps[0], rtol=1e-9, atol=1.0):
+                raise ValueError("External-trigger sweeps need an evenly spaced frequency table")
+            c = self.dev[ch - 1]
+            c.write("sweep_freq_low", float(freqs_hz.min()) / 1e6)
+            c.write("sweep_freq_high", float(freqs_hz.max()) / 1e6)
+            c.write("sweep_freq_step", abs(float(steps[0])) / 1e6)
+            power = self._shadow[ch]["power"]
+            if power is None:
+                power = c.power
+            c.write("sweep_power_low", power)
+            c.write("sweep_power_high", power)
+            c.write("sweep_direction", 1 if steps[0] > 0 else 0)
+            c.write("sweep_type", 0)  # linear
+            self.dev.trigger_mode = "single frequency step"
+            c.write("sweep_single", True)  # arm; each trigger edge moves one step
+        if trigger == "external":
+            self._shadow[ch]["freq"] = None  # the synth moved on its own during the last sweep
+        self.set_freq(ch, freqs_hz[0])
+        self._sweep = dict(ch=ch, freqs=freqs_hz, trigger=trigger, index=0)
+        return self.wait_lock(ch)
+
+    def sweep_step(self, ch: int, index: int):
+        """Go to point `index` of the loaded table; returns the measured settle time in s.
+
+        With an external trigger the step itself is a pulse on the trigger input (e.g. a
+        PulseBlaster prologue on CH_MW_TRIG), so this only keeps track of the index.
+        """
+        sweep = self._sweep
+        if sweep is None or sweep["ch"] != ch:
+            raise RuntimeError(f"No sweep loaded on channel {ch}")
+        if index == sweep["index"]:
+            return 0.0
+        if sweep["trigger"] == "external":
+            if index != sweep["index"] + 1:
+                raise ValueError("External-trigger sweeps can only step forward one point")
+            sweep["index"] = index
+            self._shadow[ch]["freq"] = float(sweep["freqs"][index])  # expected after the trigger
+            return 0.0
+        self.set_freq(ch, sweep["freqs"][index])
+        sweep["index"] = index
+        return self.wait_lock(ch)
+
+    def sweep_stop(self):
+        """Leave sweep mode (trigger input ignored again)."""
+        sweep = self._sweep
+        self._sweep = None
+        if sweep is not None and sweep["trigger"] == "external":
+            self.dev[sweep["ch"] - 1].write("sweep_single", False)
+            self.dev.trigger_mode = "disabled"
 
     def close(self):
         """Safely disable outputs and close connection."""
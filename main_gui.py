@@ -1,13 +1,15 @@
 # main_gui.py (PyQt6)
-import sys, traceback
+import os, sys, traceback
 from PyQt6.QtWidgets import (
     QApplication, QMainWindow, QTabWidget, QWidget, QVBoxLayout, QHBoxLayout,
-    QLabel, QTextEdit, QPushButton, QGroupBox, QFormLayout, QDoubleSpinBox, QSpinBox, QFileDialog
+    QLabel, QTextEdit, QPushButton, QGroupBox, QFormLayout, QDoubleSpinBox, QSpinBox, QFileDialog, QCheckBox, QComboBox
 )
 from PyQt6.QtCore import Qt, QObject, pyqtSignal, QThread
-from experiments.mpl_canvas import MplCanvas
-import numpy as np
-import csv
+from experiments.mpl_canvas import MplCanvas, LivePlot
+from hardware.session import HardwareSession
+from experiments.run_store import RunStore, RUN_DIR, load_run, write_result_csv
+from experiments.cancel import CancelToken
+from experiments.timing import profiled
 
 # Experiment runners (signature: run(ax, emit, **params))
 # try:
@@ -36,14 +38,23 @@ class EmitProxy(QObject):
 
 
 class Worker(QThread):
-    def __init__(self, fn, ax, params):
+    def __init__(self, fn, plot, params, name=None, resume_path=None):
         super().__init__()
         self.fn = fn
-        self.ax = ax
+        self.plot = plot  # PlotSink, drawn by the GUI thread
         self.params = params
+        self.name = name  # set to stream points to a RunStore
+        self.resume_path = resume_path  # append to this run instead of starting a new one
+        self.run_path = None
+        self.cancel = CancelToken()
         self.emitter = EmitProxy()
 
+    def requestInterruption(self):
+        self.cancel.cancel()
+        super().requestInterruption()
+
     def run(self):
+        store = None
         try:
             def emit(**kwargs):
                 if "line" in kwargs:
@@ -52,20 +63,45 @@ class Worker(QThread):
                     self.emitter.status.emit(kwargs["status"])  # status text
                 if "progress" in kwargs:
                     self.emitter.progress.emit(float(kwargs["progress"]))  # 0..1
-            # Fresh axes each run
-            self.ax.clear()
-            result = self.fn(self.ax, emit, **self.params)
+            params = dict(self.params, cancel=self.cancel)
+            if self.resume_path:
+                store = RunStore.resume(self.resume_path, self.params)
+                params["store"] = store
+                emit(line=f"Resuming {store.path} ({store.n_points} points already taken)")
+            elif self.name:
+                store = RunStore(self.name, params)
+                params["store"] = store
+                emit(line=f"Streaming points to {store.path}")
+            if store is not None:
+                self.run_path = store.path
+            # NV_PROFILE=cprofile|pyinstrument profiles the run
+            with profiled(emit=lambda text: emit(line=text)):
+                result = self.fn(self.plot, emit, **params)
+            if store is not None:
+                store.close(self.cancel.end_status())
             self.emitter.finished.emit(result)
+        except InterruptedError as e:
+            # stopped while another tab still had the hardware
+            if store is not None:
+                try: store.close("interrupted")
+                except: pass
+            self.emitter.message.emit(str(e))
+            self.emitter.finished.emit(None)
         except Exception as e:
             tb = traceback.format_exc()
+            if store is not None:
+                try: store.close("error")
+                except: pass
             self.emitter.error.emit(f"{e}\n{tb}")
 
 
 class ExperimentTab(QWidget):
     """Reusable tab: parameters panel + run/stop + plot + log."""
-    def __init__(self, title: str, runner, form_widget: QWidget):
+    def __init__(self, title: str, runner, form_widget: QWidget, session: HardwareSession | None = None):
         super().__init__()
+        self.title = title
         self.runner = runner
+        self.session = session  # shared instruments (None = each run opens its own)
         self.form_widget = form_widget  # provides get_params()
 
         v = QVBoxLayout(self)
@@ -78,16 +114,19 @@ class ExperimentTab(QWidget):
 
         # Plot canvas
         self.canvas = MplCanvas(self, width=6, height=4, dpi=100)
+        self.live = LivePlot(self.canvas)  # redraws from the worker's data at <= 10 fps
 
         # Buttons
         btn_row = QHBoxLayout()
         self.btn_run = QPushButton("Run")
         self.btn_stop = QPushButton("Stop")
         self.btn_save = QPushButton("Save .csv")
+        self.btn_resume = QPushButton("Resume…")
         self.btn_stop.setEnabled(False)
         self.btn_save.setEnabled(False)
         btn_row.addWidget(self.btn_run)
         btn_row.addWidget(self.btn_stop)
+        btn_row.addWidget(self.btn_resume)
         btn_row.addWidget(self.btn_save)
 
         # Status + log
@@ -102,7 +141,10 @@ class ExperimentTab(QWidget):
         v.addWidget(self.log)
 
         self.worker: Worker | None = None
+        self.last_result = None
+        self.last_run_path = None  # run file of the last unfinished run, for Resume
         self.btn_run.clicked.connect(self.start_experiment)
+        self.btn_resume.clicked.connect(self.resume_experiment)
         self.btn_stop.clicked.connect(self.stop_experiment)
         self.btn_save.clicked.connect(self.save_csv)
 
@@ -119,39 +161,58 @@ class ExperimentTab(QWidget):
         try:
             
             if isinstance(self.last_result, dict):
-                keys = list(self.last_result.keys())
-                # Handle dict-like results (e.g., {'x': [...], 'y': [...]})
-                x = np.array(self.last_result.get(keys[0], []))
-                y = np.array(self.last_result.get(keys[1], []))
+                # Handle dict-like results (e.g., {'x': [...], 'y': [...], 'y_err': [...]})
+                write_result_csv(path, self.last_result)
             elif isinstance(self.last_result, (list, tuple)) and len(self.last_result) == 2:
-                x, y = map(np.array, self.last_result)
+                x, y = self.last_result
+                write_result_csv(path, {"x": list(x), "y": list(y)})
             else:
                 self.log.append("Unsupported data format for CSV export.")
                 return
 
-            with open(path, "w", newline="") as f:
-                writer = csv.writer(f)
-                try:
-                    writer.writerow(keys)
-                except:
-                    writer.writerow("x","y")
-                for xi, yi in zip(x, y):
-                    writer.writerow([xi, yi])
-
             self.log.append(f"Saved CSV to {path}")
         except Exception as e:
             self.log.append(f"Error saving CSV: {e}")
 
 
-    def start_experiment(self):
+    def resume_experiment(self):
+        """Continue an interrupted run: only the missing points, same parameters, same file."""
         if self.worker is not None and self.worker.isRunning():
             return
-        params = self.form_widget.get_params()
+        path = self.last_run_path
+        if path is None:
+            path, _ = QFileDialog.getOpenFileName(self, "Resume run", RUN_DIR, "Runs (*.h5 params.json)")
+            if not path:
+                return
+            if os.path.basename(path) == "params.json":
+                path = os.path.dirname(path)
+        try:
+            meta, _ = load_run(path)
+        except Exception as e:
+            self.log.append(f"Cannot resume {path}: {e}")
+            return
+        if meta["experiment"] != self.title:
+            self.log.append(f"{path} is a {meta['experiment']} run, not {self.title}.")
+            return
+        self.start_experiment(params=dict(meta["params"]), resume_path=path)
+
+    def start_experiment(self, checked=False, params=None, resume_path=None):
+        if self.worker is not None and self.worker.isRunning():
+            return
+        if params is None:
+            params = self.form_widget.get_params()
         self.log.append(f"Starting with params: {params}")
+        if self.session is not None:
+            if self.session.busy():
+                self.log.append("Hardware busy with another tab, waiting for it to finish…")
+            params["session"] = self.session
         self.status_lbl.setText("Running…")
-        self.btn_run.setEnabled(False); self.btn_stop.setEnabled(True)
+        self.btn_run.setEnabled(False); self.btn_stop.setEnabled(True); self.btn_resume.setEnabled(False)
 
-        self.worker = Worker(self.runner, self.canvas.ax, params)
+        # Fresh axes each run
+        sink = self.live.reset()
+        self.live.start()
+        self.worker = Worker(self.runner, sink, params, name=self.title, resume_path=resume_path)
         self.worker.emitter.message.connect(self.on_message)
         self.worker.emitter.status.connect(self.on_status)
         self.worker.emitter.progress.connect(self.on_progress)
@@ -168,7 +229,6 @@ class ExperimentTab(QWidget):
     def on_message(self, text: str):
         if text:
             self.log.append(text)
-            self.canvas.draw()
 
     def on_status(self, text: str):
         self.status_lbl.setText(text)
@@ -177,18 +237,21 @@ class ExperimentTab(QWidget):
         self.status_lbl.setText(f"Running… {int(frac*100)}%")
 
     def on_finished(self, result):
-        self.btn_run.setEnabled(True); self.btn_stop.setEnabled(False)
-        self.status_lbl.setText("Done")
-        self.log.append("Finished.")
+        self.btn_run.setEnabled(True); self.btn_stop.setEnabled(False); self.btn_resume.setEnabled(True)
+        interrupted = self.worker.cancel.end_status() == "interrupted"
+        self.last_run_path = self.worker.run_path if interrupted else None
+        self.status_lbl.setText("Stopped" if interrupted else "Done")
+        self.log.append("Stopped, Resume continues the missing points." if interrupted else "Finished.")
         self.last_result = result
         self.btn_save.setEnabled(True)
-        self.canvas.draw()
+        self.live.stop()
 
     def on_error(self, text: str):
-        self.btn_run.setEnabled(True); self.btn_stop.setEnabled(False)
+        self.btn_run.setEnabled(True); self.btn_stop.setEnabled(False); self.btn_resume.setEnabled(True)
+        self.last_run_path = self.worker.run_path
         self.status_lbl.setText("Error")
         self.log.append(f"<pre>{text}</pre>")
-        self.canvas.draw()
+        self.live.stop()
 
 
 # -------- Parameter Forms (per tab) --------
@@ -203,10 +266,15 @@ class T1Form(QWidget):
         self.max_tau_us = QDoubleSpinBox(); self.max_tau_us.setRange(10.0, 1e6); self.max_tau_us.setValue(4000.0); self.max_tau_us.setSuffix(" µs")
         self.points = QSpinBox(); self.points.setRange(1, 2000); self.points.setValue(15)
         self.loops= QSpinBox(); self.loops.setRange(1,1000); self.loops.setValue(1)
-        for label, w in [("Tref", self.tref_ms),("Init", self.init_us),("Second", self.second_us),("Read", self.read_us),("Max τ", self.max_tau_us),("Points", self.points),("Loops",self.loops)]:
+        self.dark_reset = QCheckBox("between points")
+        self.buffer_samples = QSpinBox(); self.buffer_samples.setRange(0, 16383); self.buffer_samples.setValue(0); self.buffer_samples.setSpecialValueText("off (single read)")
+        self.sampling = QComboBox(); self.sampling.addItems(["uniform", "log", "adaptive"]) #adaptive: refits after every point to choose the next τ
+        self.live_fit = QCheckBox("refit while measuring")
+        self.stop_rtol = QDoubleSpinBox(); self.stop_rtol.setRange(0.0, 50.0); self.stop_rtol.setValue(0.0); self.stop_rtol.setSuffix(" %"); self.stop_rtol.setSpecialValueText("off") #stop once the key fit parameter is known to this relative error
+        for label, w in [("Tref", self.tref_ms),("Init", self.init_us),("Second", self.second_us),("Read", self.read_us),("Max τ", self.max_tau_us),("Points", self.points),("Loops",self.loops),("Dark reset",self.dark_reset),("Buffer samples",self.buffer_samples),("Sampling",self.sampling),("Live fit",self.live_fit),("Stop at error",self.stop_rtol)]:
             f.addRow(QLabel(label+":"), w)
     def get_params(self):
-        return dict(tref_ms=self.tref_ms.value(), init_us=self.init_us.value(), second_us=self.second_us.value(), read_us=self.read_us.value(), max_tau_us=self.max_tau_us.value(), points=int(self.points.value()), loops=int(self.loops.value()))
+        return dict(tref_ms=self.tref_ms.value(), init_us=self.init_us.value(), second_us=self.second_us.value(), read_us=self.read_us.value(), max_tau_us=self.max_tau_us.value(), points=int(self.points.value()), loops=int(self.loops.value()), dark_reset=self.dark_reset.isChecked(), buffer_samples=int(self.buffer_samples.value()), sampling=self.sampling.currentText(), live_fit=self.live_fit.isChecked(), stop_rtol=self.stop_rtol.value()/100)
 
 class PulsedODMRForm(QWidget):
     def __init__(self):
@@ -219,10 +287,17 @@ class PulsedODMRForm(QWidget):
         self.tref_us = QDoubleSpinBox(); self.tref_us.setRange(0.2, 1000000.0); self.tref_us.setValue(5000.0); self.tref_us.setSuffix(" µs")
         self.pulse_us   = QDoubleSpinBox(); self.pulse_us  .setRange(0.01, 1000.0); self.pulse_us.setValue(25); self.pulse_us.setSuffix(" µs")
         self.loops= QSpinBox(); self.loops.setRange(1,1000); self.loops.setValue(3)
-        for label, w in [("Start f", self.f_start),("Stop f", self.f_stop),("f points", self.points),("MW power", self.dbm),("Tref", self.tref_us),("Laser/MW pulse", self.pulse_us),("Loops",self.loops)]:
+        self.dark_reset = QCheckBox("between points")
+        self.buffer_samples = QSpinBox(); self.buffer_samples.setRange(0, 16383); self.buffer_samples.setValue(0); self.buffer_samples.setSpecialValueText("off (single read)")
+        self.mw_trigger = QComboBox(); self.mw_trigger.addItems(["software", "external"]) #external needs PB CH_MW_TRIG wired to the SynthHD trigger input
+        self.sampling = QComboBox(); self.sampling.addItems(["uniform", "adaptive"]) #adaptive: f points is the budget, spent around the resonances
+        self.coarse_points = QSpinBox(); self.coarse_points.setRange(0, 2001); self.coarse_points.setValue(0); self.coarse_points.setSpecialValueText("auto (1/3 of points)")
+        self.live_fit = QCheckBox("refit while measuring")
+        self.stop_rtol = QDoubleSpinBox(); self.stop_rtol.setRange(0.0, 50.0); self.stop_rtol.setValue(0.0); self.stop_rtol.setSuffix(" %"); self.stop_rtol.setSpecialValueText("off") #stop once the key fit parameter is known to this relative error
+        for label, w in [("Start f", self.f_start),("Stop f", self.f_stop),("f points", self.points),("MW power", self.dbm),("Tref", self.tref_us),("Laser/MW pulse", self.pulse_us),("Loops",self.loops),("Dark reset",self.dark_reset),("Buffer samples",self.buffer_samples),("MW stepping",self.mw_trigger),("Sampling",self.sampling),("Coarse points",self.coarse_points),("Live fit",self.live_fit),("Stop at error",self.stop_rtol)]:
             f.addRow(QLabel(label+":"), w)
     def get_params(self):
-        return dict(f_start_MHz=self.f_start.value(), f_stop_MHz=self.f_stop.value(), points=int(self.points.value()), dbm=self.dbm.value(), tref_us=self.tref_us.value(), pulse_us=self.pulse_us.value(), loops=int(self.loops.value()))
+        return dict(f_start_MHz=self.f_start.value(), f_stop_MHz=self.f_stop.value(), points=int(self.points.value()), dbm=self.dbm.value(), tref_us=self.tref_us.value(), pulse_us=self.pulse_us.value(), loops=int(self.loops.value()), dark_reset=self.dark_reset.isChecked(), buffer_samples=int(self.buffer_samples.value()), mw_trigger=self.mw_trigger.currentText(), sampling=self.sampling.currentText(), coarse_points=int(self.coarse_points.value()), live_fit=self.live_fit.isChecked(), stop_rtol=self.stop_rtol.value()/100)
 
 class RabiForm(QWidget):
     def __init__(self):
@@ -236,10 +311,15 @@ class RabiForm(QWidget):
         self.laser_pulse_us = QDoubleSpinBox(); self.laser_pulse_us.setRange(0.1,50); self.laser_pulse_us.setValue(10); self.laser_pulse_us.setSuffix(" µs")
         self.points  = QSpinBox(); self.points .setRange(1, 2001);   self.points .setValue(31)
         self.loops= QSpinBox(); self.loops.setRange(1,1000); self.loops.setValue(3)
-        for label,w in [("MW freq", self.mw_freq), ("MW power", self.dbm), ("N", self.N), ("Max MW τ", self.max_mw_tau_us), ("Padding", self.min_pad_tau_us), ("Laser pulse",self.laser_pulse_us),("Points",self.points),("Loops",self.loops)]:
+        self.dark_reset = QCheckBox("between points")
+        self.buffer_samples = QSpinBox(); self.buffer_samples.setRange(0, 16383); self.buffer_samples.setValue(0); self.buffer_samples.setSpecialValueText("off (single read)")
+        self.sampling = QComboBox(); self.sampling.addItems(["uniform", "log", "adaptive"]) #adaptive: refits after every point to choose the next τ
+        self.live_fit = QCheckBox("refit while measuring")
+        self.stop_rtol = QDoubleSpinBox(); self.stop_rtol.setRange(0.0, 50.0); self.stop_rtol.setValue(0.0); self.stop_rtol.setSuffix(" %"); self.stop_rtol.setSpecialValueText("off") #stop once the key fit parameter is known to this relative error
+        for label,w in [("MW freq", self.mw_freq), ("MW power", self.dbm), ("N", self.N), ("Max MW τ", self.max_mw_tau_us), ("Padding", self.min_pad_tau_us), ("Laser pulse",self.laser_pulse_us),("Points",self.points),("Loops",self.loops),("Dark reset",self.dark_reset),("Buffer samples",self.buffer_samples),("Sampling",self.sampling),("Live fit",self.live_fit),("Stop at error",self.stop_rtol)]:
             f.addRow(QLabel(label+":"), w)
     def get_params(self):
-        return dict(mw_freq_MHz=self.mw_freq.value(), dBm=self.dbm.value(),N=int(self.N.value()),max_mw_tau_us=self.max_mw_tau_us.value(), min_padding_us=self.min_pad_tau_us.value(), las_pulse_us=self.laser_pulse_us.value(), points=int(self.points.value()),loops=int(self.loops.value()))
+        return dict(mw_freq_MHz=self.mw_freq.value(), dBm=self.dbm.value(),N=int(self.N.value()),max_mw_tau_us=self.max_mw_tau_us.value(), min_padding_us=self.min_pad_tau_us.value(), las_pulse_us=self.laser_pulse_us.value(), points=int(self.points.value()),loops=int(self.loops.value()),dark_reset=self.dark_reset.isChecked(), buffer_samples=int(self.buffer_samples.value()), sampling=self.sampling.currentText(), live_fit=self.live_fit.isChecked(), stop_rtol=self.stop_rtol.value()/100)
 
 class HahnForm(QWidget):
     def __init__(self):
@@ -254,6 +334,11 @@ class HahnForm(QWidget):
         self.max_tau_us = QDoubleSpinBox(); self.max_tau_us.setRange(0.01,200); self.max_tau_us.setValue(50.0); self.max_tau_us.setSuffix(" µs")
         self.points  = QSpinBox(); self.points .setRange(1, 2001);   self.points .setValue(31)
         self.loops= QSpinBox(); self.loops.setRange(1,1000); self.loops.setValue(3)
+        self.dark_reset = QCheckBox("between points")
+        self.buffer_samples = QSpinBox(); self.buffer_samples.setRange(0, 16383); self.buffer_samples.setValue(0); self.buffer_samples.setSpecialValueText("off (single read)")
+        self.sampling = QComboBox(); self.sampling.addItems(["uniform", "log", "adaptive"]) #adaptive: refits after every point to choose the next τ
+        self.live_fit = QCheckBox("refit while measuring")
+        self.stop_rtol = QDoubleSpinBox(); self.stop_rtol.setRange(0.0, 50.0); self.stop_rtol.setValue(0.0); self.stop_rtol.setSuffix(" %"); self.stop_rtol.setSpecialValueText("off") #stop once the key fit parameter is known to this relative error
         for label, w in [("MW freq", self.mw_freq),
                          ("MW power", self.dbm),
                          ("N", self.N),
@@ -262,7 +347,12 @@ class HahnForm(QWidget):
                          ("π pulse", self.pi_ns),
                          ("Max τ", self.max_tau_us),
                          ("Points", self.points),
-                         ("Loops",self.loops)]:
+                         ("Loops",self.loops),
+                         ("Dark reset",self.dark_reset),
+                         ("Buffer samples",self.buffer_samples),
+                         ("Sampling",self.sampling),
+                         ("Live fit",self.live_fit),
+                         ("Stop at error",self.stop_rtol)]:
             f.addRow(QLabel(label+":"),w)
 
     def get_params(self):
@@ -274,7 +364,12 @@ class HahnForm(QWidget):
                     pi_ns=self.pi_ns.value(),
                     max_tau_us=self.max_tau_us.value(),
                     points=int(self.points.value()),
-                    loops=int(self.loops.value()))
+                    loops=int(self.loops.value()),
+                    dark_reset=self.dark_reset.isChecked(),
+                    buffer_samples=int(self.buffer_samples.value()),
+                    sampling=self.sampling.currentText(),
+                    live_fit=self.live_fit.isChecked(),
+                    stop_rtol=self.stop_rtol.value()/100)
 
 class RamseyForm(QWidget):
     def __init__(self):
@@ -289,6 +384,11 @@ class RamseyForm(QWidget):
         self.max_tau_us = QDoubleSpinBox(); self.max_tau_us.setRange(0.01,200); self.max_tau_us.setValue(50.0); self.max_tau_us.setSuffix(" µs")
         self.points  = QSpinBox(); self.points .setRange(1, 2001);   self.points .setValue(31)
         self.loops= QSpinBox(); self.loops.setRange(1,1000); self.loops.setValue(3)
+        self.dark_reset = QCheckBox("between points")
+        self.buffer_samples = QSpinBox(); self.buffer_samples.setRange(0, 16383); self.buffer_samples.setValue(0); self.buffer_samples.setSpecialValueText("off (single read)")
+        self.sampling = QComboBox(); self.sampling.addItems(["uniform", "log", "adaptive"]) #adaptive: refits after every point to choose the next τ
+        self.live_fit = QCheckBox("refit while measuring")
+        self.stop_rtol = QDoubleSpinBox(); self.stop_rtol.setRange(0.0, 50.0); self.stop_rtol.setValue(0.0); self.stop_rtol.setSuffix(" %"); self.stop_rtol.setSpecialValueText("off") #stop once the key fit parameter is known to this relative error
         for label, w in [("MW freq", self.mw_freq),
                          ("MW power", self.dbm),
                          ("N", self.N),
@@ -297,7 +397,12 @@ class RamseyForm(QWidget):
                          ("π pulse", self.pi_ns),
                          ("Max τ", self.max_tau_us),
                          ("Points", self.points),
-                         ("Loops",self.loops)]:
+                         ("Loops",self.loops),
+                         ("Dark reset",self.dark_reset),
+                         ("Buffer samples",self.buffer_samples),
+                         ("Sampling",self.sampling),
+                         ("Live fit",self.live_fit),
+                         ("Stop at error",self.stop_rtol)]:
             f.addRow(QLabel(label+":"),w)
 
     def get_params(self):
@@ -309,7 +414,12 @@ class RamseyForm(QWidget):
                     pi_ns=self.pi_ns.value(),
                     max_tau_us=self.max_tau_us.value(),
                     points=int(self.points.value()),
-                    loops=int(self.loops.value()))
+                    loops=int(self.loops.value()),
+                    dark_reset=self.dark_reset.isChecked(),
+                    buffer_samples=int(self.buffer_samples.value()),
+                    sampling=self.sampling.currentText(),
+                    live_fit=self.live_fit.isChecked(),
+                    stop_rtol=self.stop_rtol.value()/100)
 
 class NVGui(QMainWindow):
     def __init__(self):
@@ -317,17 +427,33 @@ class NVGui(QMainWindow):
         self.setWindowTitle("NV Center Experiment Controller")
         self.setGeometry(100, 100, 1100, 800)
 
+        # Instruments are opened on the first run and kept open until the window closes
+        self.session = HardwareSession()
+
         tabs = QTabWidget()
-        tabs.addTab(ExperimentTab("T1", run_t1, T1Form()), "T1")
-        tabs.addTab(ExperimentTab("Pulsed ODMR", run_podmr, PulsedODMRForm()), "Pulsed ODMR")
-        tabs.addTab(ExperimentTab("Rabi", run_rabi, RabiForm()), "Rabi")
-        tabs.addTab(ExperimentTab("Ramsey", run_ramsey, RamseyForm()), "Ramsey")
-        tabs.addTab(ExperimentTab("Hahn", run_hahn, HahnForm()), "Hahn")
+        tabs.addTab(ExperimentTab("T1", run_t1, T1Form(), self.session), "T1")
+        tabs.addTab(ExperimentTab("Pulsed ODMR", run_podmr, PulsedODMRForm(), self.session), "Pulsed ODMR")
+        tabs.addTab(ExperimentTab("Rabi", run_rabi, RabiForm(), self.session), "Rabi")
+        tabs.addTab(ExperimentTab("Ramsey", run_ramsey, RamseyForm(), self.session), "Ramsey")
+        tabs.addTab(ExperimentTab("Hahn", run_hahn, HahnForm(), self.session), "Hahn")
         # tabs.addTab(ExperimentTab("CPMG", run_CPMG, CPMGForm()), "CPMG")
 
         self.last_result = None
+        self.tabs = tabs
         self.setCentralWidget(tabs)
 
+    def closeEvent(self, event):
+        # let running experiments stop cleanly before the instruments are released; all
+        # of them first, so a tab still waiting for the hardware lock gives up too
+        workers = [self.tabs.widget(i).worker for i in range(self.tabs.count())]
+        workers = [w for w in workers if w is not None and w.isRunning()]
+        for w in workers:
+            w.requestInterruption()
+        for w in workers:
+            w.wait()
+        self.session.close()
+        super().closeEvent(event)
+
 
 if __name__ == "__main__":
     app = QApplication(sys.argv)
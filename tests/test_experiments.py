@@ -0,0 +1,35 @@
+# tests/test_experiments.py
+"""Every experiment end to end on the simulated bench."""
+import numpy as np
+import pytest
+
+from hardware import backend
+from experiments import registry
+from experiments.cancel import CancelToken
+from experiments.plot_sink import NullSink
+
+
+@pytest.fixture
+def sim():
+    backend.use_backend("sim")
+    yield
+    backend.use_backend("hardware")
+
+
+def run(name, **params):
+    return registry.get_runner(name)(NullSink(), lambda **kw: None, cancel=CancelToken(), **params)
+
+
+@pytest.mark.parametrize("name", registry.names())
+def test_run_on_the_simulator(sim, name):
+    result = run(name, points=4, loops=1)
+    x, y = (np.asarray(v) for v in list(result.values())[:2])
+    assert len(x) == 4 and np.all(np.isfinite(y))
+
+
+def test_hardware_stepped_odmr_matches_software_stepping(sim):
+    params = dict(f_start_MHz=2860, f_stop_MHz=2884, dbm=0, points=13, loops=1)
+    soft, ext = (run("podmr", mw_trigger=mode, **params) for mode in ("software", "external"))
+    assert soft["freq_Hz"] == ext["freq_Hz"]
+    assert np.argmin(ext["R_V"]) == np.argmin(soft["R_V"])
+    assert np.allclose(ext["R_V"], soft["R_V"], rtol=5e-3)
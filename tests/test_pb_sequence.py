@@ -0,0 +1,137 @@
+# tests/test_pb_sequence.py
+"""PulseSequence, its compiled programs and the checks run before a sweep."""
+import numpy as np
+import pytest
+
+from hardware.pb_sequence import (PulseSequence, ProgramCache, SweepPrograms, check_sequences, unrolled_length,
+                                  CONTINUE, LOOP, END_LOOP, BRANCH, CH_REF, CH_LASER, CH_MW_I, CH_MW_TRIG)
+from experiments import rabi_experiment, ramsey_experiment, pulsed_odmr, t1_experiment
+
+
+def square(t_ns):
+    return PulseSequence().block([(CH_REF | CH_LASER, t_ns), (0, t_ns)])
+
+
+def play(prog, periods=2):
+    """[(flags, length_ns), ...] the board outputs for `periods` passes, consecutive equal flags merged."""
+    out, pc, loops, passes = [], 0, {}, 0
+    while passes < periods:
+        flags, op, data, t = prog[pc]
+        if out and out[-1][0] == flags:
+            out[-1] = (flags, out[-1][1] + t)
+        else:
+            out.append((flags, t))
+        if op == LOOP:
+            loops.setdefault(pc, data)
+            pc += 1
+        elif op == END_LOOP:
+            loops[data] -= 1
+            if loops[data] > 0:
+                pc = data
+            else:
+                del loops[data]
+                pc += 1
+        elif op == BRANCH:
+            passes += 1
+            pc = data
+        else:
+            assert op == CONTINUE
+            pc += 1
+    return out
+
+
+def unrolled(seq, periods=2):
+    """The same output written out from the blocks (the prologue plays once, before the first period)."""
+    tick_ns = 1000.0 / seq.clock_mhz
+    flat = [(flags, t * tick_ns) for flags, t in seq.prologue]
+    for _ in range(periods):
+        flat += [(flags, t * tick_ns) for body, rep in seq.blocks for _ in range(rep) for flags, t in body]
+    out = []
+    for flags, t in flat:
+        if out and out[-1][0] == flags:
+            out[-1] = (flags, out[-1][1] + t)
+        else:
+            out.append((flags, t))
+    return out
+
+
+# --- compiled programs ---
+
+@pytest.mark.parametrize("N", [1, 2, 250])
+@pytest.mark.parametrize("prologue", [False, True])
+def test_program_plays_the_unrolled_sequence(N, prologue):
+    seqs = [rabi_experiment.pulse_sequence(10.0, 1.23, 8.77, N, 50),
+            ramsey_experiment.pulse_sequence(10.0, 50.0, 100.0, 0.4, N)]
+    for seq in seqs:
+        if prologue:
+            seq.once([(CH_MW_TRIG, 100.0), (0, 1000.0)])
+        assert play(seq._compile()) == unrolled(seq)
+
+
+def test_repeated_blocks_become_hardware_loops():
+    seq = rabi_experiment.pulse_sequence(10.0, 1.23, 8.77, 250, 50)
+    assert len(seq._compile()) == 8 and unrolled_length(seq.blocks) == 1500
+
+
+def test_odmr_step_program_plays_the_trigger_once():
+    seq = pulsed_odmr.step_sequence(250.0, 5)
+    out = play(seq._compile(), periods=3)
+    assert out == unrolled(seq, periods=3)
+    assert sum(flags == CH_MW_TRIG for flags, _ in out) == 1
+
+
+# --- durations and the program cache ---
+
+def test_durations_round_half_up_to_ticks():
+    seq = PulseSequence()
+    assert [seq.ticks(ns) for ns in (5, 15, 25, 0, 1234)] == [1, 2, 3, 0, 123]
+    with pytest.raises(ValueError, match="shorter than half"):
+        seq.ticks(3)
+    with pytest.raises(ValueError, match="Negative"):
+        seq.ticks(-10)
+
+
+def test_cache_file_is_written_once_per_sweep(tmp_path, monkeypatch):
+    path = str(tmp_path / "programs.json")
+    cache = ProgramCache(path=path)
+    writes = []
+    save = ProgramCache.save
+    monkeypatch.setattr(ProgramCache, "save", lambda self: (writes.append(1), save(self)))
+    values = [1000.0 + 10 * k for k in range(50)]
+    SweepPrograms(square, values, "t", " ns", cache=cache)
+    assert len(writes) == 1 and cache.misses == 50
+
+    # a later run (new process) compiles nothing and writes nothing
+    again = ProgramCache(path=path)
+    SweepPrograms(square, values, "t", " ns", cache=again)
+    assert again.hits == 50 and again.misses == 0 and len(writes) == 1
+
+
+# --- checks before the run ---
+
+def test_rabi_reference_is_balanced():
+    for N in (1, 2, 250):
+        problems, duty = check_sequences([rabi_experiment.pulse_sequence(10.0, t, 10.0 - t, N, 50)
+                                          for t in (0.05, 2.0, 5.0)])
+        assert problems == [[], [], []]
+        assert np.allclose(duty, 0.5)
+
+
+def test_t1_delays_longer_than_half_the_period_are_rejected():
+    # Tref = 1 ms: SECOND + τ + READ must fit in 500 µs
+    with pytest.raises(ValueError, match=r"2 of 3 sweep points cannot be played"):
+        SweepPrograms(lambda tau: t1_experiment._three_pulse_sequence(tau, 1.0, 20.0, 20.0, 20.0),
+                      [100.0, 600.0, 900.0], "τ", " µs")
+
+
+def test_short_instruction_and_missing_reference():
+    seq = PulseSequence().block([(CH_REF | CH_LASER, 30.0), (CH_REF, 970.0), (0, 1000.0)])
+    flat = PulseSequence().block([(CH_LASER, 1000.0), (0, 1000.0)])
+    problems, _ = check_sequences([seq, flat])
+    assert problems[0] == ["30 ns instruction, the board needs at least 50 ns"]
+    assert problems[1] == ["REF never toggles"]
+
+
+def test_off_half_duty_cycle_is_only_a_note():
+    programs = SweepPrograms(lambda t: PulseSequence().block([(CH_REF | CH_MW_I, 600.0), (0, 400.0)]), [1.0])
+    assert any("REF high for 60.00%" in note for note in programs.notes)
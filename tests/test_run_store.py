@@ -0,0 +1,53 @@
+# tests/test_run_store.py
+"""Run files: streaming, reading back while they are written, and resuming."""
+import numpy as np
+import pytest
+
+from experiments.run_store import RunStore, load_run, h5py, FLUSH_POINTS
+from experiments.sweep_data import SweepData
+
+FORMATS = ["npz"] + (["h5"] if h5py is not None else [])
+
+
+def point(k):
+    return dict(X=0.1 * k, Y=-0.01 * k, R=0.1 * k, THETA=-5.0, R_err=np.nan)
+
+
+@pytest.mark.parametrize("fmt", FORMATS)
+def test_points_are_on_disk_before_the_run_ends(tmp_path, fmt):
+    params = dict(points=20, loops=2, sampling="uniform")
+    store = RunStore("T1", params, run_dir=str(tmp_path), fmt=fmt)
+    for k in range(FLUSH_POINTS + 4):
+        store.append(k // 20, k % 20, 10.0 * (k % 20), point(k))
+    # a crash now loses at most the unflushed tail
+    meta, rows = load_run(store.path)
+    assert meta["params"] == params and "end" not in meta
+    assert len(rows["x"]) == FLUSH_POINTS
+
+    store.close("complete")
+    meta, rows = load_run(store.path)
+    assert meta["end"]["status"] == "complete" and meta["end"]["n_points"] == FLUSH_POINTS + 4
+    assert np.allclose(rows["R"], [0.1 * k for k in range(FLUSH_POINTS + 4)])
+    assert np.array_equal(rows["loop"], [k // 20 for k in range(FLUSH_POINTS + 4)])
+
+
+@pytest.mark.parametrize("fmt", FORMATS)
+def test_resume_restores_the_points_taken(tmp_path, fmt):
+    params = dict(points=3, loops=2, sampling="uniform")
+    store = RunStore("Rabi", params, run_dir=str(tmp_path), fmt=fmt)
+    for k, (loop, i) in enumerate([(0, 0), (0, 1), (0, 2), (1, 0)]):
+        store.append(loop, i, float(i), point(k))
+    store.close("interrupted")
+    assert load_run(store.path)[0]["end"]["status"] == "interrupted"
+
+    with pytest.raises(ValueError, match="Parameters differ"):
+        RunStore.resume(store.path, dict(params, points=5))
+    resumed = RunStore.resume(store.path, params)
+    data = SweepData([0.0, 1.0, 2.0], 2)
+    assert resumed.restore_into(data) == {(0, 0), (0, 1), (0, 2), (1, 0)}
+    assert np.isclose(data.mean("R")[1], 0.1)
+    resumed.append(1, 1, 1.0, point(0))
+    resumed.close("complete")
+    meta, rows = load_run(store.path)
+    assert meta["end"]["status"] == "complete"
+    assert len(rows["x"]) == 5
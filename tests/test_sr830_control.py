@@ -0,0 +1,26 @@
+# tests/test_sr830_control.py
+"""Lock-in settling on the simulated SR830."""
+import time
+
+import pytest
+
+from hardware.simulator import SimLab, SimSR830
+from hardware.sr830_control import sr830_settle_snap, SETTLE_RTOL
+
+
+def stepped_lockin(slope, before, after):
+    """Simulated SR830 (1 ms time constant) whose input has just jumped from `before` to `after` volts."""
+    lab = SimLab()
+    lab.model.phase_deg = 0.0
+    lab.oflt, lab.ofsl = 4, slope
+    with lab.lock:
+        lab._from, lab._target, lab._t0 = before, after, time.monotonic()
+    return SimSR830(lab, "GPIB0::1::INSTR"), lab.tau_s()
+
+
+@pytest.mark.parametrize("slope", [0, 1, 2, 3])
+@pytest.mark.parametrize("after", [1.02, 1.05, 0.97, 0.0])
+def test_settled_reading_is_within_rtol_of_the_step(slope, after):
+    li, tau_s = stepped_lockin(slope, 1.0, after)
+    R = sr830_settle_snap(li, tau_s, slope)["R"]
+    assert abs(R - abs(after)) <= 1.5 * SETTLE_RTOL * abs(after - 1.0) + 1e-5